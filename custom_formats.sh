@@ -3,8 +3,6 @@ export PYTHONPATH=$PYTHONPATH:$(pwd)/src
 out_path=data
 
 echo "##############################################################"
-echo "# Jasperize"
+echo "# Jasperize / Shardify"
 echo "##############################################################"
-wave_path=$out_path/full_waverized
-jasper_path=$out_path/full_jasperized
-python scripts/jasperize.py $wave_path $jasper_path
+python scripts/build.py custom-formats $out_path
@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import datetime
+import subprocess
+import click
+
+import audiomate
+
+import instrument
+import synthetic
+
+
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SRC_FOLDER = os.path.join(os.path.dirname(SCRIPT_FOLDER), 'src')
+
+RESULT_VERSION = 1
+DEFAULT_SCALES = [1000, 10000, 100000]
+
+# Differences below this are not considered as regression
+MIN_TIME_DIFF = 1.0
+MIN_RSS_DIFF = 50.0
+
+
+def script(name):
+    return os.path.join(SCRIPT_FOLDER, name)
+
+
+def create_stages(scale_path, num_utterances, seed, num_workers):
+    """
+    Return the benchmarked stages as tuples (name, command, required stages).
+    The commands work on the synthetic corpora in ``scale_path``.
+    """
+    dl_path = os.path.join(scale_path, 'download')
+    full_path = os.path.join(scale_path, 'full')
+    norm_path = os.path.join(scale_path, 'full_normalized')
+    wave_path = os.path.join(scale_path, 'full_waverized')
+    workers = ['--num-workers', str(num_workers)]
+
+    return [
+        ('generate', [
+            script('synthesize.py'), dl_path,
+            '--num-utterances', str(num_utterances), '--seed', str(seed)
+        ], []),
+        ('load', [
+            script('benchmark.py'), 'load', dl_path
+        ], ['generate']),
+        ('validate', [
+            script('validate.py'), dl_path, os.path.join(scale_path, 'validation'),
+            '--corpus-format', 'default'
+        ] + workers, ['generate']),
+        ('merge_and_subset', [
+            script('merge_and_subset.py'), dl_path, full_path,
+            '--corpus-format', 'default'
+        ], ['generate']),
+        ('equivalence', [
+            script('equivalence.py'), 'generate', scale_path, '--content'
+        ] + workers, ['merge_and_subset']),
+        ('normalize_text', [
+            script('normalize_text.py'), full_path, norm_path,
+            '--cache-path', os.path.join(scale_path, 'normalization_cache.sqlite')
+        ] + workers, ['merge_and_subset']),
+        # Uses the merged corpus, so it does not depend on the normalization
+        ('waverize', [
+            script('waverize.py'), full_path, wave_path
+        ] + workers, ['merge_and_subset']),
+        ('jasperize', [
+            script('jasperize.py'), wave_path, os.path.join(scale_path, 'full_jasperized')
+        ] + workers, ['waverize']),
+    ]
+
+
+STAGE_NAMES = [x[0] for x in create_stages('', 0, 0, 1)]
+
+
+def run_stage(command, log_path, env):
+    """
+    Run the command of a stage and measure it.
+    The resource usage is the one of the stage process
+    including all its (terminated) child processes.
+
+    Returns:
+        dict: Return code, wall time (seconds), cpu time (user + system, seconds)
+              and the peak RSS (MB) of the largest process.
+    """
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        p = subprocess.Popen(
+            [sys.executable] + command,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env=env
+        )
+        _, status, usage = os.wait4(p.pid, 0)
+        wall_time = time.perf_counter() - start
+
+    # The process was reaped by wait4 already
+    if os.WIFEXITED(status):
+        p.returncode = os.WEXITSTATUS(status)
+    else:
+        p.returncode = -os.WTERMSIG(status)
+
+    return {
+        'returncode': p.returncode,
+        'wall_time': wall_time,
+        'cpu_time': usage.ru_utime + usage.ru_stime,
+        'max_rss_mb': usage.ru_maxrss / 1024,
+    }
+
+
+def read_steps(events_path, offset):
+    """
+    Return the step events (see ``instrument``) written to the events file
+    after ``offset`` and the new size of the file.
+    """
+    if not os.path.isfile(events_path):
+        return [], offset
+
+    with open(events_path, 'r') as f:
+        f.seek(offset)
+        lines = f.readlines()
+        offset = f.tell()
+
+    steps = []
+
+    for line in lines:
+        event = json.loads(line)
+
+        if event['event'] == 'step':
+            steps.append({
+                key: value for key, value in event.items()
+                if key not in ['event', 'pid', 'time']
+            })
+
+    return steps, offset
+
+
+def log_tail(path, num_lines=10):
+    with open(path, 'r', errors='replace') as f:
+        return ''.join(f.readlines()[-num_lines:])
+
+
+def benchmark_scale(scale_path, num_utterances, stages, seed, num_workers, env):
+    """
+    Run the selected stages (and the stages they require)
+    on synthetic corpora with ``num_utterances`` utterances.
+    """
+    all_stages = create_stages(scale_path, num_utterances, seed, num_workers)
+    required = set(stages)
+
+    # Add requirements, stages are ordered by their dependencies
+    for name, _, requires in reversed(all_stages):
+        if name in required:
+            required.update(requires)
+
+    results = {}
+    log_folder = os.path.join(scale_path, 'logs')
+    os.makedirs(log_folder)
+
+    # Events of the sub-steps within the stages
+    events_path = os.path.join(log_folder, 'events.jsonl')
+    events_offset = 0
+    env = dict(env)
+    env[instrument.EVENTS_ENV] = events_path
+
+    for name, command, requires in all_stages:
+        if name not in required:
+            continue
+
+        failed = [x for x in requires if results[x]['status'] != 'ok']
+
+        if len(failed) > 0:
+            print(' - {}: skipped ({} failed)'.format(name, ', '.join(failed)))
+            results[name] = {'status': 'skipped'}
+            continue
+
+        log_path = os.path.join(log_folder, '{}.log'.format(name))
+        result = run_stage(command, log_path, env)
+        result['status'] = 'ok' if result['returncode'] == 0 else 'failed'
+        result['utterances_per_second'] = num_utterances / max(result['wall_time'], 1e-9)
+        result['steps'], events_offset = read_steps(events_path, events_offset)
+
+        if result['status'] != 'ok':
+            result['log_tail'] = log_tail(log_path)
+
+        print(' - {}: {} ({:.2f}s wall, {:.2f}s cpu, {:.1f} MB)'.format(
+            name, result['status'], result['wall_time'],
+            result['cpu_time'], result['max_rss_mb']
+        ))
+
+        results[name] = result
+
+    return results
+
+
+def find_regressions(baseline, results, tolerance):
+    """
+    Compare the results with a baseline (both as stored by ``run``).
+    A stage regressed, if its wall time or peak RSS grew by more than
+    ``tolerance`` (relative) and more than the min. difference.
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+
+    for scale, stages in results['scales'].items():
+        base_stages = baseline['scales'].get(scale, {})
+
+        for name, result in stages.items():
+            base = base_stages.get(name)
+
+            if base is None or base['status'] != 'ok':
+                continue
+
+            if result['status'] != 'ok':
+                regressions.append('{} @ {}: {}'.format(name, scale, result['status']))
+                continue
+
+            for key, min_diff in [('wall_time', MIN_TIME_DIFF), ('max_rss_mb', MIN_RSS_DIFF)]:
+                diff = result[key] - base[key]
+
+                if diff > min_diff and diff > base[key] * tolerance:
+                    regressions.append('{} @ {}: {} {:.2f} -> {:.2f}'.format(
+                        name, scale, key, base[key], result[key]
+                    ))
+
+    return regressions
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument('work_folder', type=click.Path())
+@click.argument('result_path', type=click.Path())
+@click.option('--scale', '-s', 'scales', multiple=True, type=int,
+              help='Number of utterances of the synthetic corpora '
+                   '(default: {}).'.format(', '.join(str(x) for x in DEFAULT_SCALES)))
+@click.option('--stage', 'stages', multiple=True, type=click.Choice(STAGE_NAMES),
+              help='Only run the given stages (and the stages they require).')
+@click.option('--seed', default=0, type=int)
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--baseline', default=None, type=click.Path(exists=True),
+              help='Results of a previous run. Fails if a stage got slower '
+                   'or needs more memory than allowed by --tolerance.')
+@click.option('--tolerance', default=0.25, type=float,
+              help='Allowed relative increase of wall time and peak RSS.')
+@click.option('--keep', is_flag=True, help='Keep the generated data.')
+def run(work_folder, result_path, scales, stages, seed, num_workers, baseline,
+        tolerance, keep):
+    """
+    Run the stages of the pipeline on synthetic corpora of different sizes
+    and store wall time, cpu time and peak memory of every stage as json.
+    """
+    if len(scales) <= 0:
+        scales = DEFAULT_SCALES
+
+    if len(stages) <= 0:
+        stages = STAGE_NAMES
+
+    env = dict(os.environ)
+    python_path = [x for x in [env.get('PYTHONPATH'), SRC_FOLDER] if x]
+    env['PYTHONPATH'] = os.pathsep.join(python_path)
+
+    results = {
+        'version': RESULT_VERSION,
+        'created': datetime.datetime.now().isoformat(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'num_workers': num_workers,
+        'seed': seed,
+        'scales': {},
+    }
+
+    for num_utterances in scales:
+        print('Benchmark with {} utterances'.format(num_utterances))
+        scale_path = os.path.join(work_folder, str(num_utterances))
+
+        if os.path.exists(scale_path):
+            shutil.rmtree(scale_path)
+
+        results['scales'][str(num_utterances)] = benchmark_scale(
+            scale_path, num_utterances, stages, seed, num_workers, env
+        )
+
+        if not keep:
+            shutil.rmtree(scale_path)
+
+    with open(result_path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        with open(baseline, 'r') as f:
+            baseline_results = json.load(f)
+
+        regressions = find_regressions(baseline_results, results, tolerance)
+
+        if len(regressions) > 0:
+            raise click.ClickException('Regressions:\n{}'.format('\n'.join(regressions)))
+
+        print('No regressions compared to {}'.format(baseline))
+
+
+@cli.command()
+@click.argument('download_folder', type=click.Path(exists=True))
+def load(download_folder):
+    """
+    Load the synthetic corpora (stage ``load`` of the benchmark).
+    """
+    instrument.start('benchmark/load')
+
+    for name in sorted(synthetic.CORPUS_SHARES.keys()):
+        with instrument.step(name) as step:
+            corpus = audiomate.Corpus.load(os.path.join(download_folder, name))
+            step.items = corpus.num_utterances
+
+        print('{}: {} utterances'.format(name, corpus.num_utterances))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,212 @@
+import os
+import sys
+import click
+
+import instrument
+import pipeline
+
+
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SRC_FOLDER = os.path.join(os.path.dirname(SCRIPT_FOLDER), 'src')
+
+CORPORA = ['voxforge', 'common_voice', 'mailabs', 'swc', 'tuda']
+
+
+def script(name):
+    return os.path.join(SCRIPT_FOLDER, name)
+
+
+def workers_per_stage(jobs):
+    """ Number of processes for a stage, so concurrent stages share the cpus. """
+    return max(1, (os.cpu_count() or 1) // max(1, jobs))
+
+
+def download_stages(out_path):
+    dl_path = os.path.join(out_path, 'download')
+
+    return [
+        pipeline.Stage(
+            'download',
+            [script('download.py'), dl_path],
+            outputs=[os.path.join(dl_path, name) for name in CORPORA],
+            clean=False
+        ),
+    ]
+
+
+def merge_stages(out_path):
+    dl_path = os.path.join(out_path, 'download')
+    full_path = os.path.join(out_path, 'full')
+
+    return [
+        pipeline.Stage(
+            'merge_and_subset',
+            [script('merge_and_subset.py'), dl_path, full_path],
+            inputs=[os.path.join(dl_path, name) for name in CORPORA],
+            outputs=[full_path]
+        ),
+    ]
+
+
+def normalize_stages(out_path, after=()):
+    full_path = os.path.join(out_path, 'full')
+    norm_path = os.path.join(out_path, 'full_normalized')
+    wave_path = os.path.join(out_path, 'full_waverized')
+
+    return [
+        pipeline.Stage(
+            'normalize_text',
+            [script('normalize_text.py'), full_path, norm_path],
+            inputs=[full_path],
+            outputs=[norm_path],
+            after=after
+        ),
+        pipeline.Stage(
+            'waverize',
+            [script('waverize.py'), norm_path, wave_path],
+            inputs=[norm_path],
+            outputs=[wave_path],
+            # Already converted utterances are reused by waverize.py
+            clean=False
+        ),
+    ]
+
+
+def create_stages(out_path, jobs):
+    dl_path = os.path.join(out_path, 'download')
+    val_path = os.path.join(out_path, 'validation')
+    full_path = os.path.join(out_path, 'full')
+
+    stages = download_stages(out_path)
+
+    stages.append(pipeline.Stage(
+        'infos_downloaded',
+        [script('corpus_infos.py'), 'downloaded', dl_path, os.path.join(dl_path, 'infos.json')],
+        inputs=[os.path.join(dl_path, name) for name in CORPORA],
+        outputs=[os.path.join(dl_path, 'infos.json')]
+    ))
+
+    for name in CORPORA:
+        stages.append(pipeline.Stage(
+            'validate_{}'.format(name),
+            [script('validate.py'), dl_path, val_path, '--corpus', name,
+             '--num-workers', str(workers_per_stage(jobs))],
+            inputs=[os.path.join(dl_path, name)],
+            outputs=[os.path.join(val_path, name)]
+        ))
+
+    stages.extend(merge_stages(out_path))
+
+    stages.append(pipeline.Stage(
+        'infos_full',
+        [script('corpus_infos.py'), 'full', full_path, os.path.join(out_path, 'corpus_stats.json')],
+        inputs=[full_path],
+        outputs=[os.path.join(out_path, 'corpus_stats.json')]
+    ))
+
+    stages.append(pipeline.Stage(
+        'leakage_full',
+        [script('check_leakage.py'), full_path, os.path.join(out_path, 'leakage.json')],
+        inputs=[full_path],
+        outputs=[os.path.join(out_path, 'leakage.json')]
+    ))
+
+    stages.append(pipeline.Stage(
+        'equivalence_generate',
+        [script('equivalence.py'), 'generate', out_path],
+        inputs=[full_path],
+        outputs=[os.path.join(out_path, 'state.json')]
+    ))
+
+    stages.extend(normalize_stages(out_path))
+    return stages
+
+
+def recreate_stages(out_path, jobs):
+    full_path = os.path.join(out_path, 'full')
+    marker_path = os.path.join(out_path, 'equivalence.ok')
+
+    stages = download_stages(out_path)
+    stages.extend(merge_stages(out_path))
+
+    stages.append(pipeline.Stage(
+        'equivalence_check',
+        [script('equivalence.py'), 'check', out_path, '--marker', marker_path],
+        inputs=[full_path, os.path.join(out_path, 'state.json')],
+        outputs=[marker_path]
+    ))
+
+    # A failed check stops the pipeline
+    stages.extend(normalize_stages(out_path, after=['equivalence_check']))
+    return stages
+
+
+def custom_format_stages(out_path, jobs):
+    wave_path = os.path.join(out_path, 'full_waverized')
+    jasper_path = os.path.join(out_path, 'full_jasperized')
+    shard_path = os.path.join(out_path, 'full_sharded')
+    feature_path = os.path.join(out_path, 'full_features')
+
+    return [
+        pipeline.Stage(
+            'jasperize',
+            [script('jasperize.py'), wave_path, jasper_path],
+            inputs=[wave_path],
+            outputs=[jasper_path],
+            # Converted files and links are reused by jasperize.py
+            clean=False
+        ),
+        pipeline.Stage(
+            'shardify',
+            [script('shardify.py'), wave_path, shard_path],
+            inputs=[wave_path],
+            outputs=[shard_path]
+        ),
+        pipeline.Stage(
+            'featurize',
+            [script('featurize.py'), wave_path, feature_path],
+            inputs=[wave_path],
+            outputs=[feature_path],
+            # Features of unchanged utterances are reused by featurize.py
+            clean=False
+        ),
+    ]
+
+
+PIPELINES = {
+    'create': create_stages,
+    'recreate': recreate_stages,
+    'custom-formats': custom_format_stages,
+}
+
+
+@click.command()
+@click.argument('name', type=click.Choice(sorted(PIPELINES.keys())))
+@click.argument('out_path', type=click.Path())
+@click.option('--jobs', '-j', default=2, type=int,
+              help='Max. number of stages to run at once.')
+@click.option('--target', '-t', multiple=True,
+              help='Only run the given stages and their dependencies.')
+@click.option('--force', '-f', multiple=True,
+              help='Rerun the given stages, even if up to date.')
+@click.option('--dry-run', is_flag=True)
+def run(name, out_path, jobs, target, force, dry_run):
+    os.makedirs(out_path, exist_ok=True)
+
+    env = dict(os.environ)
+    python_path = [x for x in [env.get('PYTHONPATH'), SRC_FOLDER] if x]
+    env['PYTHONPATH'] = os.pathsep.join(python_path)
+
+    # Timing/memory events of all stages
+    env.setdefault(instrument.EVENTS_ENV, os.path.join(os.path.abspath(out_path), 'events.jsonl'))
+
+    stages = PIPELINES[name](out_path, jobs)
+    p = pipeline.Pipeline(stages, out_path, num_workers=jobs, env=env, code_folders=[SRC_FOLDER])
+    ok = p.run(targets=target, force=force, dry_run=dry_run)
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
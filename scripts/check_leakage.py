@@ -0,0 +1,77 @@
+import json
+import click
+
+import audiomate
+
+import bitsets
+import columnar
+import instrument
+import leakage
+
+
+@click.command()
+@click.argument('corpus_folder', type=click.Path(exists=True))
+@click.argument('report_path', type=click.Path())
+@click.option('--threshold', default=0.8, type=float,
+              help='Min. similarity (estimated jaccard of word 3-grams) of near duplicates.')
+@click.option('--num-perm', default=64, type=int, help='Number of MinHash permutations.')
+@click.option('--bands', default=16, type=int, help='Number of LSH bands.')
+@click.option('--subview', default=None,
+              help='Write a subview with this name, containing the train utterances '
+                   'without the leaked ones.')
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the duplicate detection and store the stats at this path.')
+def run(corpus_folder, report_path, threshold, num_perm, bands, subview, profile_path):
+    """
+    Find transcripts, that occur (exactly or nearly) in train and in dev/test
+    (or in dev and test) of the merged corpus.
+    """
+    instrument.start('check_leakage', profile_path=profile_path)
+
+    print('Load corpus')
+
+    with instrument.step('load') as step:
+        cc = columnar.load(corpus_folder)
+        transcripts = cc.transcripts(audiomate.corpus.LL_WORD_TRANSCRIPT)
+        split_masks = {
+            name: cc.subview_bitset(name).mask
+            for name in ['train', 'dev', 'test']
+        }
+        step.items = cc.num_utterances
+
+    print('Find duplicates')
+    detector = leakage.LeakageDetector(
+        threshold=threshold,
+        num_perm=num_perm,
+        bands=bands
+    )
+
+    with instrument.step('detect', items=len(transcripts), hot=True):
+        report = detector.detect(cc.utt_ids, transcripts, split_masks)
+
+    leaked = report.pop('leaked')
+
+    train_leaked = leaked & split_masks['train']
+    report['num_leaked_utterances'] = {
+        name: int((leaked & mask).sum())
+        for name, mask in split_masks.items()
+    }
+
+    print('Exact duplicates: {}'.format(len(report['exact'])))
+    print('Near duplicates: {}'.format(len(report['near'])))
+    print('Leaked train utterances: {}'.format(int(train_leaked.sum())))
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if subview is not None:
+        print('Write subview {}'.format(subview))
+        bitset = bitsets.UtteranceBitset.from_mask(
+            cc.ordinals,
+            split_masks['train'] & ~leaked
+        )
+        columnar.add_subviews(corpus_folder, {subview: bitset})
+
+
+if __name__ == '__main__':
+    run()
@@ -4,6 +4,11 @@ import click
 import audiomate
 from audiomate.utils import jsonfile
 
+import columnar
+import durations
+import instrument
+import stats
+
 
 @click.group()
 def cli():
@@ -13,7 +18,11 @@ def cli():
 @cli.command()
 @click.argument('download_folder', type=click.Path(exists=True))
 @click.argument('output_path', type=click.Path())
-def downloaded(download_folder, output_path):
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the statistics of the corpora and store the stats at this path.')
+def downloaded(download_folder, output_path, profile_path):
+    instrument.start('corpus_infos/downloaded', profile_path=profile_path)
+
     corpora_names = [
         ('common_voice', 'common-voice'),
         ('mailabs', 'mailabs'),
@@ -30,8 +39,10 @@ def downloaded(download_folder, output_path):
 
     for name, reader_type in corpora_names:
         full_path = os.path.join(download_folder, name)
-        cinfo = get_corpus_info(name, full_path, reader_type)
-        infos[name] = cinfo
+
+        with instrument.step(name, hot=True):
+            cinfo = get_corpus_info(name, full_path, reader_type)
+            infos[name] = cinfo
 
     jsonfile.write_json_to_file(output_path, infos)
 
@@ -39,12 +50,25 @@ def downloaded(download_folder, output_path):
 @cli.command()
 @click.argument('full_path', type=click.Path(exists=True))
 @click.argument('output_path', type=click.Path())
-def full(full_path, output_path):
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the statistics and store the stats at this path.')
+def full(full_path, output_path, profile_path):
+    instrument.start('corpus_infos/full', profile_path=profile_path)
+
     if os.path.isfile(output_path):
         print('Info file already there')
         return
 
-    cinfo = get_corpus_info('full', full_path, 'default')
+    print('Get infos for full')
+
+    with instrument.step('load') as step:
+        cc = columnar.load(full_path)
+        duration_index = durations.for_columnar(cc)
+        step.items = cc.num_utterances
+
+    with instrument.step('stats', items=cc.num_utterances, hot=True):
+        cinfo = stats.CorpusStats.of_columnar(cc, duration_index).info()
+
     jsonfile.write_json_to_file(output_path, cinfo)
 
 
@@ -55,22 +79,10 @@ def get_corpus_info(name, full_path, reader_type):
         reader=reader_type,
     )
 
-    cinfo = {
-        'duration': c.total_duration,
-        'num_utterances': c.num_utterances,
-        'num_issuers': c.num_issuers,
-        'subviews': {},
-    }
-
-    for sname, subview in c.subviews.items():
-        sinfo = {
-            'duration': subview.total_duration,
-            'num_utterances': subview.num_utterances,
-            'num_issuers': subview.num_issuers
-        }
-        cinfo['subviews'][sname] = sinfo
-
-    return cinfo
+    duration_index = durations.for_corpus(c, full_path)
+    corpus_stats = stats.CorpusStats.of_corpus(c, duration_index)
+
+    return corpus_stats.info()
 
 
 if __name__ == '__main__':
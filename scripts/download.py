@@ -1,11 +1,120 @@
 import os
+import fnmatch
 import click
-from audiomate.corpus import io
+
+from multiprocessing import pool
+
+from audiomate.corpus.io import mailabs
+from audiomate.corpus.io import swc
+from audiomate.corpus.io import tuda
+from audiomate.corpus.io import voxforge
+
+import downloads
+import instrument
+
+
+CORPORA = ['voxforge', 'tuda', 'swc', 'mailabs']
+
+# Patterns (of the file name) of the files the readers use
+USED_FILES = {
+    'voxforge': ['README', 'PROMPTS', 'prompts-original', '*.wav'],
+    'tuda': ['*.xml', '*.wav'],
+    'swc': ['audiometa.txt', 'info.json', 'aligned.swc', 'audio*.ogg'],
+    'mailabs': ['metadata.csv', '*.wav'],
+}
+
+
+def used_files_filter(name):
+    """
+    Return a function, that returns ``True`` for the members of the archives
+    of the corpus ``name``, that are used by its reader.
+    """
+    patterns = USED_FILES[name]
+
+    def is_used(member_path):
+        file_name = member_path.rstrip('/').split('/')[-1]
+        return any(fnmatch.fnmatchcase(file_name, x) for x in patterns)
+
+    return is_used
+
+
+def archive_name(url):
+    return url.rstrip('/').split('/')[-1]
+
+
+def create_download(name, download_folder, checksums, mirror, stream=False,
+                    only_used_files=False):
+    """
+    Return the download of the corpus with the given name,
+    with the same sources and layout as the audiomate downloaders.
+    """
+    member_filter = None
+
+    if only_used_files:
+        member_filter = used_files_filter(name)
+
+    if name == 'voxforge':
+        if mirror is None:
+            index_url = voxforge.DOWNLOAD_URL['de']
+        else:
+            index_url = '{}/voxforge/'.format(mirror.rstrip('/'))
+
+        archive_urls = voxforge.VoxforgeDownloader.available_files(index_url)
+        print('Found {} available voxforge archives'.format(len(archive_urls)))
+
+        return downloads.CorpusDownload(
+            name,
+            download_folder,
+            [(archive_name(x), x) for x in archive_urls],
+            checksums,
+            stream=stream,
+            member_filter=member_filter
+        )
+
+    url, move_files_up = {
+        'tuda': (tuda.DOWNLOAD_URL, True),
+        'swc': (swc.URLS['de'], True),
+        'mailabs': (mailabs.DOWNLOAD_URLS['de_DE'], False),
+    }[name]
+
+    url = downloads.mirror_url(url, mirror, name)
+
+    return downloads.CorpusDownload(
+        name,
+        download_folder,
+        [(archive_name(url), url)],
+        checksums,
+        move_files_up=move_files_up,
+        stream=stream,
+        member_filter=member_filter
+    )
 
 
 @click.command()
 @click.argument('download_folder', type=click.Path())
-def run(download_folder):
+@click.option('--mirror', default=None,
+              help='Base url of a mirror/cache. The archives are expected at '
+                   '<mirror>/<corpus>/<archive>, for voxforge with an index page '
+                   'at <mirror>/voxforge/.')
+@click.option('--checksums', 'checksums_path', default=None, type=click.Path(),
+              help='Json file with the recorded sizes/checksums of the archives '
+                   '(default: <download_folder>/.download/checksums.json).')
+@click.option('--num-workers', default=8, type=int,
+              help='Number of concurrent archive downloads per corpus.')
+@click.option('--accept-existing', is_flag=True,
+              help='Mark existing corpus folders without completion marker as complete.')
+@click.option('--stream', is_flag=True,
+              help='Extract the archives while downloading, without storing them.')
+@click.option('--only-used-files', is_flag=True,
+              help='Only extract the files that are used by the corpus readers.')
+def run(download_folder, mirror, checksums_path, num_workers, accept_existing,
+        stream, only_used_files):
+    """
+    Download the corpora concurrently.
+    A corpus is only considered present, if it was downloaded completely.
+    Interrupted downloads are resumed.
+    """
+    instrument.start('download')
 
     #
     # Common-Voice
@@ -21,60 +130,68 @@ def run(download_folder):
         exit(0)
 
     #
-    # Voxforge
-    #
-
-    voxforge_path = os.path.join(download_folder, 'voxforge')
-
-    if not os.path.isdir(voxforge_path):
-        print('Download Voxforge')
-        os.makedirs(voxforge_path, exist_ok=True)
-        voxforge_dl = io.VoxforgeDownloader(lang='de', num_workers=8)
-        voxforge_dl.download(voxforge_path)
-    else:
-        print('Voxforge already exists')
-
-    #
-    # TUDA
-    #
-
-    tuda_path = os.path.join(download_folder, 'tuda')
-
-    if not os.path.isdir(tuda_path):
-        print('Download TUDA')
-        os.makedirs(tuda_path, exist_ok=True)
-        tuda_dl = io.TudaDownloader()
-        tuda_dl.download(tuda_path)
-    else:
-        print('TUDA already exists')
-
-    #
-    # SWC
+    # Voxforge, TUDA, SWC, M-AILABS
     #
 
-    swc_path = os.path.join(download_folder, 'swc')
-
-    if not os.path.isdir(swc_path):
-        print('Download SWC')
-        os.makedirs(swc_path, exist_ok=True)
-        swc_dl = io.SWCDownloader()
-        swc_dl.download(swc_path)
-    else:
-        print('SWC already exists')
-
-    #
-    # M-AILABS
-    #
-
-    mailabs_path = os.path.join(download_folder, 'mailabs')
-
-    if not os.path.isdir(mailabs_path):
-        print('Download Mailabs')
-        os.makedirs(mailabs_path, exist_ok=True)
-        mailabs_dl = io.MailabsDownloader(tags=['de_DE'])
-        mailabs_dl.download(mailabs_path)
-    else:
-        print('Mailabs already exists')
+    if checksums_path is None:
+        checksums_path = os.path.join(
+            download_folder,
+            downloads.STATE_FOLDER,
+            downloads.CHECKSUMS_FILE_NAME
+        )
+
+    checksums = downloads.Checksums(checksums_path)
+    to_download = []
+    failed = []
+
+    for name in CORPORA:
+        if downloads.is_complete(download_folder, name):
+            print('{} already exists'.format(name))
+        elif os.path.isdir(os.path.join(download_folder, name)):
+            if accept_existing:
+                print('{} already exists, mark as complete'.format(name))
+                downloads.mark_complete(download_folder, name)
+            elif not downloads.has_state(download_folder, name):
+                # Downloaded by an earlier version, which didn't write completion markers
+                print('{} already exists (without completion marker), mark as complete'.format(name))
+                downloads.mark_complete(download_folder, name)
+            else:
+                print((
+                    '{} exists, but was not downloaded completely. '
+                    'Remove it to download it again or use --accept-existing.'
+                ).format(name))
+                failed.append(name)
+        else:
+            to_download.append(name)
+
+    def download_corpus(name):
+        print('Download {}'.format(name))
+
+        try:
+            with instrument.step(name):
+                dl = create_download(
+                    name,
+                    download_folder,
+                    checksums,
+                    mirror,
+                    stream=stream,
+                    only_used_files=only_used_files
+                )
+
+                with pool.ThreadPool(num_workers) as p:
+                    dl.run(pool=p)
+        except Exception as ex:
+            print('Download of {} failed: {}'.format(name, ex))
+            return name
+
+        print('{} downloaded'.format(name))
+
+    if len(to_download) > 0:
+        with pool.ThreadPool(len(to_download)) as p:
+            failed.extend(x for x in p.map(download_corpus, to_download) if x is not None)
+
+    if len(failed) > 0:
+        raise click.ClickException('Download failed for {}'.format(', '.join(failed)))
 
 
 if __name__ == '__main__':
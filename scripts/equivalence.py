@@ -1,13 +1,19 @@
 import os
+import gzip
 import hashlib
 import click
 import json
 
-import audiomate
+import numpy as np
 from tqdm import tqdm
 
+import columnar
+import digests
+import instrument
+
 
 SEED = 3294
+STATE_VERSION = 2
 
 
 @click.group()
@@ -17,11 +23,30 @@ def cli():
 
 @cli.command()
 @click.argument('data_folder', type=click.Path(exists=True))
-def generate(data_folder):
+@click.option('--content', is_flag=True,
+              help='Hash the content of all audio files and store a per-track manifest.')
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the hashing and store the stats at this path.')
+def generate(data_folder, content, num_workers, profile_path):
+    instrument.start('equivalence/generate', profile_path=profile_path)
     full_path = os.path.join(data_folder, 'full')
     state_path = os.path.join(data_folder, 'state.json')
+    manifest_path = os.path.join(data_folder, 'state_tracks.json.gz')
+    cache_path = os.path.join(data_folder, 'state_cache.json')
+
+    corpus = columnar.load(full_path)
+    state = generate_state(full_path, corpus)
+
+    if content:
+        cache = digests.DigestCache(cache_path)
+        manifest = generate_track_manifest(corpus, cache, num_workers)
+        cache.save()
 
-    state = generate_state(full_path)
+        state['audio_content'] = hash_manifest(manifest)
+
+        with gzip.open(manifest_path, 'wt') as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
 
     with open(state_path, 'w') as f:
         json.dump(state, f)
@@ -29,51 +54,93 @@ def generate(data_folder):
 
 @cli.command()
 @click.argument('data_folder', type=click.Path(exists=True))
-def check(data_folder):
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--marker', 'marker_path', default=None, type=click.Path(),
+              help='Write this file if the data matches (removed otherwise).')
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the hashing and store the stats at this path.')
+def check(data_folder, num_workers, marker_path, profile_path):
+    """
+    Compare the data with the state of the repository.
+    Exits with an error if the data differs.
+    """
+    instrument.start('equivalence/check', profile_path=profile_path)
+
+    if marker_path is not None and os.path.isfile(marker_path):
+        os.remove(marker_path)
+
     full_path = os.path.join(data_folder, 'full')
     state_path = os.path.join(data_folder, 'state.json')
+    manifest_path = os.path.join(data_folder, 'state_tracks.json.gz')
+    cache_path = os.path.join(data_folder, 'state_cache.json')
 
     with open(state_path, 'r') as f:
         state = json.load(f)
 
-    actual_state = generate_state(full_path)
+    corpus = columnar.load(full_path)
+    legacy_issuers = state.get('version', 1) < 2
+    actual_state = generate_state(full_path, corpus, legacy_issuers=legacy_issuers)
+
+    ok = compare(state, actual_state)
+
+    if 'audio_content' in state and os.path.isfile(manifest_path):
+        with gzip.open(manifest_path, 'rt') as f:
+            manifest = json.load(f)
+
+        cache = digests.DigestCache(cache_path)
+        actual_manifest = generate_track_manifest(corpus, cache, num_workers)
+        cache.save()
+
+        if not compare_manifests(manifest, actual_manifest, corpus):
+            ok = False
 
-    if compare(state, actual_state):
+    if ok:
         print('OK - Your data matches the state of the repository')
+
+        if marker_path is not None:
+            with open(marker_path, 'w') as f:
+                json.dump(actual_state, f)
     else:
-        print('NOT OK - Your data differs from the state of the repository')
+        raise click.ClickException('NOT OK - Your data differs from the state of the repository')
 
 
-def generate_state(path):
+def generate_state(path, corpus, legacy_issuers=False):
     state = {
+        'version': STATE_VERSION,
         'meta_files': {},
     }
 
+    if legacy_issuers:
+        state['version'] = 1
+
     print('Hash meta files')
-    for filename in os.listdir(path):
-        if filename.endswith('txt') or filename.endswith('json'):
-            print(' - {} ...'.format(filename))
-            file_path = os.path.join(path, filename)
+    with instrument.step('meta_files', hot=True) as step:
+        for filename in os.listdir(path):
+            if filename.endswith('txt') or filename.endswith('json'):
+                print(' - {} ...'.format(filename))
+                file_path = os.path.join(path, filename)
+
+                if filename == 'issuers.json':
+                    hash_value = hash_issuers_json(file_path, legacy=legacy_issuers)
+                else:
+                    hash_value = hash_file(file_path)
 
-            if filename == 'issuers.json':
-                hash_value = hash_issuers_json(file_path)
-            else:
-                hash_value = hash_file(file_path)
+                state['meta_files'][filename] = hash_value
 
-            state['meta_files'][filename] = hash_value
+        step.items = len(state['meta_files'])
 
-    print('Hash audio files')
-    corpus = audiomate.Corpus.load(path)
-    tracks = sorted(corpus.tracks.values(), key=lambda x: x.idx)
+    print('Hash audio file sizes')
+    tracks = sorted(zip(corpus.track_ids, corpus.track_paths))
 
-    # We only hash file-size
-    # Otherwise it would take to long
+    # Only the file-sizes are hashed here,
+    # the content is hashed with ``generate_track_manifest``
     h = hashlib.new('md5')
 
-    for track in tqdm(tracks, total=corpus.num_tracks):
-        stat = os.stat(track.path)
-        size = stat.st_size
-        h.update(size.to_bytes(4, byteorder='big'))
+    with instrument.step('audio_sizes', items=len(tracks), hot=True):
+        for track_idx, track_path in tqdm(tracks, total=corpus.num_tracks):
+            stat = os.stat(track_path)
+            size = stat.st_size
+            h.update(size.to_bytes(4, byteorder='big'))
 
     hash_value = h.hexdigest()
     state['audio_files'] = hash_value
@@ -81,6 +148,39 @@ def generate_state(path):
     return state
 
 
+def generate_track_manifest(corpus, cache, num_workers):
+    """
+    Return the content digest of every track, with the track-idx as key.
+    Only files that changed since the last run (stat) are hashed.
+    """
+    print('Hash audio file content')
+    track_paths = dict(zip(corpus.track_ids, corpus.track_paths))
+
+    paths = sorted(set(track_paths.values()))
+
+    with instrument.step('audio_content', items=len(paths), hot=True):
+        file_digests = digests.digest_files(
+            paths,
+            cache=cache,
+            num_workers=num_workers,
+            show_progress=True
+        )
+
+    return {
+        idx: file_digests[path]
+        for idx, path in track_paths.items()
+    }
+
+
+def hash_manifest(manifest):
+    h = hashlib.new('md5')
+
+    for track_idx, digest in sorted(manifest.items()):
+        h.update('{} {}\n'.format(track_idx, digest).encode('utf-8'))
+
+    return h.hexdigest()
+
+
 def hash_file(path):
     with open(path, 'rb') as f:
         content = f.read()
@@ -90,19 +190,34 @@ def hash_file(path):
     return h.hexdigest()
 
 
-def hash_issuers_json(path):
+def hash_issuers_json(path, legacy=False):
+    """
+    Hash the issuers independent of the order in the file.
+    With ``legacy`` the hash is computed as in version 1 of the state,
+    which only covered the last issuer.
+    """
     with open(path, 'r') as f:
         content = json.load(f)
 
     h = hashlib.new('md5')
+    issuer_lines = []
 
     for x, y in sorted(content.items(), key=lambda x: x[0]):
         parts = [x]
         for k, v in sorted(y.items(), key=lambda x: x[0]):
+            if not isinstance(v, str):
+                v = json.dumps(v, sort_keys=True)
+
             parts.append(k)
             parts.append(v)
 
-    h.update(' '.join(parts).encode('utf-8'))
+        issuer_lines.append(' '.join(parts))
+
+    if legacy:
+        h.update(issuer_lines[-1].encode('utf-8'))
+    else:
+        h.update('\n'.join(issuer_lines).encode('utf-8'))
+
     return h.hexdigest()
 
 
@@ -110,7 +225,7 @@ def compare(reference, actual):
     ok = True
 
     for meta_file, hash_value in reference['meta_files'].items():
-        if hash_value != actual['meta_files'][meta_file]:
+        if hash_value != actual['meta_files'].get(meta_file):
             print('Hash value of {} differs'.format(meta_file))
             ok = False
 
@@ -121,5 +236,38 @@ def compare(reference, actual):
     return ok
 
 
+def compare_manifests(reference, actual, corpus):
+    differing = set()
+
+    for track_idx, digest in sorted(reference.items()):
+        if track_idx not in actual:
+            print('Track {} is missing'.format(track_idx))
+            differing.add(track_idx)
+        elif actual[track_idx] != digest:
+            print('Content of track {} differs'.format(track_idx))
+            differing.add(track_idx)
+
+    for track_idx in sorted(set(actual.keys()) - set(reference.keys())):
+        print('Track {} is not in the reference'.format(track_idx))
+        differing.add(track_idx)
+
+    if len(differing) <= 0:
+        return True
+
+    track_ordinals = {idx: i for i, idx in enumerate(corpus.track_ids)}
+    differing_ordinals = [track_ordinals[x] for x in differing if x in track_ordinals]
+    affected = np.isin(corpus.utt_track, differing_ordinals)
+
+    for name in sorted(corpus.subview_names):
+        num_affected = int(np.count_nonzero(affected & corpus.subview_bitset(name).mask))
+
+        if num_affected > 0:
+            print('Subview {} has {} utterances with differing audio'.format(
+                name, num_affected
+            ))
+
+    return False
+
+
 if __name__ == '__main__':
     cli()
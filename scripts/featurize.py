@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import click
+
+from tqdm import tqdm
+
+import columnar
+import features
+import instrument
+
+
+# Number of utterances after which the index is saved,
+# so an interrupted run only loses the features computed since
+SAVE_INTERVAL = 10000
+
+# Compact the store, if more than this share of the data file is unused
+MAX_UNUSED_SHARE = 0.25
+
+
+@click.command()
+@click.argument('wave_folder', type=click.Path(exists=True))
+@click.argument('out_folder', type=click.Path())
+@click.option('--num-mels', default=features.DEFAULT_CONFIG['num_mels'], type=int)
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the feature computation and store the stats at this path.')
+def run(wave_folder, out_folder, num_mels, num_workers, profile_path):
+    """
+    Compute log-mel features of the utterances of the waverized corpus
+    and store them as float16 in a single memory-mappable file,
+    which can be read with ``features.FeatureReader``.
+
+    Only utterances that are new or whose audio changed are computed.
+    If the store was created with another feature config, it is recreated.
+    """
+    instrument.start('featurize', profile_path=profile_path)
+
+    config = dict(features.DEFAULT_CONFIG)
+    config['num_mels'] = num_mels
+
+    print('Load waverized corpus')
+
+    with instrument.step('load') as step:
+        cc = columnar.load(wave_folder)
+        utt_ids = cc.utt_ids
+        track_paths = cc.track_paths
+        utt_track = cc.utt_track.tolist()
+        utt_start = cc.utt_start.tolist()
+        utt_end = cc.utt_end.tolist()
+        step.items = len(utt_ids)
+
+    store = features.FeatureStore(out_folder, config)
+
+    if store.was_stale:
+        print('Existing features were computed with another config, recreate them')
+
+    items = []
+    sources = {}
+
+    with instrument.step('check', items=len(utt_ids)):
+        for i, utt_idx in enumerate(utt_ids):
+            path = track_paths[utt_track[i]]
+            source = features.source_info(path, utt_start[i], utt_end[i])
+
+            if not store.is_current(utt_idx, source):
+                items.append((utt_idx, path, utt_start[i], utt_end[i], config))
+                sources[utt_idx] = source
+
+    print('Compute features of {} utterances'.format(len(items)))
+
+    with instrument.step('compute', items=len(items), hot=True):
+        with multiprocessing.Pool(num_workers) as p:
+            results = p.imap_unordered(features.compute, items, chunksize=16)
+
+            for i, (utt_idx, feats) in enumerate(tqdm(results, total=len(items))):
+                store.append(utt_idx, sources[utt_idx], feats)
+
+                if (i + 1) % SAVE_INTERVAL == 0:
+                    store.save()
+
+    store.retain(utt_ids)
+
+    if store.num_unused_frames > MAX_UNUSED_SHARE * store.num_frames:
+        print('Compact feature store')
+
+        with instrument.step('compact', items=len(utt_ids)):
+            store.compact()
+
+    store.close()
+
+
+if __name__ == '__main__':
+    run()
@@ -1,33 +1,251 @@
 import os
+import json
+import multiprocessing
+import wave
 import click
 
+import numpy as np
+from tqdm import tqdm
+
 import audiomate
-from audiomate.corpus import io
+
+import buckets
+import columnar
+import instrument
+import wavconvert
+
+
+SAMPLING_RATE = 16000
+SEED = 3294
+
+
+def read_header(path):
+    """
+    Return whether the file is a 16 kHz / 16 bit mono wave file
+    and its duration (as computed by soundfile/librosa).
+    """
+    try:
+        with wave.open(path, 'rb') as f:
+            matches = (
+                f.getframerate() == SAMPLING_RATE
+                and f.getsampwidth() == 2
+                and f.getnchannels() == 1
+            )
+            duration = float(f.getnframes()) / f.getframerate()
+    except (wave.Error, EOFError):
+        matches = False
+        duration = None
+
+    return path, matches, duration
+
+
+def read_headers(paths, num_workers):
+    with multiprocessing.Pool(num_workers) as p:
+        result = list(tqdm(
+            p.imap_unordered(read_header, paths, chunksize=256),
+            total=len(paths)
+        ))
+
+    return {path: (matches, duration) for path, matches, duration in result}
+
+
+def link_file(src, target, link):
+    if os.path.lexists(target):
+        if link == 'symlink' and os.path.islink(target) and os.readlink(target) == src:
+            return
+        if link == 'hardlink' and not os.path.islink(target) and os.path.samefile(src, target):
+            return
+
+        os.remove(target)
+
+    if link == 'hardlink':
+        os.link(src, target)
+    else:
+        os.symlink(src, target)
+
+
+def parse_boundaries(ctx, param, value):
+    if value is None:
+        return None
+
+    try:
+        return buckets.parse_boundaries(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+class ManifestWriter(object):
+    """
+    Writes a list of records as JSON-array one by one,
+    with the same output as ``json.dump`` of the whole list.
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'w')
+        self.f.write('[')
+        self.first = True
+
+    def write(self, serialized_record):
+        if not self.first:
+            self.f.write(', ')
+
+        self.f.write(serialized_record)
+        self.first = False
+
+    def close(self):
+        self.f.write(']')
+        self.f.close()
 
 
 @click.command()
 @click.argument('in_folder', type=click.Path(exists=True))
 @click.argument('out_folder', type=click.Path())
 @click.option('--base-folder', default=None, type=click.Path())
-def run(in_folder, out_folder, base_folder):
-    if not os.path.exists(out_folder):
-        if base_folder is None:
-            base_folder = os.path.dirname(out_folder)
-
-        w = io.NvidiaJasperWriter(
-            num_workers=8,
-            no_check=True,
-            data_base_path=base_folder
-        )
-        target_audio_path = os.path.join(out_folder, 'audio')
-        os.makedirs(target_audio_path)
+@click.option('--link', default='none', type=click.Choice(['none', 'hardlink', 'symlink']),
+              help='Reference audio that is already in the target format directly (none) '
+                   'or via links in the audio folder of the output.')
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--bucket-boundaries', default=None, callback=parse_boundaries,
+              help='Comma separated bucket boundaries in seconds (e.g. 2,4,6,8,10,15,20). '
+                   'If given, the manifests are ordered by duration bucket '
+                   'and shuffled within the buckets (instead of sorted by duration).')
+@click.option('--batch-size', default=buckets.DEFAULT_BATCH_SIZE, type=int,
+              help='Batch size for the padding ratio in the bucket statistics.')
+@click.option('--seed', default=SEED, type=int,
+              help='Seed for shuffling the buckets.')
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the conversion and store the stats at this path.')
+def run(in_folder, out_folder, base_folder, link, num_workers,
+        bucket_boundaries, batch_size, seed, profile_path):
+    """
+    Write the Jasper manifests (one json per subview and ``all.json``)
+    for the corpus in ``in_folder``, as ``NvidiaJasperWriter`` would.
+    Audio that is already in the target format (a 16 kHz / 16 bit mono wave file
+    per utterance) is only referenced, other utterances are converted into
+    the audio folder of the output.
+
+    With ``--bucket-boundaries`` the manifests are bucketed by duration
+    and the statistics of the buckets are written to ``buckets.json``.
+    """
+    instrument.start('jasperize', profile_path=profile_path)
 
-        print('Load source corpus')
-        ds = audiomate.Corpus.load(in_folder)
-        print('Save jasper corpus')
-        w.save(ds, out_folder)
+    if base_folder is None:
+        base_folder = os.path.dirname(out_folder)
+
+    target_audio_path = os.path.join(out_folder, 'audio')
+    os.makedirs(target_audio_path, exist_ok=True)
+
+    print('Load source corpus')
+
+    with instrument.step('load') as step:
+        cc = columnar.load(in_folder)
+        utt_ids = cc.utt_ids
+        track_paths = cc.track_paths
+        utt_track = cc.utt_track.tolist()
+        utt_start = cc.utt_start.tolist()
+        utt_end = cc.utt_end.tolist()
+        step.items = len(utt_ids)
+
+    print('Check audio format')
+
+    with instrument.step('headers', items=len(set(track_paths))):
+        headers = read_headers(sorted(set(track_paths)), num_workers)
+
+    utt_paths = []
+    # Path of the file containing the audio (the source of a link)
+    utt_audio_paths = []
+    to_convert = []
+
+    for i, utt_idx in enumerate(utt_ids):
+        path = track_paths[utt_track[i]]
+        whole_file = utt_start[i] == 0 and utt_end[i] == float('inf')
+
+        if whole_file and headers[path][0]:
+            utt_audio_paths.append(path)
+
+            if link != 'none':
+                target = os.path.join(target_audio_path, '{}.wav'.format(utt_idx))
+                link_file(path, target, link)
+                path = target
+        else:
+            target = os.path.join(target_audio_path, '{}.wav'.format(utt_idx))
+            to_convert.append((path, utt_start[i], utt_end[i], target))
+            path = target
+            utt_audio_paths.append(path)
+
+        utt_paths.append(path)
+
+    print('Convert {} utterances'.format(len(to_convert)))
+    converter = wavconvert.ResumableWavAudioFileConverter(
+        os.path.join(out_folder, 'jasperize_manifest.jsonl'),
+        num_workers=num_workers,
+        sampling_rate=SAMPLING_RATE
+    )
+
+    with instrument.step('convert', items=len(to_convert), hot=True):
+        converter.convert_files(to_convert)
+
+        if len(to_convert) > 0:
+            headers.update(read_headers([x[3] for x in to_convert], num_workers))
+
+    # Remove files of utterances that are not in the corpus anymore
+    used_files = {os.path.basename(x) for x in utt_paths if os.path.dirname(x) == target_audio_path}
+
+    for filename in os.listdir(target_audio_path):
+        if filename not in used_files:
+            os.remove(os.path.join(target_audio_path, filename))
+
+    durations = np.array([headers[x][1] for x in utt_audio_paths], dtype=np.float64)
+    transcripts = cc.transcripts(audiomate.corpus.LL_WORD_TRANSCRIPT)
+    subview_masks = [
+        (name, cc.subview_bitset(name).mask)
+        for name in cc.subview_names
+    ]
+
+    if bucket_boundaries is None:
+        order = np.argsort(durations, kind='stable')
     else:
-        print('Already jasperized')
+        order, bucket_ids = buckets.bucketed_order(durations, bucket_boundaries, seed)
+        buckets.write_stats(
+            os.path.join(out_folder, 'buckets.json'),
+            durations, order, bucket_ids, subview_masks,
+            bucket_boundaries, batch_size, seed
+        )
+
+    print('Write manifests')
+
+    with instrument.step('manifests', items=len(utt_ids)):
+        writers = {'all': ManifestWriter(os.path.join(out_folder, 'all.json'))}
+
+        for name, _ in subview_masks:
+            writers[name] = ManifestWriter(os.path.join(out_folder, '{}.json'.format(name)))
+
+        for i in tqdm(order.tolist()):
+            utt_dur = float(durations[i])
+            num_samples = utt_dur * SAMPLING_RATE
+            record = json.dumps({
+                'transcript': transcripts[i],
+                'files': [{
+                    'fname': os.path.relpath(utt_paths[i], base_folder),
+                    'channels': 1,
+                    'sample_rate': 16000,
+                    'duration': utt_dur,
+                    'num_samples': num_samples,
+                    'speed': 1
+                }],
+                'original_duration': utt_dur,
+                'original_num_samples': num_samples,
+                'utt_idx': utt_ids[i]
+            })
+
+            writers['all'].write(record)
+
+            for name, mask in subview_masks:
+                if mask[i]:
+                    writers[name].write(record)
+
+        for writer in writers.values():
+            writer.close()
 
 
 if __name__ == '__main__':
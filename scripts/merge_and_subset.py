@@ -1,10 +1,17 @@
 import os
 import click
 
-from tqdm import tqdm
+import numpy as np
 
 import audiomate
-from audiomate.corpus import subset
+
+import bitsets
+import columnar
+import durations
+import instrument
+import mergewriter
+import splits
+import stats
 
 
 SEED = 3294
@@ -15,7 +22,22 @@ MAX_TRAIN_UTT_DURATION = 25.0
 @click.command()
 @click.argument('download_folder', type=click.Path(exists=True))
 @click.argument('output_folder', type=click.Path())
-def run(download_folder, output_folder):
+@click.option('--split-mode', default='compat', type=click.Choice(['compat', 'duration']),
+              help='compat: Same dev/test splits as the published corpus '
+                   '(balanced by transcript length). '
+                   'duration: Dev/test filled up to the target duration.')
+@click.option('--corpus-format', default='native', type=click.Choice(['native', 'default']),
+              help='native: Load the corpora with their own readers. '
+                   'default: Load the corpora in audiomate\'s default format '
+                   '(e.g. synthetic corpora from synthesize.py).')
+@click.option('--streaming', is_flag=True,
+              help='Load one corpus at a time and write it directly to the output, '
+                   'instead of merging all corpora in memory (same result).')
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile loading the corpora and store the stats at this path.')
+def run(download_folder, output_folder, split_mode, corpus_format, streaming, profile_path):
+    instrument.start('merge_and_subset', profile_path=profile_path)
+
     corpora_names = [
         ('common_voice', 'common-voice'),
         ('mailabs', 'mailabs'),
@@ -24,157 +46,285 @@ def run(download_folder, output_folder):
         ('voxforge', 'voxforge'),
     ]
 
+    if streaming:
+        merge_streaming(download_folder, output_folder, corpora_names, split_mode, corpus_format)
+    else:
+        merge_in_memory(download_folder, output_folder, corpora_names, split_mode, corpus_format)
+
+
+def merge_in_memory(download_folder, output_folder, corpora_names, split_mode, corpus_format):
+    """
+    Load all corpora, merge them and save the merged corpus.
+    """
     print('Load corpora')
     corpora = {}
-
-    for name, reader_type in corpora_names:
-        print(' - {} ...'.format(name))
-        full_path = os.path.join(download_folder, name)
-        c = audiomate.Corpus.load(
-            full_path,
-            reader=reader_type
-        )
-        corpora[name] = c
+    duration_indices = {}
+
+    with instrument.step('load', hot=True):
+        for name, reader_type in corpora_names:
+            print(' - {} ...'.format(name))
+            full_path = os.path.join(download_folder, name)
+
+            with instrument.step(name) as step:
+                c = audiomate.Corpus.load(
+                    full_path,
+                    reader=reader_type if corpus_format == 'native' else 'default'
+                )
+                corpora[name] = c
+                duration_indices[name] = durations.for_corpus(c, full_path)
+                step.items = c.num_utterances
 
     print('Create Train/Dev/Test - if not already exist')
-    for name, corpus in corpora.items():
-        prepare_corpus(corpus, name)
+    parts = {}
 
-    print('Insert full subviews')
-    #
-    #   Insert subviews containing all utterances
-    #   so we have a reference when merged
-    #
-    for name, corpus in corpora.items():
-        all_utts = set(corpus.utterances.keys())
-        full_filter = subset.MatchingUtteranceIdxFilter(all_utts)
-        full_subview = subset.Subview(corpus, filter_criteria=[full_filter])
-        corpus.import_subview('full', full_subview)
+    with instrument.step('split'):
+        for name, corpus in corpora.items():
+            with instrument.step(name, items=corpus.num_utterances):
+                parts[name] = prepare_corpus(corpus, name, duration_indices[name], split_mode)
+
+    print('Merge corpora ...')
+
+    with instrument.step('merge') as step:
+        full_corpus = merge_corpora(list(corpora.values()))
+        full_ordinals = bitsets.UtteranceOrdinals.of_corpus(full_corpus)
+        step.items = full_corpus.num_utterances
 
-    print('Suffix subviews')
     #
-    #   Suffix subviews to have the correct names when merging
+    #   The utterances of every corpus are appended to the merged corpus
+    #   in their original order, so the bitsets are moved by the number of
+    #   utterances of the previous corpora.
+    #   The full subviews contain all utterances of a corpus,
+    #   so we have a reference when merged.
     #
-    for name, corpus in corpora.items():
-        print(' - {} ...'.format(name))
-        original_subview_names = list(corpus.subviews.keys())
+    print('Create subviews ...')
+    subviews = {}
+    offset = 0
 
-        for subview_name in original_subview_names:
-            new_subview_name = '{}_{}'.format(subview_name, name)
-            corpus.subviews[new_subview_name] = corpus.subviews[subview_name]
-            del corpus.subviews[subview_name]
+    with instrument.step('subviews'):
+        for name, corpus in corpora.items():
+            for part, bitset in parts[name].items():
+                subviews['{}_{}'.format(part, name)] = bitset.embed(full_ordinals, offset)
 
-    print('Merge corpora ...')
-    full_corpus = audiomate.Corpus.merge_corpora(list(corpora.values()))
+            offset += corpus.num_utterances
 
-    print('Create merged train/test/dev subviews ...')
-    for part in ['train', 'dev', 'test']:
-        utt_ids = set()
+        for part in ['train', 'dev', 'test']:
+            part_bitset = full_ordinals.empty()
 
-        for name, corpus in corpora.items():
-            sv = full_corpus.subviews['{}_{}'.format(part, name)]
-            utt_ids.update(sv.utterances.keys())
+            for name in corpora.keys():
+                part_bitset = part_bitset | subviews['{}_{}'.format(part, name)]
 
-        part_filter = subset.MatchingUtteranceIdxFilter(utt_ids)
-        part_subview = subset.Subview(corpus, filter_criteria=[part_filter])
-        full_corpus.import_subview(part, part_subview)
+            subviews[part] = part_bitset
 
     print('Save ...')
+
+    with instrument.step('save', items=full_corpus.num_utterances):
+        os.makedirs(output_folder)
+        full_corpus.save_at(output_folder)
+
+        for subview_name, bitset in subviews.items():
+            bitset.write_subview(output_folder, subview_name)
+
+    print('Create columnar cache ...')
+
+    with instrument.step('columnar', items=full_corpus.num_utterances):
+        columnar.write(full_corpus, output_folder, subview_bitsets=subviews)
+
+
+def merge_streaming(download_folder, output_folder, corpora_names, split_mode, corpus_format):
+    """
+    Load, split and write one corpus after the other with a :class:`mergewriter.MergeWriter`,
+    so only a single corpus is held in memory.
+    The output is the same as with :func:`merge_in_memory`.
+    """
     os.makedirs(output_folder)
-    full_corpus.save_at(output_folder)
+    writer = mergewriter.MergeWriter(output_folder)
+    num_utterances = 0
+
+    for name, reader_type in corpora_names:
+        print('{} ...'.format(name))
+        full_path = os.path.join(download_folder, name)
+
+        with instrument.step(name) as step:
+            with instrument.step('load', hot=True):
+                print(' - Load')
+                corpus = audiomate.Corpus.load(
+                    full_path,
+                    reader=reader_type if corpus_format == 'native' else 'default'
+                )
+                duration_index = durations.for_corpus(corpus, full_path)
 
+            with instrument.step('split', items=corpus.num_utterances):
+                parts = prepare_corpus(corpus, name, duration_index, split_mode)
+
+            # The parts of all corpora are joined in the subviews without suffix
+            subviews = {}
+
+            for part, bitset in parts.items():
+                subviews['{}_{}'.format(part, name)] = bitset
+
+                if part != 'full':
+                    subviews[part] = bitset
+
+            with instrument.step('write', items=corpus.num_utterances):
+                print(' - Write')
+                writer.add_corpus(corpus, subviews=subviews)
+
+            step.items = corpus.num_utterances
+            num_utterances += corpus.num_utterances
+            del corpus, duration_index, parts, subviews
+
+    print('Merge ...')
+
+    with instrument.step('merge', items=num_utterances):
+        writer.close()
+
+    print('Create columnar cache ...')
+
+    with instrument.step('columnar', items=num_utterances):
+        columnar.write_from_files(output_folder)
+
+
+def merge_corpora(corpora):
+    """
+    Merge the corpora into a new one, ignoring their subviews.
+    Ids occurring in multiple corpora are suffixed
+    as in ``audiomate.Corpus.merge_corpora``,
+    but no copy of the corpora is created.
+    """
+    full_corpus = audiomate.Corpus()
+
+    for corpus in corpora:
+        full_corpus.import_tracks(corpus.tracks.values())
+        full_corpus.import_issuers(corpus.issuers.values())
+        full_corpus.import_utterances(corpus.utterances.values())
+
+    return full_corpus
+
+
+def prepare_corpus(corpus, name, duration_index, split_mode='compat'):
+    """
+    Return the train/dev/test/full bitsets of the given corpus.
+    """
+    ordinals = bitsets.UtteranceOrdinals.of_corpus(corpus)
 
-def prepare_corpus(corpus, name):
     if name != 'common_voice':
         print(' - {}: Find utterances that are too long'.format(name))
-        too_long = utts_too_long(corpus)
+        too_long = ordinals.bitset(utts_too_long(corpus, duration_index))
     else:
-        too_long = set()
+        too_long = ordinals.empty()
 
     if name == 'mailabs':
         # we only use mailabs for training
         # since we don't know the speakers
-        train_utts = set(corpus.utterances.keys())
-        train_utts = train_utts - too_long
-        dev_utts = set()
-        test_utts = set()
+        train = ordinals.full() - too_long
+        dev = ordinals.empty()
+        test = ordinals.empty()
 
     elif name == 'tuda':
         # we only use kinect-raw files
         # otherwise sentence of the tuda would occur multiple times
         # in contrast to other datasets
-        train_utts = set(corpus.subviews['train_kinect-raw'].utterances.keys())
-        train_utts = train_utts - too_long
-        dev_utts = set(corpus.subviews['dev_kinect-raw'].utterances.keys())
-        test_utts = set(corpus.subviews['test_kinect-raw'].utterances.keys())
+        train = subview_bitset(corpus, 'train_kinect-raw', ordinals) - too_long
+        dev = subview_bitset(corpus, 'dev_kinect-raw', ordinals)
+        test = subview_bitset(corpus, 'test_kinect-raw', ordinals)
 
     elif name == 'common_voice':
-        train_utts = set(corpus.subviews['train'].utterances.keys())
-        train_utts = train_utts - too_long
-        dev_utts = set(corpus.subviews['dev'].utterances.keys())
-        test_utts = set(corpus.subviews['test'].utterances.keys())
+        train = subview_bitset(corpus, 'train', ordinals) - too_long
+        dev = subview_bitset(corpus, 'dev', ordinals)
+        test = subview_bitset(corpus, 'test', ordinals)
 
     else:
-        dur_filter = subset.MatchingUtteranceIdxFilter(too_long, inverse=True)
-        dur_subview = subset.Subview(corpus, filter_criteria=[dur_filter])
-        train, dev, test = create_train_dev_test(dur_subview)
-
-        train_utts = set(train.utterances.keys())
-        dev_utts = set(dev.utterances.keys())
-        test_utts = set(test.utterances.keys())
-
-    # Remove all subviews
-    for subname in list(corpus.subviews.keys()):
-        del corpus.subviews[subname]
-
-    # Add new subviews
-    train_filter = subset.MatchingUtteranceIdxFilter(train_utts)
-    train_subview = subset.Subview(corpus, filter_criteria=[train_filter])
-    corpus.import_subview('train', train_subview)
+        train, dev, test = create_train_dev_test(
+            corpus,
+            ordinals.full() - too_long,
+            duration_index,
+            split_mode=split_mode
+        )
 
-    dev_filter = subset.MatchingUtteranceIdxFilter(dev_utts)
-    dev_subview = subset.Subview(corpus, filter_criteria=[dev_filter])
-    corpus.import_subview('dev', dev_subview)
+    return {
+        'train': train,
+        'dev': dev,
+        'test': test,
+        'full': ordinals.full(),
+    }
 
-    test_filter = subset.MatchingUtteranceIdxFilter(test_utts)
-    test_subview = subset.Subview(corpus, filter_criteria=[test_filter])
-    corpus.import_subview('test', test_subview)
 
+def subview_bitset(corpus, subview_name, ordinals):
+    mask = stats.subview_mask(
+        corpus.subviews[subview_name],
+        ordinals.ordinals,
+        len(ordinals)
+    )
+    return bitsets.UtteranceBitset.from_mask(ordinals, mask)
 
-def utts_too_long(corpus):
-    utts = set()
 
-    for utt in tqdm(corpus.utterances.values()):
-        if utt.duration > MAX_TRAIN_UTT_DURATION:
-            utts.add(utt.idx)
+def utts_too_long(corpus, duration_index):
+    utt_ids = list(corpus.utterances.keys())
+    utt_durations = duration_index.durations_of(utt_ids)
+    too_long = np.nonzero(utt_durations > MAX_TRAIN_UTT_DURATION)[0]
 
-    return utts
+    return {utt_ids[i] for i in too_long}
 
 
-def create_train_dev_test(corpus):
+def create_train_dev_test(corpus, candidates, duration_index, split_mode='compat'):
     """
-    Create train/dev/test subsets of the given corpus.
-    Size is computed using length of the transcriptions.
+    Split the candidate utterances (bitset) into train/dev/test bitsets.
+    All utterances of an issuer are in the same part.
+
+    With ``split_mode == 'compat'`` the size is computed using the length
+    of the transcriptions, with the same result as
+    ``Splitter(..., SEED).split_by_label_length``.
+    With ``split_mode == 'duration'`` dev and test are filled with issuers
+    up to the target duration.
     """
+    utt_ids = candidates.ids()
+    utterances = [corpus.utterances[x] for x in utt_ids]
+    utt_issuers = [utt.issuer.idx for utt in utterances]
 
-    total_duration = corpus.total_duration
+    total_duration = duration_index.total_duration(utt_ids)
     test_dev_train_ratio = MAX_DEV_TEST_DURATION / total_duration
 
     if test_dev_train_ratio > 0.15:
         test_dev_train_ratio = 0.15
 
-    splitter = subset.Splitter(corpus, SEED)
-    subviews = splitter.split_by_label_length(
-        proportions={
-            'train': 1.0 - (2 * test_dev_train_ratio),
-            'dev': test_dev_train_ratio,
-            'test': test_dev_train_ratio,
-        },
-        label_list_idx=audiomate.corpus.LL_WORD_TRANSCRIPT,
-        separate_issuers=True
-    )
+    if split_mode == 'compat':
+        ll_idx = audiomate.corpus.LL_WORD_TRANSCRIPT
+        lengths = [utt.label_lists[ll_idx].total_length for utt in utterances]
+        issuer_ids, utt_issuer_ordinals, issuer_lengths = splits.issuer_totals(
+            utt_issuers, lengths
+        )
+        part_ids, issuer_parts = splits.split_issuers_by_weight(
+            issuer_ids,
+            issuer_lengths,
+            {
+                'train': 1.0 - (2 * test_dev_train_ratio),
+                'dev': test_dev_train_ratio,
+                'test': test_dev_train_ratio,
+            },
+            SEED
+        )
+    else:
+        target = total_duration * test_dev_train_ratio
+        issuer_ids, utt_issuer_ordinals, issuer_durations = splits.issuer_totals(
+            utt_issuers, duration_index.durations_of(utt_ids)
+        )
+        part_ids, issuer_parts = splits.split_issuers_by_duration(
+            issuer_durations,
+            {'dev': target, 'test': target},
+            'train',
+            SEED
+        )
+
+    utt_parts = issuer_parts[utt_issuer_ordinals]
+    positions = np.nonzero(candidates.mask)[0]
+    result = []
+
+    for part in ['train', 'dev', 'test']:
+        mask = np.zeros(len(candidates.ordinals), dtype=bool)
+        mask[positions[utt_parts == part_ids.index(part)]] = True
+        result.append(bitsets.UtteranceBitset.from_mask(candidates.ordinals, mask))
 
-    return subviews['train'], subviews['dev'], subviews['test']
+    return tuple(result)
 
 
 if __name__ == '__main__':
@@ -5,27 +5,51 @@ import audiomate
 from audiomate import annotations
 import spoteno
 
+import columnar
+import instrument
+import normcache
+
 
 @click.command()
 @click.argument('full_folder', type=click.Path())
 @click.argument('out_folder', type=click.Path())
-def run(full_folder, out_folder):
+@click.option('--cache-path', default=None, type=click.Path(),
+              help='Normalization cache (default: normalization_cache.sqlite next to out_folder).')
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the normalization and store the stats at this path.')
+def run(full_folder, out_folder, cache_path, num_workers, profile_path):
+    instrument.start('normalize_text', profile_path=profile_path)
+
+    if cache_path is None:
+        cache_path = os.path.join(
+            os.path.dirname(os.path.abspath(out_folder)),
+            'normalization_cache.sqlite'
+        )
+
     if not os.path.exists(out_folder):
         print('Load source corpus')
-        ds = audiomate.Corpus.load(full_folder)
+
+        with instrument.step('load') as step:
+            cc = columnar.load(full_folder)
+            ds = cc.to_corpus()
+            step.items = cc.num_utterances
 
         print('Normalize transcripts')
-        normalizer = spoteno.Normalizer.de()
-        utt_ids = []
-        transcripts = []
-        ll_idx = audiomate.corpus.LL_WORD_TRANSCRIPT
+        normalizer = spoteno.Normalizer.de(num_workers=num_workers)
+        signature = normcache.normalizer_signature(lower_case=True, force=True)
+        cache = normcache.NormalizationCache(cache_path, signature)
+        utt_ids = cc.utt_ids
+        transcripts = cc.transcripts(audiomate.corpus.LL_WORD_TRANSCRIPT)
 
-        for utt in ds.utterances.values():
-            transcript = utt.label_lists[ll_idx].join()
-            transcripts.append(transcript)
-            utt_ids.append(utt.idx)
+        with instrument.step('normalize', items=len(transcripts), hot=True):
+            result = normcache.normalize_list(transcripts, normalizer, cache)
+            cache.close()
 
-        result = normalizer.normalize_list(transcripts)
+        print('Normalization cache: {} hits, {} misses (distinct transcripts)'.format(
+            cache.hits,
+            cache.misses
+        ))
 
         for i, utt_idx in enumerate(utt_ids):
             orig = transcripts[i]
@@ -45,8 +69,11 @@ def run(full_folder, out_folder):
             ds.utterances[utt_idx].set_label_list(ll_normalized)
 
         print('Save normalized corpus')
-        os.makedirs(out_folder, exist_ok=True)
-        ds.save_at(out_folder)
+
+        with instrument.step('save', items=len(utt_ids)):
+            os.makedirs(out_folder, exist_ok=True)
+            ds.save_at(out_folder)
+            columnar.write(ds, out_folder)
     else:
         print('Already normalized')
 
@@ -0,0 +1,100 @@
+import os
+import json
+import click
+
+import numpy as np
+
+import instrument
+import ratios
+
+
+DEFAULT_MIN_RATES = 'none,1,2,3,4,5'
+DEFAULT_MAX_RATES = '15,17.5,20,22.5,25,27.5,30,35,40,none'
+
+
+def parse_rates(ctx, param, value):
+    try:
+        return [
+            None if x.strip().lower() == 'none' else float(x)
+            for x in value.split(',') if x.strip() != ''
+        ]
+    except ValueError:
+        raise click.BadParameter('Expected comma separated numbers or "none": {}'.format(value))
+
+
+def format_rate(rate):
+    return '-' if rate is None else '{:g}'.format(rate)
+
+
+@click.command()
+@click.argument('validation_folder', type=click.Path(exists=True))
+@click.option('--min', 'min_rates', default=DEFAULT_MIN_RATES, callback=parse_rates,
+              help='Min. characters per second to evaluate (comma separated, "none" for no limit).')
+@click.option('--max', 'max_rates', default=DEFAULT_MAX_RATES, callback=parse_rates,
+              help='Max. characters per second to evaluate (comma separated, "none" for no limit).')
+@click.option('--report', 'report_path', default=None, type=click.Path(),
+              help='Store the table as json at this path.')
+def run(validation_folder, min_rates, max_rates, report_path):
+    """
+    Show the rejected utterances/hours per corpus for all combinations
+    of min./max. characters per second, based on the characters and durations
+    collected by ``validate.py`` (``<corpus>/character_ratios.npz``).
+    """
+    instrument.start('ratio_sweep')
+
+    corpus_ratios = {}
+
+    with instrument.step('load') as step:
+        for name in sorted(os.listdir(validation_folder)):
+            ratios_path = os.path.join(validation_folder, name, 'character_ratios.npz')
+
+            if os.path.isfile(ratios_path):
+                corpus_ratios[name] = ratios.CharacterRatios.load(ratios_path)
+
+        step.items = sum(len(x.utt_ids) for x in corpus_ratios.values())
+
+    if len(corpus_ratios) <= 0:
+        raise click.ClickException('No character ratios found in {}'.format(validation_folder))
+
+    if len(corpus_ratios) > 1:
+        parts = list(corpus_ratios.values())
+        corpus_ratios['all'] = ratios.CharacterRatios(
+            [x for r in parts for x in r.utt_ids],
+            np.concatenate([r.num_chars for r in parts]),
+            np.concatenate([r.durations for r in parts]),
+            [x for r in parts for x in r.errors]
+        )
+
+    rows = []
+
+    with instrument.step('sweep', items=len(min_rates) * len(max_rates) * len(corpus_ratios)):
+        for name, corpus_ratio in corpus_ratios.items():
+            num_utterances = len(corpus_ratio.utt_ids)
+
+            for row in corpus_ratio.sweep(min_rates, max_rates):
+                row['corpus'] = name
+                row['rejected_share'] = row['rejected_utterances'] / num_utterances if num_utterances > 0 else 0.0
+                rows.append(row)
+
+    print('{:<14} {:>6} {:>6} {:>10} {:>8} {:>10} {:>7}'.format(
+        'corpus', 'min', 'max', 'rejected', 'share', 'hours', 'errors'
+    ))
+
+    for row in rows:
+        print('{:<14} {:>6} {:>6} {:>10} {:>7.2%} {:>10.2f} {:>7}'.format(
+            row['corpus'],
+            format_rate(row['min_characters_per_second']),
+            format_rate(row['max_characters_per_second']),
+            row['rejected_utterances'],
+            row['rejected_share'],
+            row['rejected_hours'],
+            row['errors']
+        ))
+
+    if report_path is not None:
+        with open(report_path, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,92 @@
+import os
+import wave
+import click
+
+from multiprocessing import pool
+
+import numpy as np
+from tqdm import tqdm
+
+import columnar
+import instrument
+import durations
+import shards
+
+
+SAMPLING_RATE = 16000
+
+
+def read_utterance(item):
+    """
+    Read the samples of an utterance from a 16 kHz / 16 bit mono wave file.
+    """
+    path, start, end = item
+
+    with wave.open(path, 'rb') as f:
+        if f.getframerate() != SAMPLING_RATE or f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise ValueError('{} is not a 16 kHz / 16 bit mono wave file'.format(path))
+
+        start_frame = int(round(start * SAMPLING_RATE))
+        f.setpos(start_frame)
+
+        if end == float('inf'):
+            num_frames = f.getnframes() - start_frame
+        else:
+            num_frames = int(round(end * SAMPLING_RATE)) - start_frame
+
+        data = f.readframes(num_frames)
+
+    return np.frombuffer(data, dtype='<i2')
+
+
+@click.command()
+@click.argument('wave_folder', type=click.Path(exists=True))
+@click.argument('out_folder', type=click.Path())
+@click.option('--shard-size', default=1024, type=int, help='Max. size of a shard in MB.')
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the shard writing and store the stats at this path.')
+def run(wave_folder, out_folder, shard_size, num_workers, profile_path):
+    """
+    Pack the utterances of the waverized corpus into large shards
+    of raw PCM (int16), which can be read with ``shards.ShardReader``.
+    Utterances are ordered by duration, so consecutive utterances
+    (and the utterances of a shard) have similar lengths.
+    """
+    instrument.start('shardify', profile_path=profile_path)
+
+    print('Load waverized corpus')
+
+    with instrument.step('load') as step:
+        cc = columnar.load(wave_folder)
+        index = durations.for_columnar(cc)
+        step.items = cc.num_utterances
+
+    order = np.argsort(index.durations_of(cc.utt_ids), kind='stable')
+    utt_ids = cc.utt_ids
+    track_paths = cc.track_paths
+
+    items = [
+        (track_paths[cc.utt_track[i]], float(cc.utt_start[i]), float(cc.utt_end[i]))
+        for i in order
+    ]
+
+    print('Write shards')
+    writer = shards.ShardWriter(
+        out_folder,
+        sampling_rate=SAMPLING_RATE,
+        max_shard_size=shard_size * 1024 * 1024
+    )
+
+    with instrument.step('write', items=len(items), hot=True):
+        with pool.ThreadPool(num_workers) as p:
+            samples_iter = p.imap(read_utterance, items, chunksize=64)
+
+            for i, samples in tqdm(zip(order, samples_iter), total=len(items)):
+                writer.add(utt_ids[i], samples)
+
+        writer.close()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,150 @@
+import click
+
+import numpy as np
+
+import bitsets
+import columnar
+import durations
+import instrument
+import splits
+
+
+SEED = 3294
+
+# Prefix of the subviews containing all utterances of a source corpus
+CORPUS_SUBVIEW_PREFIX = 'full_'
+
+
+def corpus_groups(cc, candidates):
+    """
+    Return the source corpus of every candidate utterance (as positions),
+    based on the ``full_<corpus>`` subviews created by ``merge_and_subset.py``.
+    Utterances without a corpus subview are in the group ``other``.
+
+    Returns:
+        dict: Positions of the candidates by corpus name.
+    """
+    groups = {}
+    assigned = np.zeros(len(candidates.ordinals), dtype=bool)
+
+    for name in cc.subview_names:
+        if name.startswith(CORPUS_SUBVIEW_PREFIX):
+            mask = cc.subview_bitset(name).mask & candidates.mask & ~assigned
+            groups[name[len(CORPUS_SUBVIEW_PREFIX):]] = np.nonzero(mask)[0]
+            assigned |= mask
+
+    rest = candidates.mask & ~assigned
+
+    if rest.any():
+        groups['other'] = np.nonzero(rest)[0]
+
+    return groups
+
+
+def carve(groups, utt_speakers, utt_durations, hours, seed):
+    """
+    Select utterances with a total duration of ``hours``.
+    Every corpus gets the same share of the subset as of the candidates
+    and the utterances of a corpus are taken alternating between the speakers
+    (see :func:`splits.interleaved_order`).
+    With the same seed, a smaller subset is contained in a larger one.
+
+    Returns:
+        np.ndarray: Positions of the selected utterances.
+    """
+    total = sum(float(np.sum(utt_durations[x])) for x in groups.values())
+    selected = []
+
+    for name in sorted(groups.keys()):
+        positions = groups[name]
+        corpus_duration = float(np.sum(utt_durations[positions]))
+        target = hours * 3600 * corpus_duration / total
+        order = positions[splits.interleaved_order(utt_speakers[positions], seed)]
+        selected.append(splits.take_duration(order, utt_durations, target))
+
+    return np.concatenate(selected) if len(selected) > 0 else np.zeros(0, dtype=np.int64)
+
+
+@click.command()
+@click.argument('corpus_folder', type=click.Path(exists=True))
+@click.option('--hours', '-s', 'sizes', multiple=True, type=float, required=True,
+              help='Size of a subset in hours (can be given multiple times).')
+@click.option('--source', default='train',
+              help='Subview the subsets are taken from.')
+@click.option('--name', 'name_pattern', default='{source}_{hours}h',
+              help='Name of the subviews, with the placeholders {source} and {hours}.')
+@click.option('--seed', default=SEED, type=int)
+@click.option('--nested/--independent', default=True,
+              help='nested: Every subset is contained in the next larger one. '
+                   'independent: Every subset is drawn with another seed.')
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the selection and store the stats at this path.')
+def run(corpus_folder, sizes, source, name_pattern, seed, nested, profile_path):
+    """
+    Create subsets of the given hours from a subview (``train`` by default)
+    of the merged corpus and add them as subviews
+    (e.g. ``subview_train_10h.txt``) to the corpus and its columnar cache.
+
+    Every source corpus has the same share in a subset as in the source subview
+    and within a corpus as many speakers as possible are included.
+    """
+    instrument.start('subset', profile_path=profile_path)
+
+    with instrument.step('load') as step:
+        cc = columnar.load(corpus_folder)
+        index = durations.for_columnar(cc)
+        step.items = cc.num_utterances
+
+    if source not in cc.subview_names:
+        raise click.ClickException('Subview {} does not exist'.format(source))
+
+    utt_durations = index.durations_of(cc.utt_ids)
+    candidates = cc.subview_bitset(source)
+    unknown = candidates.mask & np.isnan(utt_durations)
+
+    if unknown.any():
+        print('Ignore {} utterances with unknown duration'.format(int(np.count_nonzero(unknown))))
+        candidates = bitsets.UtteranceBitset.from_mask(cc.ordinals, candidates.mask & ~unknown)
+
+    # Utterances without issuer are treated as separate speakers
+    utt_issuer = np.asarray(cc.utt_issuer, dtype=np.int64)
+    utt_speakers = np.where(
+        utt_issuer >= 0,
+        utt_issuer,
+        cc.num_issuers + np.arange(cc.num_utterances)
+    )
+
+    groups = corpus_groups(cc, candidates)
+    available = float(np.sum(utt_durations[candidates.mask])) / 3600
+    subviews = {}
+
+    with instrument.step('carve', items=len(sizes), hot=True):
+        for i, hours in enumerate(sorted(sizes)):
+            name = name_pattern.format(source=source, hours='{:g}'.format(hours))
+
+            if hours > available:
+                print('{}: Only {:.2f} of {:g} hours available'.format(name, available, hours))
+
+            positions = carve(groups, utt_speakers, utt_durations, hours, seed if nested else seed + i)
+            mask = np.zeros(cc.num_utterances, dtype=bool)
+            mask[positions] = True
+            subviews[name] = bitsets.UtteranceBitset.from_mask(cc.ordinals, mask)
+
+            corpus_hours = ', '.join(
+                '{} {:.2f} h'.format(c, float(np.sum(utt_durations[g[mask[g]]])) / 3600)
+                for c, g in sorted(groups.items())
+            )
+            print('{}: {:.2f} h, {} utterances, {} speakers ({})'.format(
+                name,
+                float(np.sum(utt_durations[mask])) / 3600,
+                len(positions),
+                len(np.unique(utt_speakers[mask])),
+                corpus_hours
+            ))
+
+    with instrument.step('save', items=len(subviews)):
+        columnar.add_subviews(corpus_folder, subviews)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,36 @@
+import os
+import click
+
+import instrument
+import synthetic
+
+
+@click.command()
+@click.argument('download_folder', type=click.Path())
+@click.option('--num-utterances', '-n', default=1000, type=int,
+              help='Total number of utterances of all corpora.')
+@click.option('--seed', default=0, type=int)
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the generation and store the stats at this path.')
+def run(download_folder, num_utterances, seed, profile_path):
+    """
+    Create synthetic corpora (tiny audio files, transcripts, issuers, subviews)
+    in audiomate's default format, with the same layout as the download folder.
+    They can be processed with ``--corpus-format default``
+    by ``merge_and_subset.py`` and ``validate.py``.
+    """
+    instrument.start('synthesize', profile_path=profile_path)
+
+    for name in synthetic.CORPUS_SHARES.keys():
+        if os.path.exists(os.path.join(download_folder, name)):
+            raise click.ClickException('{} already exists in {}'.format(name, download_folder))
+
+    with instrument.step('generate', items=num_utterances, hot=True):
+        counts = synthetic.generate_corpora(download_folder, num_utterances, seed=seed)
+
+    for name, count in sorted(counts.items()):
+        print('{}: {} utterances'.format(name, count))
+
+
+if __name__ == '__main__':
+    run()
@@ -1,17 +1,51 @@
 import os
 import click
 import json
+import multiprocessing
+
+from multiprocessing import connection
 
 import audiomate
-from audiomate.corpus import validation
 
+import instrument
 import validators
 
 
+MAX_CHARS_PER_SECOND = 25
+
+
 @click.command()
 @click.argument('download_folder', type=click.Path(exists=True))
 @click.argument('output_folder', type=click.Path())
-def run(download_folder, output_folder):
+@click.option('--corpus', 'corpus_filter', multiple=True,
+              help='Only validate the given corpora.')
+@click.option('--full-decode', is_flag=True,
+              help='Decode the tracks completely, instead of checking the header '
+                   'and reading the first samples.')
+@click.option('--num-workers', default=None, type=int,
+              help='Number of processes per corpus '
+                   '(default: the cpus divided by the number of concurrent corpora).')
+@click.option('--num-jobs', default=None, type=int,
+              help='Number of corpora validated concurrently (default: all).')
+@click.option('--corpus-format', default='native', type=click.Choice(['native', 'default']),
+              help='native: Load the corpora with their own readers. '
+                   'default: Load the corpora in audiomate\'s default format '
+                   '(e.g. synthetic corpora from synthesize.py).')
+@click.option('--min-chars-per-second', default=None, type=float,
+              help='Utterances with less characters per second are invalid.')
+@click.option('--max-chars-per-second', default=MAX_CHARS_PER_SECOND, type=float,
+              help='Utterances with more characters per second are invalid.')
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the track validation and store the stats '
+                   'at this path (suffixed with the corpus name).')
+def run(download_folder, output_folder, corpus_filter, full_decode, num_workers, num_jobs,
+        corpus_format, min_chars_per_second, max_chars_per_second, profile_path):
+    """
+    Validate the corpora in ``download_folder``.
+    The corpora are validated concurrently, each in its own process.
+    """
+    instrument.start('validate')
+
     corpora_names = [
         ('voxforge', 'voxforge'),
         ('common_voice', 'common-voice'),
@@ -20,88 +54,162 @@ def run(download_folder, output_folder):
         ('tuda', 'tuda'),
     ]
 
-    for name, reader_type in corpora_names:
-        print('Run validation for {}'.format(name))
-        full_path = os.path.join(download_folder, name)
-        out_path = os.path.join(output_folder, name)
-        c = audiomate.Corpus.load(
-            full_path,
-            reader=reader_type,
-            include_invalid_items=True
-        )
-
-        run_validation(c, out_path)
-        print('-'*40)
-
-
-def run_validation(corpus, output_path):
+    if len(corpus_filter) > 0:
+        corpora_names = [x for x in corpora_names if x[0] in corpus_filter]
+
+    if corpus_format == 'default':
+        corpora_names = [(name, 'default') for name, _ in corpora_names]
+
+    if num_jobs is None:
+        num_jobs = len(corpora_names)
+
+    if num_workers is None:
+        # Share the cpus between the corpora validated concurrently
+        num_workers = max(1, os.cpu_count() // max(1, min(num_jobs, len(corpora_names))))
+
+    pending = list(corpora_names)
+    running = {}
+    failed = []
+
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < num_jobs:
+            name, reader_type = pending.pop(0)
+            p = multiprocessing.Process(
+                target=validate_corpus,
+                args=(name, reader_type, download_folder, output_folder,
+                      full_decode, num_workers, (min_chars_per_second, max_chars_per_second),
+                      profile_path),
+                name=name
+            )
+            p.start()
+            running[p.sentinel] = p
+
+        for sentinel in connection.wait(list(running.keys())):
+            p = running.pop(sentinel)
+            p.join()
+
+            if p.exitcode != 0:
+                failed.append(p.name)
+
+            print('Validation for {} finished ({} running, {} pending)'.format(
+                p.name, len(running), len(pending)
+            ))
+
+    if len(failed) > 0:
+        raise click.ClickException('Validation failed for {}'.format(', '.join(failed)))
+
+
+def validate_corpus(name, reader_type, download_folder, output_folder,
+                    full_decode, num_workers, ratio_limits=(None, MAX_CHARS_PER_SECOND),
+                    profile_path=None):
+    if profile_path is not None:
+        profile_path = '{}.{}'.format(profile_path, name)
+
+    instrument.start('validate/{}'.format(name), profile_path=profile_path)
+
+    print('Run validation for {}'.format(name))
+    full_path = os.path.join(download_folder, name)
+    out_path = os.path.join(output_folder, name)
+
+    try:
+        with instrument.step('load') as step:
+            c = audiomate.Corpus.load(
+                full_path,
+                reader=reader_type,
+                include_invalid_items=True
+            )
+            step.items = c.num_utterances
+
+        run_validation(c, out_path, full_decode=full_decode, num_workers=num_workers,
+                       ratio_limits=ratio_limits)
+    finally:
+        # The process exits without running the exit handlers
+        instrument.finish()
+
+
+def run_validation(corpus, output_path, full_decode=False, num_workers=4,
+                   ratio_limits=(None, MAX_CHARS_PER_SECOND)):
     os.makedirs(output_path, exist_ok=True)
 
     all_invalid = set()
 
-    utts = find_invalid_audio_tracks(output_path, corpus)
-    all_invalid.update(utts)
+    # Single pass over the audio, the durations are used for the character ratio
+    with instrument.step('tracks', items=corpus.num_tracks, hot=True):
+        utts, track_durations = find_invalid_audio_tracks(
+            output_path, corpus, full_decode, num_workers
+        )
+        all_invalid.update(utts)
 
-    utts = find_invalid_character_ratios(output_path, corpus)
-    all_invalid.update(utts)
+    with instrument.step('character_ratio', items=corpus.num_utterances):
+        utts = find_invalid_character_ratios(output_path, corpus, track_durations, ratio_limits)
+        all_invalid.update(utts)
 
-    utts = find_invalid_transcripts(output_path, corpus)
-    all_invalid.update(utts)
+    with instrument.step('transcripts', items=corpus.num_utterances):
+        utts = find_invalid_transcripts(output_path, corpus, num_workers)
+        all_invalid.update(utts)
 
     all_report_path = os.path.join(output_path, 'invalid_all.json')
     write_report(all_report_path, sorted(all_invalid))
 
 
-def find_invalid_audio_tracks(output_path, corpus):
+def find_invalid_audio_tracks(output_path, corpus, full_decode, num_workers):
     #
     # Find invalid audio tracks
+    # (results are cached per file, only new or changed files are checked)
+    # Returns the invalid utterances and the durations of all tracks
     #
 
     report_path = os.path.join(output_path, 'invalid_tracks.json')
+    cache_path = os.path.join(output_path, 'track_cache.json')
 
-    if not os.path.isfile(report_path):
-        print('Validate tracks ...')
-        v = validation.TrackReadValidator(num_workers=4)
-        result = v.validate(corpus)
-        invalid_tracks = result.invalid_items
-        write_report(report_path, invalid_tracks)
-    else:
-        invalid_tracks = read_report(report_path)
-        print('Validate tracks - Already done')
+    print('Validate tracks ...')
+    v = validators.TrackValidator(
+        cache_path=cache_path,
+        num_workers=num_workers,
+        full_decode=full_decode
+    )
+    result = v.validate(corpus)
+    invalid_tracks = result.invalid_items
+    write_report(report_path, invalid_tracks)
+
+    for key, value in result.info.items():
+        print('{}: {}'.format(key, value))
 
     invalid_utts = []
 
     for utt in corpus.utterances.values():
-        if utt.track in invalid_tracks:
+        if utt.track.idx in invalid_tracks:
             invalid_utts.append(utt.idx)
 
-    return invalid_utts
+    return invalid_utts, v.track_durations
 
 
-def find_invalid_character_ratios(output_path, corpus):
+def find_invalid_character_ratios(output_path, corpus, track_durations, ratio_limits):
     #
     # Find invalid chracter ratios
+    # (the characters and durations are collected again on every run,
+    # since transcripts and tracks may have changed, and stored in
+    # character_ratios.npz for ratio_sweep.py)
     #
     report_path = os.path.join(output_path, 'invalid_character_ratio.json')
-
-    if not os.path.isfile(report_path):
-        print('Validate character ratio ...')
-        v = validation.UtteranceTranscriptionRatioValidator(
-            max_characters_per_second=25,
-            label_list_idx=audiomate.corpus.LL_WORD_TRANSCRIPT,
-            num_threads=4
-        )
-        result = v.validate(corpus)
-        invalid_utts = result.invalid_items
-        write_report(report_path, invalid_utts)
-    else:
-        invalid_utts = read_report(report_path)
-        print('Validate character ratio - Already done')
+    ratios_path = os.path.join(output_path, 'character_ratios.npz')
+
+    print('Validate character ratio ...')
+    v = validators.CharacterRatioValidator(
+        track_durations,
+        min_characters_per_second=ratio_limits[0],
+        max_characters_per_second=ratio_limits[1],
+        label_list_idx=audiomate.corpus.LL_WORD_TRANSCRIPT
+    )
+    result = v.validate(corpus)
+    invalid_utts = result.invalid_items
+    write_report(report_path, invalid_utts)
+    v.ratios.save(ratios_path)
 
     return invalid_utts.keys()
 
 
-def find_invalid_transcripts(output_path, corpus):
+def find_invalid_transcripts(output_path, corpus, num_workers):
     #
     # Find transcripts that can't be normalized
     #
@@ -109,7 +217,7 @@ def find_invalid_transcripts(output_path, corpus):
 
     if not os.path.isfile(report_path):
         print('Validate transcript normalization ...')
-        v = validators.TextNormalizationValidator()
+        v = validators.TextNormalizationValidator(num_workers=num_workers)
         result = v.validate(corpus)
         invalid_utts = result.invalid_items
         write_report(report_path, invalid_utts)
@@ -1,33 +1,147 @@
+import json
 import os
 import click
 
 import audiomate
-from audiomate.corpus import conversion
+
+import buckets
+import columnar
+import durations
+import instrument
+import wavconvert
+
+
+SEED = 3294
+
+
+def parse_boundaries(ctx, param, value):
+    if value is None:
+        return None
+
+    try:
+        return buckets.parse_boundaries(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def write_bucketed_manifests(cc, out_folder, utt_durations, boundaries, batch_size, seed):
+    """
+    Write a manifest (json lines with path, duration and transcript) of all utterances
+    and of every subview of the converted corpus (:class:`columnar.ColumnarCorpus`)
+    to ``<out_folder>/manifests``, ordered by duration bucket and shuffled within the buckets.
+    The statistics of the buckets are written to ``buckets.json``.
+    """
+    manifest_folder = os.path.join(out_folder, 'manifests')
+    os.makedirs(manifest_folder, exist_ok=True)
+
+    utt_paths = [cc.track_paths[i] for i in cc.utt_track.tolist()]
+    transcripts = cc.transcripts(audiomate.corpus.LL_WORD_TRANSCRIPT)
+    subview_masks = [
+        (name, cc.subview_bitset(name).mask)
+        for name in cc.subview_names
+    ]
+
+    order, bucket_ids = buckets.bucketed_order(utt_durations, boundaries, seed)
+    buckets.write_stats(
+        os.path.join(out_folder, 'buckets.json'),
+        utt_durations, order, bucket_ids, subview_masks,
+        boundaries, batch_size, seed
+    )
+
+    files = {'all': open(os.path.join(manifest_folder, 'all.jsonl'), 'w')}
+
+    for name, _ in subview_masks:
+        files[name] = open(os.path.join(manifest_folder, '{}.jsonl'.format(name)), 'w')
+
+    for i in order.tolist():
+        record = json.dumps({
+            'utt_idx': cc.utt_ids[i],
+            'path': os.path.relpath(utt_paths[i], out_folder),
+            'duration': float(utt_durations[i]),
+            'transcript': transcripts[i],
+        }) + '\n'
+
+        files['all'].write(record)
+
+        for name, mask in subview_masks:
+            if mask[i]:
+                files[name].write(record)
+
+    for f in files.values():
+        f.close()
 
 
 @click.command()
 @click.argument('full_folder', type=click.Path())
 @click.argument('out_folder', type=click.Path())
-def run(full_folder, out_folder):
-    if not os.path.exists(out_folder):
-        converter = conversion.WavAudioFileConverter(
-            num_workers=8,
-            sampling_rate=16000,
-            separate_file_per_utterance=True,
-            force_conversion=False
-        )
-
-        target_audio_path = os.path.join(out_folder, 'audio')
-        os.makedirs(target_audio_path)
-
-        print('Load source corpus')
-        ds = audiomate.Corpus.load(full_folder)
-        print('Convert')
+@click.option('--num-workers', default=os.cpu_count(), type=int)
+@click.option('--decode-per-utterance', is_flag=True,
+              help='Decode the source of every utterance separately, '
+                   'instead of decoding a track once for all its utterances.')
+@click.option('--bucket-boundaries', default=None, callback=parse_boundaries,
+              help='Comma separated bucket boundaries in seconds (e.g. 2,4,6,8,10,15,20). '
+                   'If given, training manifests bucketed by duration are written.')
+@click.option('--batch-size', default=buckets.DEFAULT_BATCH_SIZE, type=int,
+              help='Batch size for the padding ratio in the bucket statistics.')
+@click.option('--seed', default=SEED, type=int,
+              help='Seed for shuffling the buckets.')
+@click.option('--profile', 'profile_path', default=None, type=click.Path(),
+              help='Profile the conversion and store the stats at this path.')
+def run(full_folder, out_folder, num_workers, decode_per_utterance,
+        bucket_boundaries, batch_size, seed, profile_path):
+    """
+    Convert the corpus to 16 kHz wave files, one per utterance.
+    Already converted utterances are only converted again,
+    if their source audio or segment changed
+    (see ``waverize_manifest.jsonl`` in the output folder).
+
+    With ``--bucket-boundaries`` manifests ordered by duration bucket
+    are written to ``manifests`` in the output folder (see :func:`write_bucketed_manifests`).
+    The durations are taken from the duration index of the source corpus.
+    """
+    instrument.start('waverize', profile_path=profile_path)
+
+    target_audio_path = os.path.join(out_folder, 'audio')
+    manifest_path = os.path.join(out_folder, 'waverize_manifest.jsonl')
+    os.makedirs(target_audio_path, exist_ok=True)
+
+    converter = wavconvert.ResumableWavAudioFileConverter(
+        manifest_path,
+        num_workers=num_workers,
+        group_by_track=not decode_per_utterance,
+        sampling_rate=16000,
+        separate_file_per_utterance=True,
+        force_conversion=False
+    )
+
+    print('Load source corpus')
+
+    with instrument.step('load') as step:
+        source = columnar.load(full_folder)
+        ds = source.to_corpus()
+        step.items = ds.num_utterances
+
+    print('Convert')
+
+    with instrument.step('convert', items=ds.num_utterances, hot=True):
         waverized_ds = converter.convert(ds, target_audio_path)
-        print('Save converted corpus')
+
+    print('Save converted corpus')
+
+    with instrument.step('save', items=ds.num_utterances):
         waverized_ds.save_at(out_folder)
-    else:
-        print('Already waverized')
+        columnar.write(waverized_ds, out_folder)
+
+    if bucket_boundaries is not None:
+        print('Write bucketed manifests')
+
+        with instrument.step('manifests', items=ds.num_utterances):
+            # Utterances keep their ids and segments, so the durations of the source are used
+            out_cc = columnar.load(out_folder)
+            utt_durations = durations.for_columnar(source).durations_of(out_cc.utt_ids)
+            write_bucketed_manifests(
+                out_cc, out_folder, utt_durations, bucket_boundaries, batch_size, seed
+            )
 
 
 if __name__ == '__main__':
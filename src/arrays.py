@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def encode_strings(values):
+    """
+    Encode a list of strings as a single UTF-8 blob and offsets.
+    This is much more compact than a fixed-width unicode array
+    and can be memory-mapped.
+
+    Returns:
+        tuple: (blob (np.uint8), offsets (np.int64) with ``len(values) + 1`` items)
+    """
+    encoded = [v.encode('utf-8') for v in values]
+    lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def decode_strings(blob, offsets):
+    """
+    Decode the strings encoded with :func:`encode_strings`.
+    """
+    data = bytes(blob)
+    offsets = offsets.tolist()
+
+    return [
+        data[offsets[i]:offsets[i + 1]].decode('utf-8')
+        for i in range(len(offsets) - 1)
+    ]
+
+
+def decode_string(blob, offsets, index):
+    """
+    Decode a single string encoded with :func:`encode_strings`.
+    """
+    start = int(offsets[index])
+    end = int(offsets[index + 1])
+    return bytes(blob[start:end]).decode('utf-8')
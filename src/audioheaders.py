@@ -0,0 +1,145 @@
+import os
+import struct
+
+
+# Results of a header check
+HEADER_OK = 'ok'
+HEADER_INVALID = 'invalid'
+# The header doesn't allow a decision (unknown format, unusual layout,
+# or a format whose header doesn't prove that audio data is present)
+HEADER_UNCERTAIN = 'uncertain'
+
+# Version of the checks, cached results of other versions are checked again
+HEADER_VERSION = 2
+
+# Number of bytes read from the start of a file
+PREFIX_SIZE = 64 * 1024
+
+
+def check_header(path):
+    """
+    Check the container/header of an audio file, without decoding any audio.
+    Only wav (data chunk) and flac (STREAMINFO) files can be ``HEADER_OK``.
+    Mp3 and ogg files are at most ``HEADER_UNCERTAIN``, since a truncated
+    or empty file still starts with a valid header/frame.
+
+    Returns:
+        tuple: (result, message), where result is one of
+               ``HEADER_OK``, ``HEADER_INVALID`` or ``HEADER_UNCERTAIN``.
+    """
+    try:
+        size = os.path.getsize(path)
+
+        if size == 0:
+            return HEADER_INVALID, 'Header: empty file'
+
+        with open(path, 'rb') as f:
+            prefix = f.read(PREFIX_SIZE)
+
+            if prefix[:4] == b'RIFF' and prefix[8:12] == b'WAVE':
+                return _check_wav(f, size)
+    except OSError as ex:
+        return HEADER_INVALID, 'Header: {}'.format(ex)
+
+    if prefix[:4] == b'fLaC':
+        return _check_flac(prefix)
+    elif prefix[:4] == b'OggS':
+        return HEADER_UNCERTAIN, None
+    elif prefix[:3] == b'ID3' or _is_mp3_sync(prefix, 0):
+        return _check_mp3(prefix)
+
+    return HEADER_UNCERTAIN, None
+
+
+def _check_wav(f, size):
+    """ Walk the chunks of a RIFF/WAVE file. """
+    fmt = None
+    data_size = None
+    pos = 12
+
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+
+        if chunk_id == b'fmt ':
+            fmt_data = f.read(min(chunk_size, 16))
+
+            if len(fmt_data) < 16:
+                return HEADER_INVALID, 'Header: incomplete fmt chunk'
+
+            fmt = struct.unpack('<HHIIHH', fmt_data)
+        elif chunk_id == b'data':
+            data_size = min(chunk_size, size - pos - 8)
+            break
+
+        # Chunks are aligned to 2 bytes
+        pos += 8 + chunk_size + (chunk_size % 2)
+
+    if fmt is None:
+        return HEADER_INVALID, 'Header: no fmt chunk'
+
+    if data_size is None:
+        return HEADER_INVALID, 'Header: no data chunk'
+
+    _, num_channels, sampling_rate, _, block_align, bits = fmt
+
+    if num_channels <= 0 or sampling_rate <= 0 or block_align <= 0 or bits <= 0:
+        return HEADER_INVALID, 'Header: invalid format ({} channels, {} Hz, {} bits)'.format(
+            num_channels, sampling_rate, bits
+        )
+
+    if data_size < block_align:
+        return HEADER_INVALID, 'Header: no audio data'
+
+    return HEADER_OK, None
+
+
+def _check_flac(prefix):
+    # STREAMINFO is the first metadata block
+    if len(prefix) < 4 + 4 + 34:
+        return HEADER_INVALID, 'Header: incomplete STREAMINFO'
+
+    info = prefix[8:8 + 34]
+    sampling_rate = (info[10] << 12) | (info[11] << 4) | (info[12] >> 4)
+    num_channels = ((info[12] >> 1) & 0x07) + 1
+
+    if sampling_rate == 0:
+        return HEADER_INVALID, 'Header: invalid sampling rate'
+
+    if num_channels <= 0:
+        return HEADER_INVALID, 'Header: invalid number of channels'
+
+    return HEADER_OK, None
+
+
+def _is_mp3_sync(data, pos):
+    return (
+        pos + 1 < len(data)
+        and data[pos] == 0xFF
+        and (data[pos + 1] & 0xE0) == 0xE0
+    )
+
+
+def _check_mp3(prefix):
+    """ Only detects broken ID3 tags, otherwise the result is uncertain. """
+    pos = 0
+
+    if prefix[:3] == b'ID3':
+        if len(prefix) < 10:
+            return HEADER_INVALID, 'Header: incomplete ID3 tag'
+
+        # Syncsafe integer (7 bits per byte)
+        tag_size = 0
+
+        for b in prefix[6:10]:
+            tag_size = (tag_size << 7) | (b & 0x7F)
+
+        pos = 10 + tag_size
+
+        if pos >= len(prefix):
+            # Large tag (e.g. cover image), frame is outside of the prefix
+            return HEADER_UNCERTAIN, None
+
+    # A frame (or padding before the first frame) doesn't prove,
+    # that the file contains decodable audio (e.g. truncated files)
+    return HEADER_UNCERTAIN, None
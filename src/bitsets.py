@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+
+from audiomate.corpus import subset
+
+
+SUBVIEW_FILE_PREFIX = 'subview'
+
+
+class UtteranceOrdinals(object):
+    """
+    Fixed list of utterance-ids, defining the position (ordinal)
+    of every utterance in the bitsets created from it.
+
+    Args:
+        utt_ids (list): The utterance-ids in the order of the corpus.
+    """
+
+    def __init__(self, utt_ids):
+        self.utt_ids = list(utt_ids)
+        self.ordinals = {idx: i for i, idx in enumerate(self.utt_ids)}
+        self._sorted_order = None
+        self._positions_cache = (None, None)
+
+    def __len__(self):
+        return len(self.utt_ids)
+
+    @classmethod
+    def of_corpus(cls, corpus):
+        return cls(corpus.utterances.keys())
+
+    @property
+    def sorted_order(self):
+        """
+        Ordinals sorted by the utterance-id,
+        so the ids of a bitset can be listed sorted without sorting the strings again.
+        """
+        if self._sorted_order is None:
+            order = sorted(range(len(self.utt_ids)), key=self.utt_ids.__getitem__)
+            self._sorted_order = np.array(order, dtype=np.int64)
+
+        return self._sorted_order
+
+    def positions_in(self, other):
+        """
+        Return the ordinal in ``other`` of every utterance of these ordinals.
+        The result is cached, since usually many bitsets are moved at once.
+        """
+        if self._positions_cache[0] is not other:
+            positions = np.array([other.ordinals[x] for x in self.utt_ids], dtype=np.int64)
+            self._positions_cache = (other, positions)
+
+        return self._positions_cache[1]
+
+    def empty(self):
+        return UtteranceBitset.from_mask(self, np.zeros(len(self), dtype=bool))
+
+    def full(self):
+        return UtteranceBitset.from_mask(self, np.ones(len(self), dtype=bool))
+
+    def bitset(self, utt_ids):
+        """
+        Create a bitset containing the given utterance-ids.
+        Ids that are not in the corpus are ignored.
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        ordinals = [self.ordinals[x] for x in utt_ids if x in self.ordinals]
+        mask[ordinals] = True
+        return UtteranceBitset.from_mask(self, mask)
+
+
+class UtteranceBitset(object):
+    """
+    Set of utterances stored as bitmap (one bit per utterance)
+    over the ordinals of an :class:`UtteranceOrdinals`.
+    Set operations are only possible between bitsets
+    with the same ordinals.
+
+    Args:
+        ordinals (UtteranceOrdinals): The ordinals.
+        bits (np.ndarray): Packed bits (``np.packbits``).
+    """
+
+    def __init__(self, ordinals, bits):
+        self.ordinals = ordinals
+        self.bits = bits
+
+    @classmethod
+    def from_mask(cls, ordinals, mask):
+        return cls(ordinals, np.packbits(mask))
+
+    @property
+    def mask(self):
+        return np.unpackbits(self.bits)[:len(self.ordinals)].astype(bool)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def _check_compatible(self, other):
+        if self.ordinals is not other.ordinals:
+            raise ValueError('Bitsets are based on different ordinals')
+
+    def __or__(self, other):
+        self._check_compatible(other)
+        return UtteranceBitset(self.ordinals, self.bits | other.bits)
+
+    def __and__(self, other):
+        self._check_compatible(other)
+        return UtteranceBitset(self.ordinals, self.bits & other.bits)
+
+    def __sub__(self, other):
+        self._check_compatible(other)
+        return UtteranceBitset(self.ordinals, self.bits & ~other.bits)
+
+    def ids(self):
+        """ Return the utterance-ids in the order of the ordinals. """
+        utt_ids = self.ordinals.utt_ids
+        return [utt_ids[i] for i in np.nonzero(self.mask)[0]]
+
+    def sorted_ids(self):
+        """ Return the utterance-ids sorted by id. """
+        order = self.ordinals.sorted_order
+        utt_ids = self.ordinals.utt_ids
+        return [utt_ids[i] for i in order[self.mask[order]]]
+
+    def embed(self, ordinals, offset):
+        """
+        Return the bitset moved into other (larger) ordinals.
+        The utterances of this bitset are expected at ``offset``
+        in the other ordinals, e.g. when corpora are merged.
+        """
+        mask = np.zeros(len(ordinals), dtype=bool)
+        mask[offset:offset + len(self.ordinals)] = self.mask
+        return UtteranceBitset.from_mask(ordinals, mask)
+
+    def reordered(self, ordinals):
+        """
+        Return the bitset over other ordinals containing the same utterances,
+        e.g. after the utterances were sorted.
+        All utterances of this bitset have to exist in the other ordinals.
+        """
+        if ordinals is self.ordinals:
+            return self
+
+        positions = self.ordinals.positions_in(ordinals)
+        mask = np.zeros(len(ordinals), dtype=bool)
+        mask[positions[self.mask]] = True
+        return UtteranceBitset.from_mask(ordinals, mask)
+
+    def to_subview(self, corpus):
+        """ Return an audiomate subview of the utterances in the bitset. """
+        id_filter = subset.MatchingUtteranceIdxFilter(self.ids())
+        return subset.Subview(corpus, filter_criteria=[id_filter])
+
+    def serialize(self):
+        """
+        Return the same string as the serialization of
+        a subview with a single ``MatchingUtteranceIdxFilter``.
+        """
+        return '{}\ninclude,{}'.format(
+            subset.MatchingUtteranceIdxFilter.name(),
+            ','.join(self.sorted_ids())
+        )
+
+    def write_subview(self, corpus_path, name):
+        """
+        Write the bitset as subview file into the corpus at the given path,
+        as audiomate's default writer would do.
+        """
+        sv_path = os.path.join(corpus_path, '{}_{}.txt'.format(SUBVIEW_FILE_PREFIX, name))
+
+        with open(sv_path, 'w') as f:
+            f.write(self.serialize())
@@ -0,0 +1,185 @@
+import json
+
+import numpy as np
+
+
+# Batch size the padding ratio is computed for
+DEFAULT_BATCH_SIZE = 32
+
+
+def parse_boundaries(value):
+    """
+    Parse comma separated bucket boundaries in seconds (e.g. ``2,4,8,16``).
+
+    Returns:
+        list: The boundaries as floats (strictly increasing).
+    """
+    try:
+        boundaries = [float(x) for x in value.split(',') if x.strip() != '']
+    except ValueError:
+        raise ValueError('Invalid bucket boundaries: {}'.format(value))
+
+    if len(boundaries) == 0:
+        raise ValueError('No bucket boundaries given')
+
+    if boundaries[0] <= 0 or any(a >= b for a, b in zip(boundaries[:-1], boundaries[1:])):
+        raise ValueError('Bucket boundaries have to be positive and increasing: {}'.format(value))
+
+    return boundaries
+
+
+def assign(durations, boundaries):
+    """
+    Return the bucket of every duration.
+    Bucket ``i`` contains the durations in ``[boundaries[i-1], boundaries[i])``.
+    Unknown durations (``nan``) are assigned to the last bucket.
+    """
+    return np.searchsorted(np.asarray(boundaries, dtype=np.float64), durations, side='right')
+
+
+def bucketed_order(durations, boundaries, seed):
+    """
+    Return the order of the utterances for a bucketed manifest.
+    The buckets are ordered by duration (shortest first),
+    within a bucket the utterances are shuffled with the given seed.
+
+    Args:
+        durations (np.ndarray): Duration of every utterance.
+        boundaries (list): Bucket boundaries in seconds.
+        seed (int): Seed for shuffling the buckets.
+
+    Returns:
+        tuple: Positions of the utterances in manifest order
+               and the bucket of every utterance.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    bucket_ids = assign(durations, boundaries)
+    rng = np.random.RandomState(seed)
+
+    # Shuffling starts from a defined order (sorted by duration),
+    # so the result doesn't depend on the order of the utterances in the corpus
+    by_duration = np.argsort(durations, kind='stable')
+    parts = []
+
+    for bucket in range(len(boundaries) + 1):
+        members = by_duration[bucket_ids[by_duration] == bucket]
+        rng.shuffle(members)
+        parts.append(members)
+
+    return np.concatenate(parts).astype(np.int64), bucket_ids
+
+
+def padding_ratio(durations, batch_size):
+    """
+    Return the share of padding, if the durations (in the given order)
+    are split into consecutive batches of ``batch_size``
+    and every utterance is padded to the longest one of its batch.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+
+    if len(durations) == 0:
+        return 0.0
+
+    num_batches = (len(durations) + batch_size - 1) // batch_size
+    padded = np.zeros(num_batches * batch_size, dtype=np.float64)
+    padded[:len(durations)] = durations
+    batch_max = padded.reshape(num_batches, batch_size).max(axis=1)
+    batch_sizes = np.full(num_batches, batch_size, dtype=np.int64)
+    batch_sizes[-1] = len(durations) - (num_batches - 1) * batch_size
+
+    total = float(np.sum(batch_max * batch_sizes))
+
+    if total <= 0:
+        return 0.0
+
+    return (total - float(np.sum(durations))) / total
+
+
+def bucket_stats(durations, bucket_ids, boundaries, batch_size, seed):
+    """
+    Return the statistics of the buckets of a manifest.
+    The padding ratio is computed for batches within the buckets
+    and for comparison for batches of the shuffled (unbucketed) manifest.
+    Utterances with unknown duration are only counted.
+
+    Args:
+        durations (np.ndarray): Duration of the utterances in manifest order.
+        bucket_ids (np.ndarray): Bucket of the utterances in manifest order.
+        boundaries (list): Bucket boundaries in seconds.
+        batch_size (int): Batch size for the padding ratio.
+        seed (int): Seed for shuffling the unbucketed manifest.
+
+    Returns:
+        dict: The statistics.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    known = ~np.isnan(durations)
+    num_unknown = int(len(durations) - np.count_nonzero(known))
+    durations = durations[known]
+    bucket_ids = np.asarray(bucket_ids)[known]
+    lower = [0.0] + list(boundaries)
+    upper = list(boundaries) + [None]
+    buckets = []
+    padded_total = 0.0
+
+    for bucket in range(len(boundaries) + 1):
+        bucket_durations = durations[bucket_ids == bucket]
+        ratio = padding_ratio(bucket_durations, batch_size)
+        seconds = float(np.sum(bucket_durations))
+
+        if ratio < 1:
+            padded_total += seconds / (1 - ratio)
+
+        buckets.append({
+            'min_duration': lower[bucket],
+            'max_duration': upper[bucket],
+            'count': int(len(bucket_durations)),
+            'hours': seconds / 3600,
+            'padding_ratio': ratio,
+        })
+
+    total = float(np.sum(durations))
+    shuffled = durations[np.random.RandomState(seed).permutation(len(durations))]
+
+    return {
+        'batch_size': batch_size,
+        'count': int(len(durations)),
+        'num_unknown_duration': num_unknown,
+        'hours': total / 3600,
+        'padding_ratio': (padded_total - total) / padded_total if padded_total > 0 else 0.0,
+        'unbucketed_padding_ratio': padding_ratio(shuffled, batch_size),
+        'buckets': buckets,
+    }
+
+
+def write_stats(path, durations, order, bucket_ids, subview_masks, boundaries, batch_size, seed):
+    """
+    Write the bucket statistics of the manifest of all utterances
+    and of every subview as json.
+
+    Args:
+        path (str): Path of the json file.
+        durations (np.ndarray): Duration of every utterance.
+        order (np.ndarray): Positions of the utterances in manifest order.
+        bucket_ids (np.ndarray): Bucket of every utterance.
+        subview_masks (list): Tuples of subview name and mask over the utterances.
+        boundaries (list): Bucket boundaries in seconds.
+        batch_size (int): Batch size for the padding ratio.
+        seed (int): Seed the buckets were shuffled with.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    manifests = [('all', None)] + list(subview_masks)
+    result = {
+        'boundaries': list(boundaries),
+        'seed': seed,
+        'manifests': {},
+    }
+
+    for name, mask in manifests:
+        positions = order if mask is None else order[mask[order]]
+        result['manifests'][name] = bucket_stats(
+            durations[positions], bucket_ids[positions], boundaries, batch_size, seed
+        )
+
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
@@ -0,0 +1,605 @@
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+
+import audiomate
+from audiomate import annotations
+from audiomate import tracks
+from audiomate.corpus import io
+from audiomate.corpus import subset
+from audiomate.utils import textfile
+
+import arrays
+import bitsets
+import stats
+
+
+VERSION = 1
+
+
+def cache_path(corpus_path):
+    """
+    Return the path of the columnar cache of the corpus at ``corpus_path``.
+    Like the duration index it is stored next to the corpus folder,
+    e.g. ``data/full.columns``.
+    """
+    return '{}.columns'.format(os.path.abspath(corpus_path).rstrip(os.sep))
+
+
+def corpus_signature(corpus_path):
+    """
+    Return the size and modification time of all meta files
+    (everything except the audio) of the corpus in the default format.
+    """
+    signature = []
+
+    for filename in sorted(os.listdir(corpus_path)):
+        if filename.endswith('.txt') or filename.endswith('.json'):
+            stat = os.stat(os.path.join(corpus_path, filename))
+            signature.append([filename, stat.st_size, stat.st_mtime_ns])
+
+    return signature
+
+
+def is_id_subview(sv):
+    """
+    Return ``True`` if the subview only consists of
+    a single filter including a list of utterance-ids.
+    """
+    criteria = sv.filter_criteria
+
+    return (
+        len(criteria) == 1
+        and isinstance(criteria[0], subset.MatchingUtteranceIdxFilter)
+        and not criteria[0].inverse
+    )
+
+
+def _save_strings(folder, name, values):
+    blob, offsets = arrays.encode_strings(values)
+    np.save(os.path.join(folder, '{}_blob.npy'.format(name)), blob)
+    np.save(os.path.join(folder, '{}_offsets.npy'.format(name)), offsets)
+
+
+def write(corpus, corpus_path, subview_bitsets=None):
+    """
+    Write the columnar cache of the given corpus,
+    which has to be stored at ``corpus_path`` in the default format.
+
+    Args:
+        corpus (Corpus): The corpus.
+        corpus_path (str): Path of the corpus in the default format.
+        subview_bitsets (dict): Subviews as :class:`bitsets.UtteranceBitset`
+                                over the utterances of the corpus.
+                                If ``None`` the subviews of the corpus are used.
+    """
+    # Same order as the corpus loaded from the default format (sorted by id)
+    utterances = sorted(corpus.utterances.values(), key=lambda x: x.idx)
+    utt_ordinals = {u.idx: i for i, u in enumerate(utterances)}
+
+    track_list = sorted(corpus.tracks.values(), key=lambda x: x.idx)
+    track_ordinals = {t.idx: i for i, t in enumerate(track_list)}
+
+    for track in track_list:
+        if not isinstance(track, tracks.FileTrack):
+            raise ValueError('Track {} is not a file, only file tracks are supported'.format(track.idx))
+
+    issuer_ids = list(corpus.issuers.keys())
+    issuer_ordinals = {idx: i for i, idx in enumerate(issuer_ids)}
+
+    strings = {
+        'track_ids': [t.idx for t in track_list],
+        'track_paths': [os.path.abspath(t.path) for t in track_list],
+        'issuer_ids': issuer_ids,
+        'utt_ids': [u.idx for u in utterances],
+    }
+
+    columns = {
+        'utt_track': np.array([track_ordinals[u.track.idx] for u in utterances], dtype=np.int32),
+        'utt_issuer': np.array([
+            issuer_ordinals[u.issuer.idx] if u.issuer is not None else -1
+            for u in utterances
+        ], dtype=np.int32),
+        'utt_start': np.array([u.start for u in utterances], dtype=np.float64),
+        'utt_end': np.array([u.end for u in utterances], dtype=np.float64),
+    }
+
+    label_list_names = sorted({
+        ll_idx for u in utterances for ll_idx in u.label_lists.keys()
+    })
+
+    for i, ll_idx in enumerate(label_list_names):
+        label_utt = []
+        label_start = []
+        label_end = []
+        label_values = []
+        label_meta = []
+
+        for utt in utterances:
+            if ll_idx not in utt.label_lists.keys():
+                continue
+
+            for label in sorted(utt.label_lists[ll_idx].labels):
+                label_utt.append(utt_ordinals[utt.idx])
+                label_start.append(label.start)
+                label_end.append(label.end)
+                label_values.append(label.value)
+                label_meta.append(json.dumps(label.meta) if len(label.meta) > 0 else '')
+
+        columns['label_{}_utt'.format(i)] = np.array(label_utt, dtype=np.int32)
+        columns['label_{}_start'.format(i)] = np.array(label_start, dtype=np.float64)
+        columns['label_{}_end'.format(i)] = np.array(label_end, dtype=np.float64)
+        strings['label_{}_values'.format(i)] = label_values
+        strings['label_{}_meta'.format(i)] = label_meta
+
+    ordinals = bitsets.UtteranceOrdinals(strings['utt_ids'])
+    subview_definitions = {}
+
+    if subview_bitsets is None:
+        subview_bitsets = {}
+
+        for name, sv in corpus.subviews.items():
+            mask = stats.subview_mask(sv, ordinals.ordinals, len(ordinals))
+            subview_bitsets[name] = bitsets.UtteranceBitset.from_mask(ordinals, mask)
+
+            if not is_id_subview(sv):
+                subview_definitions[name] = sv.serialize()
+
+    _write_cache(
+        corpus_path, strings, columns, label_list_names,
+        ordinals, subview_bitsets, subview_definitions
+    )
+
+
+def write_from_files(corpus_path):
+    """
+    Write the columnar cache of the corpus stored at ``corpus_path``
+    in the default format, directly from its files (without creating
+    audiomate objects). The result is the same as :func:`write`
+    with the loaded corpus, but only file tracks and subviews
+    defined by utterance-ids are supported.
+    """
+    def path_of(name):
+        return os.path.join(corpus_path, name)
+
+    if os.path.getsize(path_of(io.default.AUDIO_CONTAINER_FILE_NAME)) > 0:
+        raise ValueError('Only file tracks are supported')
+
+    track_paths = textfile.read_key_value_lines(path_of(io.default.FILES_FILE_NAME), separator=' ')
+    track_ids = sorted(track_paths.keys())
+    track_ordinals = {idx: i for i, idx in enumerate(track_ids)}
+
+    with open(path_of(io.default.ISSUER_FILE_NAME), 'r', encoding='utf-8') as f:
+        issuer_ids = list(json.load(f).keys())
+
+    utt_issuers = textfile.read_key_value_lines(path_of(io.default.UTT_ISSUER_FILE_NAME), separator=' ')
+
+    issuer_ordinals = {idx: i for i, idx in enumerate(issuer_ids)}
+
+    # Issuers, that are only referenced, are created by the reader
+    for issuer_idx in utt_issuers.values():
+        if issuer_idx not in issuer_ordinals:
+            issuer_ordinals[issuer_idx] = len(issuer_ids)
+            issuer_ids.append(issuer_idx)
+
+    utterances = textfile.read_separated_lines_with_first_key(
+        path_of(io.default.UTTERANCE_FILE_NAME), separator=' ', max_columns=4
+    )
+    utt_ids = sorted(utterances.keys())
+    utt_ends = []
+
+    for idx in utt_ids:
+        end = float(utterances[idx][2]) if len(utterances[idx]) > 2 else -1
+
+        utt_ends.append(float('inf') if end == -1 else end)
+
+    strings = {
+        'track_ids': track_ids,
+        'track_paths': [os.path.abspath(path_of(track_paths[x])) for x in track_ids],
+        'issuer_ids': issuer_ids,
+        'utt_ids': utt_ids,
+    }
+
+    columns = {
+        'utt_track': np.array([track_ordinals[utterances[x][0]] for x in utt_ids], dtype=np.int32),
+        'utt_issuer': np.array([
+            issuer_ordinals[utt_issuers[x]] if x in utt_issuers else -1
+            for x in utt_ids
+        ], dtype=np.int32),
+        'utt_start': np.array([
+            float(utterances[x][1]) if len(utterances[x]) > 1 else 0
+            for x in utt_ids
+        ], dtype=np.float64),
+        'utt_end': np.array(utt_ends, dtype=np.float64),
+    }
+
+    del utterances
+    ordinals = bitsets.UtteranceOrdinals(utt_ids)
+
+    label_prefix = '{}_'.format(io.default.LABEL_FILE_PREFIX)
+    label_files = {
+        os.path.basename(x)[len(label_prefix):-len('.txt')]: x
+        for x in glob.glob(path_of('{}*.txt'.format(label_prefix)))
+    }
+    label_list_names = []
+
+    for ll_idx in sorted(label_files.keys()):
+        labels = []
+
+        for record in textfile.read_separated_lines_generator(
+                label_files[ll_idx], separator=' ', max_columns=4):
+            value = record[3]
+            end = float(record[2])
+            meta = ''
+            meta_match = io.default.META_PATTERN.match(value)
+
+            if meta_match is not None:
+                value = meta_match.group(1)
+                meta_data = json.loads(meta_match.group(2))
+
+                if len(meta_data) > 0:
+                    meta = json.dumps(meta_data)
+
+            if end == -1:
+                end = float('inf')
+
+            labels.append((ordinals.ordinals[record[0]], float(record[1]), end, value, meta))
+
+        # Without labels, the label list doesn't exist in the loaded corpus
+        if len(labels) == 0:
+            continue
+
+        # Sorted by utterance and as ``Label`` within the utterance
+        labels.sort(key=lambda x: (x[0], x[1], x[2], x[3].lower()))
+        i = len(label_list_names)
+        label_list_names.append(ll_idx)
+
+        columns['label_{}_utt'.format(i)] = np.array([x[0] for x in labels], dtype=np.int32)
+        columns['label_{}_start'.format(i)] = np.array([x[1] for x in labels], dtype=np.float64)
+        columns['label_{}_end'.format(i)] = np.array([x[2] for x in labels], dtype=np.float64)
+        strings['label_{}_values'.format(i)] = [x[3] for x in labels]
+        strings['label_{}_meta'.format(i)] = [x[4] for x in labels]
+
+    subview_prefix = '{}_'.format(bitsets.SUBVIEW_FILE_PREFIX)
+    subview_bitsets = {}
+
+    for sv_path in glob.glob(path_of('{}*.txt'.format(subview_prefix))):
+        name = os.path.basename(sv_path)[len(subview_prefix):-len('.txt')]
+
+        with open(sv_path, 'r') as f:
+            lines = f.read().strip().split('\n')
+
+        if len(lines) != 2 or lines[0] != subset.MatchingUtteranceIdxFilter.name() \
+                or lines[1].split(',')[0] != 'include':
+            raise ValueError('Subview {} is not defined by utterance-ids'.format(name))
+
+        subview_bitsets[name] = ordinals.bitset(lines[1].split(',')[1:])
+
+    _write_cache(
+        corpus_path, strings, columns, label_list_names,
+        ordinals, subview_bitsets, {}
+    )
+
+
+def _write_cache(corpus_path, strings, columns, label_list_names,
+                 ordinals, subview_bitsets, subview_definitions):
+    """
+    Store the string and numeric columns and the subviews as cache
+    of the corpus at ``corpus_path``.
+    """
+    target = cache_path(corpus_path)
+    tmp_target = '{}.tmp'.format(target)
+
+    if os.path.isdir(tmp_target):
+        shutil.rmtree(tmp_target)
+
+    os.makedirs(tmp_target)
+
+    for name, values in strings.items():
+        _save_strings(tmp_target, name, values)
+
+    subview_bitsets = {
+        name: bitset.reordered(ordinals)
+        for name, bitset in subview_bitsets.items()
+    }
+
+    subview_names = sorted(subview_bitsets.keys())
+    num_bytes = (len(ordinals) + 7) // 8
+    subview_bits = np.zeros((len(subview_names), num_bytes), dtype=np.uint8)
+
+    for i, name in enumerate(subview_names):
+        subview_bits[i] = subview_bitsets[name].bits
+
+    columns['subviews'] = subview_bits
+
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_target, '{}.npy'.format(name)), values)
+
+    meta = {
+        'version': VERSION,
+        'signature': corpus_signature(corpus_path),
+        'num_utterances': len(ordinals),
+        'num_tracks': len(strings['track_ids']),
+        'num_issuers': len(strings['issuer_ids']),
+        'label_lists': label_list_names,
+        'subviews': subview_names,
+        # Only subviews that are not defined by utterance-ids
+        'subview_definitions': subview_definitions,
+    }
+
+    with open(os.path.join(tmp_target, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+
+    os.rename(tmp_target, target)
+
+
+def add_subviews(corpus_path, subview_bitsets):
+    """
+    Write the subviews into the corpus at ``corpus_path``
+    and add them to its cache, without loading or saving the corpus.
+    Existing subviews with the same names are replaced.
+
+    Args:
+        corpus_path (str): Path of the corpus in the default format with a valid cache.
+        subview_bitsets (dict): Subviews as :class:`bitsets.UtteranceBitset`
+                                over the utterances of the corpus.
+    """
+    if not is_valid(corpus_path):
+        raise ValueError('No valid columnar cache for {}'.format(corpus_path))
+
+    cc = ColumnarCorpus(corpus_path)
+    target = cache_path(corpus_path)
+    meta = dict(cc.meta)
+
+    existing = cc._column('subviews')
+    bits = {name: np.array(existing[i]) for i, name in enumerate(cc.subview_names)}
+    del existing
+
+    for name, bitset in subview_bitsets.items():
+        bitset.write_subview(corpus_path, name)
+        bits[name] = bitset.reordered(cc.ordinals).bits
+        meta['subview_definitions'].pop(name, None)
+
+    subview_names = sorted(bits.keys())
+    subview_bits = np.zeros((len(subview_names), (cc.num_utterances + 7) // 8), dtype=np.uint8)
+
+    for i, name in enumerate(subview_names):
+        subview_bits[i] = bits[name]
+
+    meta['subviews'] = subview_names
+    meta['signature'] = corpus_signature(corpus_path)
+
+    # The subviews are written before the meta, which makes them valid
+    tmp_path = os.path.join(target, 'subviews.tmp.npy')
+    np.save(tmp_path, subview_bits)
+    os.replace(tmp_path, os.path.join(target, 'subviews.npy'))
+
+    tmp_path = os.path.join(target, 'meta.tmp.json')
+
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+
+    os.replace(tmp_path, os.path.join(target, 'meta.json'))
+
+
+def is_valid(corpus_path):
+    """
+    Return ``True`` if a cache exists for the corpus
+    and the corpus didn't change since it was written.
+    """
+    meta_path = os.path.join(cache_path(corpus_path), 'meta.json')
+
+    if not os.path.isfile(meta_path):
+        return False
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    return meta['version'] == VERSION and meta['signature'] == corpus_signature(corpus_path)
+
+
+def load(corpus_path, create=True):
+    """
+    Open the columnar cache of the corpus at ``corpus_path``.
+    If it doesn't exist or is outdated, the corpus is loaded
+    with audiomate and the cache is written (if ``create``),
+    otherwise a ``ValueError`` is raised.
+
+    Returns:
+        ColumnarCorpus: The opened cache.
+    """
+    if not is_valid(corpus_path):
+        if not create:
+            raise ValueError('No valid columnar cache for {}'.format(corpus_path))
+
+        print('Create columnar cache for {}'.format(corpus_path))
+        corpus = audiomate.Corpus.load(corpus_path)
+        write(corpus, corpus_path)
+
+    return ColumnarCorpus(corpus_path)
+
+
+class ColumnarCorpus(object):
+    """
+    Read-only view on the columnar cache of a corpus.
+
+    Numeric columns are memory-mapped and ids/values are only decoded
+    when they are accessed, so opening the cache is almost free.
+    The positions in the utterance columns correspond to the order
+    of the utterances in the audiomate corpus.
+
+    Args:
+        corpus_path (str): Path of the corpus in the default format.
+    """
+
+    def __init__(self, corpus_path):
+        self.path = os.path.abspath(corpus_path)
+        self.cache_path = cache_path(corpus_path)
+
+        with open(os.path.join(self.cache_path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+
+        self._strings = {}
+        self._ordinals = None
+
+        self.utt_track = self._column('utt_track')
+        self.utt_issuer = self._column('utt_issuer')
+        self.utt_start = self._column('utt_start')
+        self.utt_end = self._column('utt_end')
+
+    def _column(self, name):
+        return np.load(
+            os.path.join(self.cache_path, '{}.npy'.format(name)),
+            mmap_mode='r'
+        )
+
+    def _string_column(self, name):
+        if name not in self._strings:
+            self._strings[name] = arrays.decode_strings(
+                self._column('{}_blob'.format(name)),
+                self._column('{}_offsets'.format(name))
+            )
+
+        return self._strings[name]
+
+    @property
+    def num_utterances(self):
+        return self.meta['num_utterances']
+
+    @property
+    def num_tracks(self):
+        return self.meta['num_tracks']
+
+    @property
+    def num_issuers(self):
+        return self.meta['num_issuers']
+
+    @property
+    def utt_ids(self):
+        return self._string_column('utt_ids')
+
+    @property
+    def track_ids(self):
+        return self._string_column('track_ids')
+
+    @property
+    def track_paths(self):
+        return self._string_column('track_paths')
+
+    @property
+    def issuer_ids(self):
+        return self._string_column('issuer_ids')
+
+    @property
+    def ordinals(self):
+        """ The :class:`bitsets.UtteranceOrdinals` of the utterances. """
+        if self._ordinals is None:
+            self._ordinals = bitsets.UtteranceOrdinals(self.utt_ids)
+
+        return self._ordinals
+
+    @property
+    def label_list_names(self):
+        return self.meta['label_lists']
+
+    @property
+    def subview_names(self):
+        return self.meta['subviews']
+
+    def subview_bitset(self, name):
+        """ Return the utterances of the subview as :class:`bitsets.UtteranceBitset`. """
+        i = self.subview_names.index(name)
+        bits = np.array(self._column('subviews')[i])
+        return bitsets.UtteranceBitset(self.ordinals, bits)
+
+    def labels(self, ll_idx):
+        """
+        Return the labels of the given label-list as
+        tuple (utterance-ordinals, starts, ends, values).
+        The labels are sorted by utterance and by start within the utterance.
+        """
+        i = self.label_list_names.index(ll_idx)
+
+        return (
+            self._column('label_{}_utt'.format(i)),
+            self._column('label_{}_start'.format(i)),
+            self._column('label_{}_end'.format(i)),
+            self._string_column('label_{}_values'.format(i)),
+        )
+
+    def transcripts(self, ll_idx=audiomate.corpus.LL_WORD_TRANSCRIPT, delimiter=' '):
+        """
+        Return the joined labels of every utterance (as ``LabelList.join``),
+        in the order of the utterances. Utterances without labels get an empty string.
+        """
+        label_utt, _, _, values = self.labels(ll_idx)
+        parts = [[] for _ in range(self.num_utterances)]
+
+        for utt_ordinal, value in zip(label_utt.tolist(), values):
+            parts[utt_ordinal].append(value)
+
+        return [delimiter.join(p) for p in parts]
+
+    def to_corpus(self):
+        """
+        Create an audiomate corpus from the cache.
+        This creates an object for every track, utterance and label,
+        so it is only needed where audiomate functionality is used.
+        """
+        corpus = audiomate.Corpus(path=self.path)
+
+        for idx, path in zip(self.track_ids, self.track_paths):
+            corpus.import_tracks(tracks.FileTrack(idx, path))
+
+        io.DefaultReader.read_issuers(os.path.join(self.path, 'issuers.json'), corpus)
+
+        issuer_ids = self.issuer_ids
+        track_ids = self.track_ids
+
+        for idx, track, issuer, start, end in zip(self.utt_ids,
+                                                  self.utt_track.tolist(),
+                                                  self.utt_issuer.tolist(),
+                                                  self.utt_start.tolist(),
+                                                  self.utt_end.tolist()):
+            issuer_idx = issuer_ids[issuer] if issuer >= 0 else None
+
+            if issuer_idx is not None and issuer_idx not in corpus.issuers.keys():
+                corpus.new_issuer(issuer_idx=issuer_idx)
+
+            corpus.new_utterance(idx, track_ids[track], issuer_idx=issuer_idx, start=start, end=end)
+
+        utt_ids = self.utt_ids
+
+        for i, ll_idx in enumerate(self.label_list_names):
+            label_utt, label_start, label_end, values = self.labels(ll_idx)
+            metas = self._string_column('label_{}_meta'.format(i))
+            utt_labels = {}
+
+            for utt_ordinal, start, end, value, meta in zip(label_utt.tolist(),
+                                                           label_start.tolist(),
+                                                           label_end.tolist(),
+                                                           values, metas):
+                meta = json.loads(meta) if meta != '' else None
+                label = annotations.Label(value, start, end, meta=meta)
+                utt_labels.setdefault(utt_ordinal, []).append(label)
+
+            for utt_ordinal, labels in utt_labels.items():
+                ll = annotations.LabelList(idx=ll_idx, labels=labels)
+                corpus.utterances[utt_ids[utt_ordinal]].set_label_list(ll)
+
+        definitions = self.meta['subview_definitions']
+
+        for name in self.subview_names:
+            if name in definitions:
+                sv = subset.Subview.parse(definitions[name])
+                corpus.import_subview(name, sv)
+            else:
+                corpus.import_subview(name, self.subview_bitset(name).to_subview(corpus))
+
+        return corpus
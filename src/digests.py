@@ -0,0 +1,185 @@
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+
+from tqdm import tqdm
+
+
+BLOCK_SIZE = 1024 * 1024
+
+# Files larger than this are mapped into memory instead of read in blocks
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+
+class DigestCache(object):
+    """
+    Stores content digests of files together with the size,
+    modification time and inode they had when hashed.
+    As long as the stat of a file doesn't change,
+    the cached digest is returned without reading the file again.
+
+    Args:
+        path (str): Path of the json file to persist the cache.
+                    If ``None`` the cache is only kept in memory.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+
+        if path is not None and os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def lookup(self, path, stat):
+        entry = self.entries.get(path)
+
+        if entry is None or len(entry) != 4:
+            return None
+
+        size, mtime, inode, digest = entry
+
+        if size != stat.st_size or mtime != stat.st_mtime_ns or inode != stat.st_ino:
+            return None
+
+        return digest
+
+    def store(self, path, stat, digest):
+        self.entries[path] = [stat.st_size, stat.st_mtime_ns, stat.st_ino, digest]
+
+    def save(self):
+        if self.path is None:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = '{}.tmp'.format(self.path)
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+
+        os.replace(tmp_path, self.path)
+
+
+def hash_content(path):
+    """
+    Return the BLAKE2b digest (128 bit) of the content of the file.
+    Large files are hashed via mmap, to avoid copying them block by block.
+    """
+    h = hashlib.blake2b(digest_size=16)
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        else:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                h.update(block)
+
+    return h.hexdigest()
+
+
+def _hash_item(path):
+    """ Helper for the process pool, returns the stat with the digest. """
+    stat = os.stat(path)
+    return path, stat, hash_content(path)
+
+
+def file_digest(path, cache=None):
+    """
+    Return the content digest of the file at ``path``.
+    If a cache is given, the file is only read if its stat changed.
+    """
+    return digest_files([path], cache=cache, num_workers=1)[os.path.abspath(path)]
+
+
+def digest_files(paths, cache=None, num_workers=1, show_progress=False):
+    """
+    Return the content digests of all given files.
+    Files with an unchanged stat are looked up in the cache,
+    all others are hashed using ``num_workers`` processes.
+
+    Returns:
+        dict: Digest with the absolute path as key.
+    """
+    result = {}
+    to_hash = []
+
+    for path in paths:
+        path = os.path.abspath(path)
+
+        if cache is not None:
+            digest = cache.lookup(path, os.stat(path))
+
+            if digest is not None:
+                result[path] = digest
+                continue
+
+        to_hash.append(path)
+
+    if num_workers > 1 and len(to_hash) > 1:
+        with multiprocessing.Pool(num_workers) as p:
+            hashed = p.imap_unordered(_hash_item, to_hash, chunksize=16)
+            hashed = list(tqdm(hashed, total=len(to_hash), disable=not show_progress))
+    else:
+        hashed = [_hash_item(x) for x in tqdm(to_hash, disable=not show_progress)]
+
+    for path, stat, digest in hashed:
+        result[path] = digest
+
+        if cache is not None:
+            cache.store(path, stat, digest)
+
+    return result
+
+
+def list_files(path, exclude=()):
+    """
+    Return the sorted relative paths of all files below ``path``.
+    Files or folders within ``exclude`` (absolute paths) are skipped.
+    """
+    exclude = {os.path.abspath(x) for x in exclude}
+    files = []
+
+    for root, dirs, filenames in os.walk(path):
+        dirs[:] = [
+            d for d in dirs
+            if os.path.abspath(os.path.join(root, d)) not in exclude
+        ]
+
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+
+            if os.path.abspath(file_path) not in exclude:
+                files.append(os.path.relpath(file_path, path))
+
+    return sorted(files)
+
+
+def path_digest(path, cache=None, exclude=(), num_workers=1):
+    """
+    Return a digest for a file or a folder.
+    The digest of a folder covers the relative paths
+    and the content of all files within it.
+    A missing path has the digest ``None``.
+    """
+    if os.path.isfile(path):
+        return file_digest(path, cache=cache)
+
+    if not os.path.isdir(path):
+        return None
+
+    rel_paths = list_files(path, exclude=exclude)
+    abs_paths = [os.path.abspath(os.path.join(path, x)) for x in rel_paths]
+    file_digests = digest_files(abs_paths, cache=cache, num_workers=num_workers)
+
+    h = hashlib.blake2b(digest_size=16)
+
+    for rel_path, abs_path in zip(rel_paths, abs_paths):
+        h.update(rel_path.encode('utf-8'))
+        h.update(file_digests[abs_path].encode('utf-8'))
+
+    return h.hexdigest()
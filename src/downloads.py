@@ -0,0 +1,542 @@
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+
+import requests
+from tqdm import tqdm
+
+from audiomate.corpus.io import base
+from audiomate.utils import download
+from audiomate.utils import files
+
+
+# Folder (within the download folder) for archives, markers and checksums
+STATE_FOLDER = '.download'
+CHECKSUMS_FILE_NAME = 'checksums.json'
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+# Recorded (in the progress of a download) before files are moved up
+MOVE_FILES_UP_STEP = '*move-files-up*'
+
+
+def mirror_url(url, mirror, corpus_name):
+    """
+    Return the url of the file on the mirror,
+    which is ``<mirror>/<corpus_name>/<file name>``.
+    If ``mirror`` is ``None`` the original url is returned.
+    """
+    if mirror is None:
+        return url
+
+    return '{}/{}/{}'.format(mirror.rstrip('/'), corpus_name, url.rstrip('/').split('/')[-1])
+
+
+def marker_path(download_folder, name):
+    return os.path.join(download_folder, STATE_FOLDER, '{}.complete'.format(name))
+
+
+def is_complete(download_folder, name):
+    """
+    Return ``True`` if the corpus ``name`` was downloaded completely.
+    """
+    return (
+        os.path.isfile(marker_path(download_folder, name))
+        and os.path.isdir(os.path.join(download_folder, name))
+    )
+
+
+def has_state(download_folder, name):
+    """
+    Return ``True`` if there is download state (staging folder, archives, progress)
+    of the corpus ``name``, i.e. a download was started, but not finished.
+    """
+    return os.path.isdir(os.path.join(download_folder, STATE_FOLDER, name))
+
+
+def mark_complete(download_folder, name, info=None):
+    """ Write the completion marker of the corpus ``name``. """
+    path = marker_path(download_folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(info or {}, f, indent=2)
+
+
+def sha256_of_file(path):
+    h = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+class Checksums(object):
+    """
+    Recorded sizes and sha256 checksums of archives (by archive name).
+    Archives without a record are recorded after their first download,
+    all later downloads (e.g. from a mirror) have to match.
+    Can be used from multiple threads.
+
+    Args:
+        path (str): Path of the json file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def get(self, name):
+        with self.lock:
+            return self.entries.get(name)
+
+    def verify(self, name, size, sha256):
+        """
+        Return an error message if size or checksum don't match the record,
+        otherwise ``None``. Unknown archives are recorded.
+        """
+        with self.lock:
+            entry = self.entries.get(name)
+
+            if entry is None:
+                self.entries[name] = {'size': size, 'sha256': sha256}
+                self._save()
+                return None
+
+        if entry['size'] != size:
+            return 'Size of {} is {}, expected {}'.format(name, size, entry['size'])
+
+        if entry['sha256'] != sha256:
+            return 'Checksum of {} is {}, expected {}'.format(name, sha256, entry['sha256'])
+
+        return None
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = '{}.tmp'.format(self.path)
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+
+        os.replace(tmp_path, self.path)
+
+
+def _response_validator(response):
+    """
+    Return the validators (ETag, Last-Modified) of the response,
+    which identify the version of the remote file.
+    """
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+
+def _if_range(validator):
+    """
+    Return the value for the ``If-Range`` header or ``None``
+    if the validator can't be used (no strong ETag and no Last-Modified).
+    """
+    if validator is None:
+        return None
+
+    etag = validator.get('etag')
+
+    if etag is not None and not etag.startswith('W/'):
+        return etag
+
+    return validator.get('last_modified')
+
+
+def _matches(validator, response):
+    """
+    Return ``True`` if the response is for the same version of the file
+    as the recorded validator (only the values sent by the server are compared).
+    """
+    current = _response_validator(response)
+
+    for key in ('etag', 'last_modified'):
+        if current[key] is not None and validator.get(key) is not None and current[key] != validator[key]:
+            return False
+
+    return True
+
+
+def _discard(*paths):
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def fetch_file(url, target_path, desc=None):
+    """
+    Download the file from ``url`` to ``target_path``.
+    The data is written to ``<target_path>.part`` first,
+    the ETag/Last-Modified of the response to ``<target_path>.part.json``.
+    If the partial file exists (interrupted download), the transfer is resumed
+    with a range request, which is conditional (``If-Range``) on the recorded validator.
+    If the file changed on the server (or there is no usable validator,
+    or the server doesn't support ranges), the download starts from the beginning,
+    so data of different versions is never combined.
+
+    Raises:
+        FailedDownloadException: If the server returns an error
+                                 or the transfer is incomplete.
+    """
+    part_path = '{}.part'.format(target_path)
+    validator_path = '{}.json'.format(part_path)
+    offset = 0
+    validator = None
+
+    if os.path.isfile(part_path) and os.path.isfile(validator_path):
+        with open(validator_path, 'r', encoding='utf-8') as f:
+            validator = json.load(f)
+
+        offset = os.path.getsize(part_path)
+
+    headers = {}
+
+    if offset > 0 and _if_range(validator) is not None:
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = _if_range(validator)
+    else:
+        _discard(part_path, validator_path)
+        offset = 0
+
+    with requests.get(url, stream=True, headers=headers, timeout=TIMEOUT) as r:
+        if r.status_code == 416 and offset > 0:
+            # Nothing left to download
+            os.replace(part_path, target_path)
+            _discard(validator_path)
+            return target_path
+        elif r.status_code == 206 and offset > 0:
+            if not _matches(validator, r):
+                # The file changed on the server, the partial data is useless
+                r.close()
+                _discard(part_path, validator_path)
+                return fetch_file(url, target_path, desc=desc)
+
+            mode = 'ab'
+        elif r.status_code == 200:
+            offset = 0
+            mode = 'wb'
+
+            with open(validator_path, 'w', encoding='utf-8') as f:
+                json.dump(_response_validator(r), f)
+        else:
+            raise base.FailedDownloadException(
+                'Failed to download file {} (status {})!'.format(url, r.status_code)
+            )
+
+        total = None
+
+        if 'Content-Length' in r.headers:
+            total = offset + int(r.headers['Content-Length'])
+
+        with open(part_path, mode) as f, \
+                tqdm(total=total, initial=offset, desc=desc, unit='B', unit_scale=True) as pbar:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                pbar.update(len(chunk))
+
+    if total is not None and os.path.getsize(part_path) != total:
+        raise base.FailedDownloadException(
+            'Incomplete download of {} ({} of {} bytes)'.format(
+                url, os.path.getsize(part_path), total
+            )
+        )
+
+    os.replace(part_path, target_path)
+    _discard(validator_path)
+    return target_path
+
+
+def extract_archive(path, target_folder, member_filter=None):
+    """
+    Extract a tar or zip archive (same as ``ArchiveDownloader``).
+    If ``member_filter`` is given, only files for which it returns ``True``
+    (called with the path of the member in the archive) are extracted.
+    """
+    if member_filter is None:
+        if tarfile.is_tarfile(path):
+            download.extract_tar(path, target_folder)
+        elif zipfile.is_zipfile(path):
+            download.extract_zip(path, target_folder)
+        else:
+            raise ValueError('Unrecognized archive type (Only zip/tar supported)!')
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path, 'r') as archive:
+            archive.extractall(target_folder, members=[
+                x for x in archive if not x.isfile() or member_filter(x.name)
+            ])
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            archive.extractall(target_folder, members=[
+                x for x in archive.namelist() if x.endswith('/') or member_filter(x)
+            ])
+    else:
+        raise ValueError('Unrecognized archive type (Only zip/tar supported)!')
+
+
+class _HashingReader(object):
+    """
+    File-like object reading from a stream,
+    that counts and hashes (sha256) all bytes that pass.
+    """
+
+    def __init__(self, stream, pbar=None):
+        self.stream = stream
+        self.pbar = pbar
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.size += len(data)
+        self.sha256.update(data)
+
+        if self.pbar is not None:
+            self.pbar.update(len(data))
+
+        return data
+
+
+def stream_archive(url, target_folder, member_filter=None, desc=None):
+    """
+    Download a tar archive (optionally compressed) from ``url``
+    and extract it while the data arrives, without storing the archive.
+    See ``extract_archive`` for ``member_filter``.
+
+    Returns:
+        tuple: Size and sha256 checksum of the archive.
+
+    Raises:
+        FailedDownloadException: If the server returns an error
+                                 or the transfer is incomplete.
+    """
+    os.makedirs(target_folder, exist_ok=True)
+
+    with requests.get(url, stream=True, timeout=TIMEOUT) as r:
+        if r.status_code != 200:
+            raise base.FailedDownloadException(
+                'Failed to download file {} (status {})!'.format(url, r.status_code)
+            )
+
+        total = None
+
+        if 'Content-Length' in r.headers:
+            total = int(r.headers['Content-Length'])
+
+        # Undo transfer encodings, as ``iter_content`` does
+        r.raw.decode_content = True
+
+        with tqdm(total=total, desc=desc, unit='B', unit_scale=True) as pbar:
+            reader = _HashingReader(r.raw, pbar=pbar)
+
+            with tarfile.open(fileobj=reader, mode='r|*') as archive:
+                for member in archive:
+                    if member_filter is None or not member.isfile() or member_filter(member.name):
+                        archive.extract(member, target_folder)
+
+            # Padding after the end of the tar archive
+            while len(reader.read(CHUNK_SIZE)) > 0:
+                pass
+
+    if total is not None and reader.size != total:
+        raise base.FailedDownloadException(
+            'Incomplete download of {} ({} of {} bytes)'.format(url, reader.size, total)
+        )
+
+    return reader.size, reader.sha256.hexdigest()
+
+
+def move_contents(source_folder, target_folder):
+    """
+    Move all files/folders from ``source_folder`` into ``target_folder``,
+    merging folders that exist in both.
+    """
+    os.makedirs(target_folder, exist_ok=True)
+
+    for item in os.listdir(source_folder):
+        src = os.path.join(source_folder, item)
+        target = os.path.join(target_folder, item)
+
+        if os.path.isdir(src) and os.path.isdir(target):
+            move_contents(src, target)
+        else:
+            os.replace(src, target)
+
+
+class CorpusDownload(object):
+    """
+    Download of a corpus that consists of one or more archives.
+
+    The archives are downloaded (resumable) into the state folder,
+    verified against the recorded checksums and extracted into a
+    staging folder. Extracted archives are recorded,
+    so an interrupted download continues with the next archive.
+    When all archives are extracted, the staging folder is moved
+    to ``<download_folder>/<name>`` and a completion marker is written.
+    So the corpus folder only exists if the download is complete.
+
+    In stream mode (only tar archives), archives are extracted while
+    they are downloaded, without storing them. An archive is streamed into
+    its own folder, which is merged into the staging folder after
+    the checksum was verified. An interrupted stream restarts
+    with the archive it was in.
+
+    Args:
+        name (str): Name of the corpus (folder).
+        download_folder (str): Folder containing all corpora.
+        archives (list): Tuples (archive name, url).
+        checksums (Checksums): Recorded checksums.
+        move_files_up (bool): Move files from subfolders to the top
+                              after extraction (as ``ArchiveDownloader``).
+        stream (bool): Extract the archives while downloading.
+        member_filter (func): If given, only files of the archives
+                              for which it returns ``True`` are extracted
+                              (see ``extract_archive``).
+    """
+
+    def __init__(self, name, download_folder, archives, checksums,
+                 move_files_up=False, stream=False, member_filter=None):
+        self.name = name
+        self.download_folder = download_folder
+        self.archives = archives
+        self.checksums = checksums
+        self.move_files_up = move_files_up
+        self.stream = stream
+        self.member_filter = member_filter
+
+        self.target_path = os.path.join(download_folder, name)
+        self.state_path = os.path.join(download_folder, STATE_FOLDER, name)
+        self.staging_path = os.path.join(self.state_path, 'data')
+        self.progress_path = os.path.join(self.state_path, 'extracted.txt')
+        self.lock = threading.Lock()
+
+    def extracted_archives(self):
+        if not os.path.isfile(self.progress_path):
+            return set()
+
+        with open(self.progress_path, 'r', encoding='utf-8') as f:
+            return {line.strip() for line in f if line.strip() != ''}
+
+    def _record_extracted(self, archive_name):
+        with self.lock:
+            with open(self.progress_path, 'a', encoding='utf-8') as f:
+                f.write('{}\n'.format(archive_name))
+
+    def fetch_archive(self, archive):
+        """ Download, verify and extract a single archive. """
+        if self.stream:
+            self.stream_archive(archive)
+            return
+
+        archive_name, url = archive
+        archive_path = os.path.join(self.state_path, 'archives', archive_name)
+
+        if not os.path.isfile(archive_path):
+            fetch_file(url, archive_path, desc=archive_name)
+
+        error = self.checksums.verify(
+            archive_name,
+            os.path.getsize(archive_path),
+            sha256_of_file(archive_path)
+        )
+
+        if error is not None:
+            os.remove(archive_path)
+            raise base.FailedDownloadException(error)
+
+        extract_archive(archive_path, self.staging_path, member_filter=self.member_filter)
+        self._record_extracted(archive_name)
+        os.remove(archive_path)
+
+    def stream_archive(self, archive):
+        """ Download and extract a single archive at once and verify it. """
+        archive_name, url = archive
+        partial_path = os.path.join(self.state_path, 'partial', archive_name)
+
+        if os.path.isdir(partial_path):
+            # Interrupted, restart the archive
+            shutil.rmtree(partial_path)
+
+        size, sha256 = stream_archive(
+            url,
+            partial_path,
+            member_filter=self.member_filter,
+            desc=archive_name
+        )
+
+        error = self.checksums.verify(archive_name, size, sha256)
+
+        if error is not None:
+            shutil.rmtree(partial_path)
+            raise base.FailedDownloadException(error)
+
+        move_contents(partial_path, self.staging_path)
+        self._record_extracted(archive_name)
+        shutil.rmtree(partial_path)
+
+    def run(self, pool=None):
+        """
+        Download all archives, that are not extracted yet.
+
+        Args:
+            pool (ThreadPool): If given, the archives are fetched concurrently.
+        """
+        os.makedirs(os.path.join(self.state_path, 'archives'), exist_ok=True)
+        os.makedirs(self.staging_path, exist_ok=True)
+
+        done = self.extracted_archives()
+
+        if MOVE_FILES_UP_STEP in done:
+            # Interrupted while moving the files, the layout is unknown
+            print('{}: Files were partially moved, start again'.format(self.name))
+            shutil.rmtree(self.staging_path)
+            os.remove(self.progress_path)
+            os.makedirs(self.staging_path)
+            done = set()
+
+        todo = [x for x in self.archives if x[0] not in done]
+
+        if len(done) > 0:
+            print('{}: {} of {} archives already extracted'.format(
+                self.name, len(done), len(self.archives)
+            ))
+
+        if pool is None or len(todo) <= 1:
+            for archive in todo:
+                self.fetch_archive(archive)
+        else:
+            for _ in tqdm(pool.imap_unordered(self.fetch_archive, todo),
+                          total=len(todo), desc=self.name):
+                pass
+
+        if self.move_files_up:
+            self._record_extracted(MOVE_FILES_UP_STEP)
+            files.move_all_files_from_subfolders_to_top(
+                self.staging_path,
+                delete_subfolders=True
+            )
+
+        os.rename(self.staging_path, self.target_path)
+        mark_complete(self.download_folder, self.name, {
+            'archives': [
+                {'name': name, 'url': url, 'checksum': self.checksums.get(name)}
+                for name, url in self.archives
+            ]
+        })
+        shutil.rmtree(self.state_path)
@@ -0,0 +1,307 @@
+import multiprocessing
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from audiomate.utils import audioread
+
+import arrays
+
+
+def index_path(corpus_path):
+    """
+    Return the path of the duration index of the corpus at ``corpus_path``.
+    The index is stored next to (not inside) the corpus folder,
+    e.g. ``data/full.durations.npz``.
+    """
+    return '{}.durations.npz'.format(os.path.abspath(corpus_path).rstrip(os.sep))
+
+
+def _read_header(path):
+    """ Helper for the process pool, returns stat and header info of a file. """
+    stat = os.stat(path)
+
+    try:
+        with audioread.audio_open(path) as f:
+            duration = f.duration
+            sampling_rate = f.samplerate
+    except Exception:
+        duration = np.nan
+        sampling_rate = 0
+
+    return path, stat.st_size, stat.st_mtime_ns, duration, sampling_rate
+
+
+class DurationIndex(object):
+    """
+    Array-backed index of the durations of all utterances of a corpus.
+
+    Besides the utterance table (track, start, end) the index holds the
+    duration and sampling-rate of every track, together with the size and
+    modification time of the file at the time it was read.
+    When the index is rebuilt, only tracks whose file changed are read again.
+
+    Utterances ending at the end of the track (``end == inf``)
+    get the duration of the track minus the start.
+    """
+
+    def __init__(self, utt_ids, utt_track, utt_start, utt_end,
+                 track_ids, track_paths, track_size, track_mtime,
+                 track_duration, track_sampling_rate):
+        self.utt_ids = list(utt_ids)
+        self.utt_track = np.asarray(utt_track, dtype=np.int32)
+        self.utt_start = np.asarray(utt_start, dtype=np.float64)
+        self.utt_end = np.asarray(utt_end, dtype=np.float64)
+
+        self.track_ids = list(track_ids)
+        self.track_paths = list(track_paths)
+        self.track_size = np.asarray(track_size, dtype=np.int64)
+        self.track_mtime = np.asarray(track_mtime, dtype=np.int64)
+        self.track_duration = np.asarray(track_duration, dtype=np.float64)
+        self.track_sampling_rate = np.asarray(track_sampling_rate, dtype=np.int32)
+
+        self.utt_ordinals = {idx: i for i, idx in enumerate(self.utt_ids)}
+
+        end = self.utt_end
+
+        if len(self.utt_ids) > 0:
+            end = np.where(np.isinf(end), self.track_duration[self.utt_track], end)
+
+        self.durations = end - self.utt_start
+
+        if len(self.utt_ids) > 0:
+            self.sampling_rates = self.track_sampling_rate[self.utt_track]
+        else:
+            self.sampling_rates = np.zeros(0, dtype=np.int32)
+
+    @property
+    def num_utterances(self):
+        return len(self.utt_ids)
+
+    def ordinals(self, utt_ids):
+        """ Return the positions of the given utterances in the index. """
+        return np.array([self.utt_ordinals[x] for x in utt_ids], dtype=np.int64)
+
+    def duration(self, utt_idx):
+        return float(self.durations[self.utt_ordinals[utt_idx]])
+
+    def durations_of(self, utt_ids):
+        return self.durations[self.ordinals(utt_ids)]
+
+    def total_duration(self, utt_ids=None):
+        """
+        Return the summed duration of the given utterances (all if ``None``).
+        The values are summed in the given order,
+        to get exactly the same result as ``CorpusView.total_duration``.
+        """
+        if utt_ids is None:
+            values = self.durations
+        else:
+            values = self.durations_of(utt_ids)
+
+        duration = 0
+
+        for value in values.tolist():
+            duration += value
+
+        return duration
+
+    def save(self, path):
+        utt_blob, utt_offsets = arrays.encode_strings(self.utt_ids)
+        track_blob, track_offsets = arrays.encode_strings(self.track_ids)
+        path_blob, path_offsets = arrays.encode_strings(self.track_paths)
+
+        tmp_path = '{}.tmp.npz'.format(path[:-len('.npz')])
+
+        np.savez(
+            tmp_path,
+            utt_blob=utt_blob,
+            utt_offsets=utt_offsets,
+            utt_track=self.utt_track,
+            utt_start=self.utt_start,
+            utt_end=self.utt_end,
+            track_blob=track_blob,
+            track_offsets=track_offsets,
+            path_blob=path_blob,
+            path_offsets=path_offsets,
+            track_size=self.track_size,
+            track_mtime=self.track_mtime,
+            track_duration=self.track_duration,
+            track_sampling_rate=self.track_sampling_rate
+        )
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                arrays.decode_strings(data['utt_blob'], data['utt_offsets']),
+                data['utt_track'],
+                data['utt_start'],
+                data['utt_end'],
+                arrays.decode_strings(data['track_blob'], data['track_offsets']),
+                arrays.decode_strings(data['path_blob'], data['path_offsets']),
+                data['track_size'],
+                data['track_mtime'],
+                data['track_duration'],
+                data['track_sampling_rate']
+            )
+
+    @classmethod
+    def build(cls, corpus, path=None, num_workers=1):
+        """
+        Create the index for the given corpus.
+        If ``path`` is given, track infos of an existing index at this path
+        are reused for files with unchanged size/mtime,
+        and the updated index is stored there.
+
+        Args:
+            corpus (CorpusView): The corpus to index.
+            path (str): Path of the index file.
+            num_workers (int): Number of processes to read audio headers.
+
+        Returns:
+            DurationIndex: The index.
+        """
+        tracks = sorted(corpus.tracks.values(), key=lambda x: x.idx)
+        track_ordinals = {t.idx: i for i, t in enumerate(tracks)}
+        utterances = list(corpus.utterances.values())
+
+        return cls.from_columns(
+            [u.idx for u in utterances],
+            [track_ordinals[u.track.idx] for u in utterances],
+            [u.start for u in utterances],
+            [u.end for u in utterances],
+            [t.idx for t in tracks],
+            [os.path.abspath(t.path) for t in tracks],
+            path=path,
+            num_workers=num_workers
+        )
+
+    @classmethod
+    def build_columnar(cls, columnar_corpus, path=None, num_workers=1):
+        """
+        Create the index for a :class:`columnar.ColumnarCorpus`
+        (see :meth:`build`).
+        """
+        return cls.from_columns(
+            columnar_corpus.utt_ids,
+            columnar_corpus.utt_track,
+            columnar_corpus.utt_start,
+            columnar_corpus.utt_end,
+            columnar_corpus.track_ids,
+            columnar_corpus.track_paths,
+            path=path,
+            num_workers=num_workers
+        )
+
+    @classmethod
+    def from_columns(cls, utt_ids, utt_track, utt_start, utt_end,
+                     track_ids, track_paths, path=None, num_workers=1):
+        """
+        Create the index from the utterance table
+        (``utt_track`` are positions in ``track_ids``) and the track files.
+        See :meth:`build` for ``path`` and ``num_workers``.
+        """
+        existing = None
+
+        if path is not None and os.path.isfile(path):
+            existing = cls.load(path)
+
+        known = {}
+
+        if existing is not None:
+            for i, track_path in enumerate(existing.track_paths):
+                known[track_path] = (
+                    int(existing.track_size[i]),
+                    int(existing.track_mtime[i]),
+                    float(existing.track_duration[i]),
+                    int(existing.track_sampling_rate[i])
+                )
+
+        track_infos = {}
+        to_read = []
+
+        for track_path in track_paths:
+            info = known.get(track_path)
+            stat = os.stat(track_path)
+
+            if info is not None and info[0] == stat.st_size and info[1] == stat.st_mtime_ns:
+                track_infos[track_path] = info
+            else:
+                to_read.append(track_path)
+
+        if len(to_read) > 0:
+            print('Read audio headers of {} tracks'.format(len(to_read)))
+
+            with multiprocessing.Pool(num_workers) as p:
+                result = list(tqdm(
+                    p.imap_unordered(_read_header, to_read, chunksize=32),
+                    total=len(to_read)
+                ))
+
+            for track_path, size, mtime, duration, sampling_rate in result:
+                track_infos[track_path] = (size, mtime, duration, sampling_rate)
+
+        index = cls(
+            utt_ids,
+            utt_track,
+            utt_start,
+            utt_end,
+            track_ids,
+            track_paths,
+            [track_infos[x][0] for x in track_paths],
+            [track_infos[x][1] for x in track_paths],
+            [track_infos[x][2] for x in track_paths],
+            [track_infos[x][3] for x in track_paths]
+        )
+
+        if path is not None and (len(to_read) > 0 or not index.equals(existing)):
+            index.save(path)
+
+        return index
+
+    def equals(self, other):
+        if other is None:
+            return False
+
+        return (
+            self.utt_ids == other.utt_ids
+            and self.track_ids == other.track_ids
+            and self.track_paths == other.track_paths
+            and np.array_equal(self.utt_track, other.utt_track)
+            and np.array_equal(self.utt_start, other.utt_start)
+            and np.array_equal(self.utt_end, other.utt_end)
+        )
+
+
+def for_corpus(corpus, corpus_path, num_workers=None):
+    """
+    Return the duration index of the corpus loaded from ``corpus_path``,
+    updating the stored index if necessary.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count()
+
+    return DurationIndex.build(
+        corpus,
+        path=index_path(corpus_path),
+        num_workers=num_workers
+    )
+
+
+def for_columnar(columnar_corpus, num_workers=None):
+    """
+    Return the duration index of the corpus of the given
+    :class:`columnar.ColumnarCorpus`, updating the stored index if necessary.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count()
+
+    return DurationIndex.build_columnar(
+        columnar_corpus,
+        path=index_path(columnar_corpus.path),
+        num_workers=num_workers
+    )
@@ -0,0 +1,401 @@
+import hashlib
+import json
+import os
+import wave
+
+import numpy as np
+
+import arrays
+
+
+INDEX_FILE_NAME = 'index.npz'
+META_FILE_NAME = 'meta.json'
+DATA_FILE_NAME = 'features.f16'
+
+DEFAULT_CONFIG = {
+    'sampling_rate': 16000,
+    'win_length': 400,
+    'hop_length': 160,
+    'n_fft': 512,
+    'num_mels': 80,
+    'fmin': 0.0,
+    'fmax': 8000.0,
+    'preemphasis': 0.97,
+    'log_floor': 1e-10,
+}
+
+# Filterbanks per config hash (per process)
+_filterbanks = {}
+
+
+def config_hash(config):
+    """ Return the hash of a feature config (independent of the key order). """
+    data = json.dumps(config, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + np.asarray(hz, dtype=np.float64) / 700.0)
+
+
+def mel_to_hz(mel):
+    return 700.0 * (10.0 ** (np.asarray(mel, dtype=np.float64) / 2595.0) - 1.0)
+
+
+def mel_filterbank(config):
+    """
+    Return the triangular mel filters (HTK mel scale)
+    as matrix with shape ``(num_mels, n_fft // 2 + 1)``.
+    """
+    num_bins = config['n_fft'] // 2 + 1
+    bin_freqs = np.linspace(0, config['sampling_rate'] / 2, num_bins)
+    mel_points = np.linspace(
+        hz_to_mel(config['fmin']),
+        hz_to_mel(config['fmax']),
+        config['num_mels'] + 2
+    )
+    hz_points = mel_to_hz(mel_points)
+
+    lower = hz_points[:-2, np.newaxis]
+    center = hz_points[1:-1, np.newaxis]
+    upper = hz_points[2:, np.newaxis]
+
+    rising = (bin_freqs - lower) / (center - lower)
+    falling = (upper - bin_freqs) / (upper - center)
+
+    return np.maximum(0, np.minimum(rising, falling)).astype(np.float32)
+
+
+def log_mel(samples, config):
+    """
+    Compute the log-mel features of the samples (float in [-1, 1]).
+    Frames are not centered, a signal shorter than a window is zero-padded to one frame.
+
+    Returns:
+        np.ndarray: Features (float32) with shape ``(num_frames, num_mels)``.
+    """
+    key = config_hash(config)
+
+    if key not in _filterbanks:
+        _filterbanks[key] = mel_filterbank(config)
+
+    filterbank = _filterbanks[key]
+    win_length = config['win_length']
+    hop_length = config['hop_length']
+
+    samples = np.asarray(samples, dtype=np.float32)
+
+    if config['preemphasis'] > 0 and len(samples) > 1:
+        samples = np.append(samples[0], samples[1:] - config['preemphasis'] * samples[:-1])
+
+    if len(samples) < win_length:
+        samples = np.pad(samples, (0, win_length - len(samples)), mode='constant')
+
+    samples = np.ascontiguousarray(samples)
+    num_frames = 1 + (len(samples) - win_length) // hop_length
+    frames = np.lib.stride_tricks.as_strided(
+        samples,
+        shape=(num_frames, win_length),
+        strides=(samples.strides[0] * hop_length, samples.strides[0])
+    )
+
+    window = np.hanning(win_length).astype(np.float32)
+    spectrum = np.fft.rfft(frames * window, n=config['n_fft'], axis=1)
+    power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+    mel = np.dot(power, filterbank.T)
+
+    return np.log(np.maximum(mel, config['log_floor']))
+
+
+def read_samples(path, start, end, sampling_rate):
+    """
+    Read the samples of a segment of a 16 bit mono wave file as float in [-1, 1].
+    """
+    with wave.open(path, 'rb') as f:
+        if f.getframerate() != sampling_rate or f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise ValueError('{} is not a {} Hz / 16 bit mono wave file'.format(path, sampling_rate))
+
+        start_frame = int(round(start * sampling_rate))
+        f.setpos(start_frame)
+
+        if end == float('inf'):
+            num_frames = f.getnframes() - start_frame
+        else:
+            num_frames = int(round(end * sampling_rate)) - start_frame
+
+        data = f.readframes(num_frames)
+
+    return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+
+
+def compute(item):
+    """
+    Compute the features (float16) of an utterance (helper for the process pool).
+
+    Args:
+        item (tuple): Utterance-id, path, start, end and the feature config.
+
+    Returns:
+        tuple: Utterance-id and the features.
+    """
+    utt_idx, path, start, end, config = item
+    samples = read_samples(path, start, end, config['sampling_rate'])
+    return utt_idx, log_mel(samples, config).astype(np.float16)
+
+
+def source_info(path, start, end):
+    """
+    Return the record of the source of an utterance (path, size, mtime, segment),
+    that is stored with its features to detect changed sources.
+    """
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, float(start), float(end))
+
+
+class FeatureStore(object):
+    """
+    Store of features (float16), appended to a single data file,
+    with an index utterance-id -> (offset, frames) in frames of the data file.
+
+    With every utterance the source (path, size, mtime, segment) is stored,
+    so only new or changed utterances have to be computed on an update.
+    The config (and its hash) is stored in ``meta.json``.
+    An existing store with another config is stale and is cleared on opening.
+
+    Data of removed or recomputed utterances stays in the data file,
+    until the store is compacted.
+
+    Args:
+        path (str): Folder of the store.
+        config (dict): Feature config.
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.num_features = config['num_mels']
+        self.was_stale = False
+
+        self.entries = {}
+        self.num_frames = 0
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE_NAME)
+        index_path = os.path.join(path, INDEX_FILE_NAME)
+
+        if os.path.isfile(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+
+            if meta['config_hash'] != config_hash(config):
+                self.was_stale = True
+            elif os.path.isfile(index_path):
+                self.entries, self.num_frames = self._load_index(index_path)
+
+        if self.was_stale or not os.path.isfile(meta_path):
+            for name in [INDEX_FILE_NAME, DATA_FILE_NAME]:
+                if os.path.isfile(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+
+            self._write_meta()
+
+        # Remove data of an interrupted run, that is not in the index
+        self.data_file = open(self.data_path, 'ab')
+        self.data_file.truncate(self.num_frames * self.num_features * 2)
+        self.data_file.seek(0, os.SEEK_END)
+
+    @property
+    def data_path(self):
+        return os.path.join(self.path, DATA_FILE_NAME)
+
+    @staticmethod
+    def _load_index(index_path):
+        with np.load(index_path) as data:
+            utt_ids = arrays.decode_strings(data['utt_blob'], data['utt_offsets'])
+            paths = arrays.decode_strings(data['path_blob'], data['path_offsets'])
+            columns = [
+                data['offset'].tolist(),
+                data['frames'].tolist(),
+                paths,
+                data['size'].tolist(),
+                data['mtime'].tolist(),
+                data['start'].tolist(),
+                data['end'].tolist(),
+            ]
+            num_frames = int(data['num_frames'])
+
+        entries = {}
+
+        for i, utt_idx in enumerate(utt_ids):
+            offset, frames, path, size, mtime, start, end = [c[i] for c in columns]
+            entries[utt_idx] = (offset, frames, (path, size, mtime, start, end))
+
+        return entries, num_frames
+
+    def _write_meta(self):
+        with open(os.path.join(self.path, META_FILE_NAME), 'w') as f:
+            json.dump({
+                'config': self.config,
+                'config_hash': config_hash(self.config),
+                'dtype': 'float16',
+                'num_features': self.num_features,
+            }, f, indent=2, sort_keys=True)
+
+    def is_current(self, utt_idx, source):
+        """ Return ``True`` if the features of the utterance were computed from the given source. """
+        return utt_idx in self.entries and self.entries[utt_idx][2] == source
+
+    def append(self, utt_idx, source, features):
+        """ Append the features (``(frames, num_features)``) of an utterance. """
+        features = np.asarray(features, dtype='<f2')
+
+        if features.ndim != 2 or features.shape[1] != self.num_features:
+            raise ValueError('Features of {} have shape {}'.format(utt_idx, features.shape))
+
+        self.data_file.write(features.tobytes())
+        self.entries[utt_idx] = (self.num_frames, features.shape[0], source)
+        self.num_frames += features.shape[0]
+
+    def retain(self, utt_ids):
+        """ Remove all utterances from the index, that are not in ``utt_ids``. """
+        utt_ids = set(utt_ids)
+        self.entries = {k: v for k, v in self.entries.items() if k in utt_ids}
+
+    @property
+    def num_unused_frames(self):
+        return self.num_frames - sum(x[1] for x in self.entries.values())
+
+    def save(self):
+        """ Write the index (the data written so far is flushed before). """
+        self.data_file.flush()
+        os.fsync(self.data_file.fileno())
+
+        utt_ids = sorted(self.entries.keys())
+        entries = [self.entries[x] for x in utt_ids]
+        utt_blob, utt_offsets = arrays.encode_strings(utt_ids)
+        path_blob, path_offsets = arrays.encode_strings([x[2][0] for x in entries])
+        tmp_path = os.path.join(self.path, 'index.tmp.npz')
+
+        np.savez(
+            tmp_path,
+            utt_blob=utt_blob,
+            utt_offsets=utt_offsets,
+            offset=np.array([x[0] for x in entries], dtype=np.int64),
+            frames=np.array([x[1] for x in entries], dtype=np.int64),
+            path_blob=path_blob,
+            path_offsets=path_offsets,
+            size=np.array([x[2][1] for x in entries], dtype=np.int64),
+            mtime=np.array([x[2][2] for x in entries], dtype=np.int64),
+            start=np.array([x[2][3] for x in entries], dtype=np.float64),
+            end=np.array([x[2][4] for x in entries], dtype=np.float64),
+            num_frames=np.array(self.num_frames, dtype=np.int64)
+        )
+
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE_NAME))
+
+    def compact(self):
+        """
+        Rewrite the data file with only the features of the utterances in the index.
+        """
+        self.save()
+        self.data_file.close()
+
+        tmp_path = '{}.tmp'.format(self.data_path)
+        num_frames = 0
+        entries = {}
+
+        if self.num_frames > 0:
+            data = np.memmap(self.data_path, dtype='<f2', mode='r').reshape(-1, self.num_features)
+        else:
+            data = np.zeros((0, self.num_features), dtype='<f2')
+
+        with open(tmp_path, 'wb') as f:
+            # In the order of the data file, so it is read sequentially
+            for utt_idx, (offset, frames, source) in sorted(self.entries.items(), key=lambda x: x[1][0]):
+                f.write(data[offset:offset + frames].tobytes())
+                entries[utt_idx] = (num_frames, frames, source)
+                num_frames += frames
+
+        del data
+        os.replace(tmp_path, self.data_path)
+
+        self.entries = entries
+        self.num_frames = num_frames
+        self.data_file = open(self.data_path, 'ab')
+        self.save()
+
+    def close(self):
+        self.save()
+        self.data_file.close()
+
+
+class FeatureReader(object):
+    """
+    Random access to the features of a :class:`FeatureStore`.
+    The data file is memory-mapped (read-only) when it is first accessed,
+    in every process separately (see :class:`shards.ShardReader`).
+
+    Args:
+        path (str): Folder of the store.
+        config (dict): If given, a :class:`ValueError` is raised,
+                       if the features were computed with another config.
+    """
+
+    def __init__(self, path, config=None):
+        self.path = path
+
+        with open(os.path.join(path, META_FILE_NAME), 'r') as f:
+            self.meta = json.load(f)
+
+        if config is not None and self.meta['config_hash'] != config_hash(config):
+            raise ValueError('The features in {} were computed with another config'.format(path))
+
+        with np.load(os.path.join(path, INDEX_FILE_NAME)) as data:
+            self.utt_ids = arrays.decode_strings(data['utt_blob'], data['utt_offsets'])
+            self.offset = data['offset']
+            self.frames = data['frames']
+
+        self.ordinals = {idx: i for i, idx in enumerate(self.utt_ids)}
+        self._map = None
+        self._pid = os.getpid()
+
+    def __len__(self):
+        return len(self.utt_ids)
+
+    def __contains__(self, utt_idx):
+        return utt_idx in self.ordinals
+
+    @property
+    def config(self):
+        return self.meta['config']
+
+    @property
+    def num_features(self):
+        return self.meta['num_features']
+
+    def _data(self):
+        if self._pid != os.getpid():
+            self._map = None
+            self._pid = os.getpid()
+
+        if self._map is None:
+            data_path = os.path.join(self.path, DATA_FILE_NAME)
+
+            if os.path.getsize(data_path) > 0:
+                self._map = np.memmap(data_path, dtype='<f2', mode='r').reshape(-1, self.num_features)
+            else:
+                self._map = np.zeros((0, self.num_features), dtype='<f2')
+
+        return self._map
+
+    def read(self, utt_idx):
+        """
+        Return the features (float16) of the utterance with shape ``(frames, num_features)``
+        as view on the mapped data file.
+        """
+        i = self.ordinals[utt_idx]
+        start = int(self.offset[i])
+        return self._data()[start:start + int(self.frames[i])]
+
+    def num_frames(self, utt_idx):
+        return int(self.frames[self.ordinals[utt_idx]])
@@ -0,0 +1,217 @@
+import atexit
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import resource
+import threading
+import time
+
+
+# Environment variable with the path of the events file (json lines).
+# Subprocesses (e.g. pipeline stages) inherit it, so their events are collected too.
+EVENTS_ENV = 'MEGS_EVENTS'
+
+# Number of functions in the text summary of a profile
+PROFILE_SUMMARY_LINES = 40
+
+_current = None
+
+
+def _usage():
+    """ Return wall time, cpu time (incl. terminated children) and peak RSS (MB). """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return (
+        time.perf_counter(),
+        own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        max(own.ru_maxrss, children.ru_maxrss) / 1024,
+    )
+
+
+class Step(object):
+    """
+    A (sub-)step of a script, measured by :meth:`Instrumentation.step`.
+    The number of processed items can be set while the step is running.
+    """
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+
+
+class Instrumentation(object):
+    """
+    Measures the steps of a script and writes an event (json line)
+    per step with wall time, cpu time, peak RSS, items and throughput.
+
+    The cpu time includes the child processes (e.g. of a pool),
+    that terminated within the step. The peak RSS is the max.
+    of the process and its terminated children up to the end of the step.
+
+    Args:
+        script (str): Name of the script.
+        events_path (str): File the events are appended to.
+                           If ``None``, no events are written.
+        profile_path (str): If not ``None``, the hot steps are profiled
+                            and the (accumulated) stats are stored at this path
+                            (with a text summary at ``<profile_path>.txt``).
+    """
+
+    def __init__(self, script, events_path=None, profile_path=None):
+        self.script = script
+        self.events_path = events_path
+        self.profile_path = profile_path
+        self.profiler = None
+        self.start_usage = _usage()
+        self.finished = False
+
+        # Names of the running steps per thread
+        self.local = threading.local()
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+
+        return self.local.stack
+
+    def emit(self, event):
+        if self.events_path is None:
+            return
+
+        event = dict(event)
+        event['script'] = self.script
+        event['pid'] = os.getpid()
+        event['time'] = datetime.datetime.now().isoformat()
+
+        # Single write in append mode, so events of concurrent processes are not mixed
+        with open(self.events_path, 'a') as f:
+            f.write(json.dumps(event, sort_keys=True) + '\n')
+
+    @contextlib.contextmanager
+    def step(self, name, items=None, hot=False):
+        """
+        Measure the code within the context as step ``name``.
+        Nested steps get the names of their parents as prefix (``parent/name``).
+
+        Args:
+            name (str): Name of the step.
+            items (int): Number of processed items (can also be set
+                         on the yielded :class:`Step`).
+            hot (bool): If ``True``, the step is profiled, if profiling is enabled.
+        """
+        full_name = '/'.join(self.stack + [name])
+        current = Step(full_name, items=items)
+        profiler = None
+
+        if hot and self.profile_path is not None:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+
+            profiler = self.profiler
+
+        self.stack.append(name)
+        start = _usage()
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield current
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            end = _usage()
+            self.stack.pop()
+
+            if profiler is not None:
+                self.write_profile(profiler, full_name)
+
+            self.emit(self.create_event('step', full_name, start, end, current.items))
+
+    def write_profile(self, profiler, name):
+        profiler.dump_stats(self.profile_path)
+        summary = io.StringIO()
+        summary.write('Profile of {} ({})\n'.format(name, self.script))
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LINES)
+
+        with open('{}.txt'.format(self.profile_path), 'w') as f:
+            f.write(summary.getvalue())
+
+        print('Profile of {} written to {}'.format(name, self.profile_path))
+
+    def create_event(self, event_type, name, start, end, items=None):
+        wall_time = end[0] - start[0]
+        event = {
+            'event': event_type,
+            'step': name,
+            'wall_time': wall_time,
+            'cpu_time': end[1] - start[1],
+            'max_rss_mb': end[2],
+        }
+
+        if items is not None:
+            event['items'] = items
+            event['items_per_second'] = items / wall_time if wall_time > 0 else None
+
+        return event
+
+    def finish(self):
+        """ Write the event of the whole script (called at exit, only written once). """
+        if self.finished:
+            return
+
+        self.finished = True
+        self.emit(self.create_event('script', self.script, self.start_usage, _usage()))
+
+
+def start(script, profile_path=None):
+    """
+    Start the instrumentation of the script.
+    The events are written to the file in the environment variable ``MEGS_EVENTS``.
+    A final event for the whole script is written at exit.
+
+    Returns:
+        Instrumentation: The instrumentation, that is used by :func:`step`.
+    """
+    global _current
+
+    _current = Instrumentation(
+        script,
+        events_path=os.environ.get(EVENTS_ENV),
+        profile_path=profile_path
+    )
+    atexit.register(_current.finish)
+
+    return _current
+
+
+def finish():
+    """
+    Write the event of the whole script now.
+    Needed in processes, that don't run the exit handlers
+    (e.g. forked ``multiprocessing`` processes).
+    """
+    if _current is not None:
+        _current.finish()
+
+
+def step(name, items=None, hot=False):
+    """
+    Measure a step with the instrumentation of the script (see :meth:`Instrumentation.step`).
+    Without a started instrumentation (e.g. if a module is used by other code),
+    the step is measured, but no events are written.
+    """
+    global _current
+
+    if _current is None:
+        _current = Instrumentation('unknown')
+
+    return _current.step(name, items=items, hot=hot)
@@ -0,0 +1,283 @@
+import collections
+import re
+import zlib
+
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Prime for the hash permutations of MinHash (values are below 2^31)
+MERSENNE_PRIME = (1 << 31) - 1
+
+# Number of text pairs, whose signatures are compared at once
+COMPARE_BLOCK_SIZE = 1 << 16
+
+
+def normalize_transcript(transcript):
+    """
+    Return the normalized form of a transcript used for comparison
+    (lower-case words, without punctuation).
+    """
+    return ' '.join(TOKEN_PATTERN.findall(transcript.lower()))
+
+
+def shingles(text, shingle_size):
+    """
+    Return the hashes (crc32) of the word n-grams of a normalized text.
+    Texts with less words than ``shingle_size`` are a single shingle.
+    """
+    words = text.split(' ')
+
+    if len(words) <= shingle_size:
+        return [zlib.crc32(text.encode('utf-8'))]
+
+    return [
+        zlib.crc32(' '.join(words[i:i + shingle_size]).encode('utf-8'))
+        for i in range(len(words) - shingle_size + 1)
+    ]
+
+
+def minhash_signatures(texts, num_perm=64, shingle_size=3, seed=1):
+    """
+    Compute the MinHash signature of every text.
+    The shingles of all texts are stored in a single array,
+    so every permutation is applied to all texts at once.
+
+    Returns:
+        np.ndarray: Signatures with shape (number of texts, ``num_perm``).
+    """
+    lengths = []
+    values = []
+
+    for text in texts:
+        text_shingles = shingles(text, shingle_size)
+        lengths.append(len(text_shingles))
+        values.extend(text_shingles)
+
+    values = np.array(values, dtype=np.uint64) % MERSENNE_PRIME
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+    rand = np.random.RandomState(seed)
+    a = rand.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+    b = rand.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    signatures = np.empty((len(lengths), num_perm), dtype=np.uint64)
+
+    if len(lengths) <= 0:
+        return signatures
+
+    for i in range(num_perm):
+        permuted = (a[i] * values + b[i]) % MERSENNE_PRIME
+        signatures[:, i] = np.minimum.reduceat(permuted, offsets)
+
+    return signatures
+
+
+def lsh_buckets(signatures, bands):
+    """
+    Group the texts by the hashes of the bands of their signatures.
+
+    Returns:
+        list: Arrays of the text-indices within a bucket
+              (only buckets with more than one text).
+    """
+    num_texts, num_perm = signatures.shape
+    rows = num_perm // bands
+    buckets = []
+
+    for band in range(bands):
+        band_values = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = band_values.view(np.dtype((np.void, band_values.dtype.itemsize * rows))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+        shared = counts[inverse] > 1
+        members = np.nonzero(shared)[0]
+
+        if len(members) <= 0:
+            continue
+
+        order = np.argsort(inverse[members], kind='stable')
+        members = members[order]
+        starts = np.nonzero(np.diff(inverse[members], prepend=-1))[0]
+
+        buckets.extend(np.split(members, starts[1:]))
+
+    return buckets
+
+
+class LeakageDetector(object):
+    """
+    Finds transcripts, that occur (exactly or nearly) in multiple splits.
+
+    Exact duplicates are found by the normalized transcripts.
+    Near duplicates are found with MinHash over word n-grams
+    and locality sensitive hashing (LSH). Only texts sharing an LSH bucket
+    are compared, so the runtime grows roughly linear with the number of texts.
+
+    Args:
+        threshold (float): Min. estimated jaccard similarity of near duplicates.
+        num_perm (int): Number of MinHash permutations.
+        bands (int): Number of LSH bands (``num_perm`` has to be a multiple).
+        shingle_size (int): Number of words per shingle.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=3):
+        if num_perm % bands != 0:
+            raise ValueError('num_perm has to be a multiple of bands')
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+
+    def detect(self, utt_ids, transcripts, split_masks):
+        """
+        Find transcripts, that occur in more than one split.
+
+        Args:
+            utt_ids (list): Utterance-ids.
+            transcripts (list): Transcript of every utterance.
+            split_masks (dict): Boolean mask over the utterances by split name.
+
+        Returns:
+            dict: Report with the exact and near duplicates
+                  and the utterances of every split, that are leaked.
+        """
+        split_names = sorted(split_masks.keys())
+
+        # Distinct texts and the splits they occur in (bit per split)
+        text_ordinals = {}
+        texts = []
+        utt_texts = np.full(len(utt_ids), -1, dtype=np.int64)
+        utt_flags = np.zeros(len(utt_ids), dtype=np.int64)
+
+        for i, name in enumerate(split_names):
+            utt_flags[split_masks[name]] |= 1 << i
+
+        for i in np.nonzero(utt_flags)[0].tolist():
+            text = normalize_transcript(transcripts[i])
+
+            if text == '':
+                continue
+
+            if text not in text_ordinals:
+                text_ordinals[text] = len(texts)
+                texts.append(text)
+
+            utt_texts[i] = text_ordinals[text]
+
+        in_text = utt_texts >= 0
+        text_flags = np.zeros(len(texts), dtype=np.int64)
+        np.bitwise_or.at(text_flags, utt_texts[in_text], utt_flags[in_text])
+
+        # Exact duplicates
+        exact = [t for t in range(len(texts)) if bin(text_flags[t]).count('1') > 1]
+
+        # Near duplicates (different texts in different splits)
+        signatures = minhash_signatures(
+            texts,
+            num_perm=self.num_perm,
+            shingle_size=self.shingle_size
+        )
+        near = self._near_duplicates(signatures, text_flags)
+
+        # Utterances of a text per split
+        text_utts = collections.defaultdict(list)
+        reported = set(exact)
+        reported.update(x for pair in near for x in pair[:2])
+
+        for i in np.nonzero(in_text)[0].tolist():
+            if utt_texts[i] in reported:
+                text_utts[utt_texts[i]].append(i)
+
+        def utterances_by_split(text_indices):
+            result = {}
+
+            for i, name in enumerate(split_names):
+                ids = sorted(
+                    utt_ids[u]
+                    for t in text_indices
+                    for u in text_utts[t]
+                    if utt_flags[u] & (1 << i)
+                )
+
+                if len(ids) > 0:
+                    result[name] = ids
+
+            return result
+
+        # Texts, that are shared with another split, by split
+        leaked = np.zeros(len(utt_ids), dtype=bool)
+
+        for t in exact:
+            leaked[text_utts[t]] = True
+
+        for a, b, _ in near:
+            if text_flags[a] != text_flags[b]:
+                leaked[text_utts[a]] = True
+                leaked[text_utts[b]] = True
+
+        return {
+            'num_utterances': int(np.count_nonzero(utt_flags)),
+            'num_texts': len(texts),
+            'splits': split_names,
+            'exact': [
+                {'text': texts[t], 'utterances': utterances_by_split([t])}
+                for t in exact
+            ],
+            'near': [
+                {
+                    'texts': [texts[a], texts[b]],
+                    'similarity': similarity,
+                    'utterances': utterances_by_split([a, b])
+                }
+                for a, b, similarity in near
+            ],
+            'leaked': leaked,
+        }
+
+    def _near_duplicates(self, signatures, text_flags):
+        """
+        Return the pairs (text a, text b, similarity) of different texts,
+        that are in different splits and have a similarity above the threshold.
+        Within an LSH bucket, the texts are grouped by their splits
+        and only texts of different groups are compared
+        (and texts of a group, that is in multiple splits).
+        """
+        pairs = {}
+
+        for bucket in lsh_buckets(signatures, self.bands):
+            flags = text_flags[bucket]
+            groups = [(f, bucket[flags == f]) for f in np.unique(flags)]
+
+            for i, (f, members) in enumerate(groups):
+                if bin(f).count('1') > 1:
+                    self._compare(signatures, members, members, pairs)
+
+                for _, other in groups[i + 1:]:
+                    self._compare(signatures, members, other, pairs)
+
+        return [
+            (a, b, similarity)
+            for (a, b), similarity in sorted(pairs.items())
+        ]
+
+    def _compare(self, signatures, members_a, members_b, pairs):
+        """
+        Add the pairs of texts from ``members_a`` and ``members_b``
+        with a similarity above the threshold to ``pairs``.
+        The signatures are compared in blocks of rows of ``members_a``.
+        """
+        signatures_b = signatures[members_b]
+        block_size = max(1, COMPARE_BLOCK_SIZE // len(members_b))
+
+        for start in range(0, len(members_a), block_size):
+            rows = members_a[start:start + block_size]
+            similarities = np.mean(signatures[rows][:, None, :] == signatures_b[None, :, :], axis=2)
+
+            for i, j in zip(*np.nonzero(similarities >= self.threshold)):
+                a, b = sorted((int(rows[i]), int(members_b[j])))
+
+                if a != b:
+                    pairs[(a, b)] = float(similarities[i, j])
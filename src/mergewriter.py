@@ -0,0 +1,233 @@
+import heapq
+import json
+import os
+import shutil
+
+from audiomate import issuers
+from audiomate import tracks
+from audiomate.corpus import io
+from audiomate.utils import naming
+
+import bitsets
+
+
+CHUNK_FOLDER = '.merge_chunks'
+
+
+def issuer_data(issuer):
+    """ Return the entry of the issuer in ``issuers.json`` (as the default writer). """
+    data = {}
+
+    if issuer.info is not None and len(issuer.info) > 0:
+        data['info'] = issuer.info
+
+    if type(issuer) == issuers.Speaker:
+        data['type'] = 'speaker'
+
+        if issuer.gender != issuers.Gender.UNKNOWN:
+            data['gender'] = issuer.gender.value
+
+        if issuer.age_group != issuers.AgeGroup.UNKNOWN:
+            data['age_group'] = issuer.age_group.value
+
+        if issuer.native_language not in ['', None]:
+            data['native_language'] = issuer.native_language
+
+    elif type(issuer) == issuers.Artist:
+        if issuer.name not in ['', None]:
+            data['name'] = issuer.name
+
+    return data
+
+
+def format_record(values):
+    return ' '.join(str(x) for x in values)
+
+
+def id_key(line):
+    return line.split(' ', 1)[0]
+
+
+def label_key(line):
+    """ Sort key of a label line, the same as of the records in the default writer. """
+    utt_idx, start, end, value = line.split(' ', 3)
+    return utt_idx, float(start), float(end), value
+
+
+def line_key(line):
+    return line
+
+
+class MergeWriter(object):
+    """
+    Writes the merge of multiple corpora in the default format,
+    visiting one source corpus at a time.
+    The result is the same as writing a corpus, to which the tracks,
+    issuers and utterances of all corpora were imported (in this order)
+    with ``audiomate.Corpus.save_at``.
+
+    Ids occurring in a previous corpus are suffixed as in ``audiomate.Corpus.import_*``.
+    The records of a corpus are written sorted to chunk files,
+    that are merged into the final (sorted) files at the end.
+    So besides the ids of all tracks, issuers and utterances,
+    only the records of a single corpus are held in memory.
+
+    Args:
+        path (str): Output folder.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunk_path = os.path.join(path, CHUNK_FOLDER)
+        os.makedirs(self.chunk_path)
+
+        self.track_ids = set()
+        self.issuer_ids = set()
+        self.utt_ids = set()
+
+        # Chunk files by output file name
+        self.chunks = {}
+        self.num_corpora = 0
+
+        # Issuers are written in import order, so they are not sorted
+        self.issuer_file = open(os.path.join(path, io.default.ISSUER_FILE_NAME), 'w', encoding='utf-8')
+        self.issuer_file.write('{')
+        self.num_issuers = 0
+
+    def add_corpus(self, corpus, subviews=None):
+        """
+        Add the tracks, issuers and utterances (with their labels) of the corpus.
+        The ids of the corpus objects are changed if they collide.
+
+        Args:
+            corpus (Corpus): The corpus.
+            subviews (dict): :class:`bitsets.UtteranceBitset` over the utterances of the corpus
+                             (ordered as in the corpus) by subview name. Subviews with the same
+                             name from multiple corpora contain the utterances of all of them.
+        """
+        records = {
+            io.default.FILES_FILE_NAME: [],
+            io.default.UTTERANCE_FILE_NAME: [],
+            io.default.UTT_ISSUER_FILE_NAME: [],
+        }
+
+        for track in corpus.tracks.values():
+            if not isinstance(track, tracks.FileTrack):
+                raise ValueError('Track {} is not a file, only file tracks are supported'.format(track.idx))
+
+            track.idx = naming.index_name_if_in_list(track.idx, self.track_ids)
+            self.track_ids.add(track.idx)
+            records[io.default.FILES_FILE_NAME].append(
+                (track.idx, os.path.relpath(track.path, self.path))
+            )
+
+        for issuer in corpus.issuers.values():
+            issuer.idx = naming.index_name_if_in_list(issuer.idx, self.issuer_ids)
+            self.issuer_ids.add(issuer.idx)
+
+            if self.num_issuers > 0:
+                self.issuer_file.write(', ')
+
+            self.issuer_file.write('{}: {}'.format(json.dumps(issuer.idx), json.dumps(issuer_data(issuer))))
+            self.num_issuers += 1
+
+        for utterance in corpus.utterances.values():
+            utterance.idx = naming.index_name_if_in_list(utterance.idx, self.utt_ids)
+            self.utt_ids.add(utterance.idx)
+
+            end = utterance.end
+
+            if end == float('inf'):
+                end = -1
+
+            records[io.default.UTTERANCE_FILE_NAME].append(
+                (utterance.idx, utterance.track.idx, utterance.start, end)
+            )
+
+            if utterance.issuer is not None:
+                records[io.default.UTT_ISSUER_FILE_NAME].append((utterance.idx, utterance.issuer.idx))
+
+            for ll_idx, label_list in utterance.label_lists.items():
+                file_name = '{}_{}.txt'.format(io.default.LABEL_FILE_PREFIX, ll_idx)
+                ll_records = records.setdefault(file_name, [])
+
+                for label in label_list:
+                    end = label.end
+
+                    if end == float('inf'):
+                        end = -1
+
+                    value = label.value
+
+                    if len(label.meta) > 0:
+                        value = '{} [{}]'.format(value, json.dumps(label.meta, sort_keys=True))
+
+                    ll_records.append((utterance.idx, label.start, end, value))
+
+        if subviews is not None:
+            # Ids after renaming, in the order of the ordinals
+            utt_ids = [u.idx for u in corpus.utterances.values()]
+
+            for name, bitset in subviews.items():
+                file_name = '{}_{}.txt'.format(bitsets.SUBVIEW_FILE_PREFIX, name)
+                records[file_name] = [(utt_ids[i],) for i in bitset.mask.nonzero()[0]]
+
+        for file_name, file_records in records.items():
+            self.write_chunk(file_name, sorted(file_records))
+
+        self.num_corpora += 1
+
+    def write_chunk(self, file_name, records):
+        chunk_path = os.path.join(self.chunk_path, '{}.{}'.format(file_name, self.num_corpora))
+
+        with open(chunk_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(format_record(record))
+                f.write('\n')
+
+        self.chunks.setdefault(file_name, []).append(chunk_path)
+
+    def close(self):
+        """
+        Merge the chunks into the final files and remove the chunks.
+        """
+        self.issuer_file.write('}')
+        self.issuer_file.close()
+
+        subview_prefix = '{}_'.format(bitsets.SUBVIEW_FILE_PREFIX)
+
+        for file_name, chunk_paths in self.chunks.items():
+            chunk_files = [open(x, 'r', encoding='utf-8') for x in chunk_paths]
+            lines = [(line.rstrip('\n') for line in f) for f in chunk_files]
+
+            if file_name.startswith(subview_prefix):
+                key = line_key
+            elif file_name.startswith(io.default.LABEL_FILE_PREFIX):
+                key = label_key
+            else:
+                key = id_key
+
+            merged = heapq.merge(*lines, key=key)
+
+            with open(os.path.join(self.path, file_name), 'w', encoding='utf-8') as f:
+                if file_name.startswith(subview_prefix):
+                    f.write('matching_utterance_ids\ninclude,')
+
+                    for i, utt_idx in enumerate(merged):
+                        if i > 0:
+                            f.write(',')
+
+                        f.write(utt_idx)
+                else:
+                    for line in merged:
+                        f.write(line)
+                        f.write('\n')
+
+            for chunk_file in chunk_files:
+                chunk_file.close()
+
+        # No container tracks and feature containers
+        for file_name in [io.default.AUDIO_CONTAINER_FILE_NAME, io.default.FEAT_CONTAINER_FILE_NAME]:
+            open(os.path.join(self.path, file_name), 'w').close()
+
+        shutil.rmtree(self.chunk_path)
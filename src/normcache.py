@@ -0,0 +1,119 @@
+import glob
+import hashlib
+import os
+import sqlite3
+
+import spoteno
+
+
+class NormalizationCache(object):
+    """
+    On-disk cache (SQLite) of normalized transcripts.
+    Entries are keyed by the hash of the transcript
+    and the signature of the normalizer,
+    so a changed normalizer never returns stale entries.
+
+    Args:
+        path (str): Path of the database file.
+        signature (str): Signature of the normalizer
+                         (see :func:`normalizer_signature`).
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS normalized ('
+            'signature TEXT, key BLOB, value TEXT, '
+            'PRIMARY KEY (signature, key)) WITHOUT ROWID'
+        )
+
+    @staticmethod
+    def key(transcript):
+        return hashlib.sha1(transcript.encode('utf-8')).digest()
+
+    def lookup(self, transcripts, batch_size=500):
+        """
+        Return a dict with the cached normalization of all given
+        transcripts, that are in the cache.
+        """
+        keys = {self.key(t): t for t in set(transcripts)}
+        key_list = list(keys.keys())
+        result = {}
+
+        for i in range(0, len(key_list), batch_size):
+            batch = key_list[i:i + batch_size]
+            query = 'SELECT key, value FROM normalized WHERE signature = ? AND key IN ({})'.format(
+                ','.join(['?'] * len(batch))
+            )
+
+            for key, value in self.connection.execute(query, [self.signature] + batch):
+                result[keys[key]] = value
+
+        self.hits += len(result)
+        self.misses += len(keys) - len(result)
+
+        return result
+
+    def store(self, normalized):
+        """
+        Store the given dict (transcript -> normalized transcript).
+        """
+        records = [
+            (self.signature, self.key(t), n)
+            for t, n in normalized.items()
+        ]
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO normalized VALUES (?, ?, ?)',
+                records
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def normalizer_signature(**kwargs):
+    """
+    Return a signature of the spoteno normalizer.
+    It covers the version, the given configuration arguments
+    and the content of the package (steps, configuration, resources),
+    so local changes to the rules invalidate the cache as well.
+    """
+    h = hashlib.new('md5')
+    h.update(spoteno.__version__.encode('utf-8'))
+    h.update(repr(sorted(kwargs.items())).encode('utf-8'))
+
+    package_path = os.path.dirname(spoteno.__file__)
+    package_files = glob.glob(os.path.join(package_path, '**', '*.*'), recursive=True)
+
+    for path in sorted(package_files):
+        if path.endswith('.py') or path.endswith('.json'):
+            h.update(os.path.relpath(path, package_path).encode('utf-8'))
+
+            with open(path, 'rb') as f:
+                h.update(f.read())
+
+    return h.hexdigest()
+
+
+def normalize_list(transcripts, normalizer, cache):
+    """
+    Normalize the given transcripts and return them in the same order.
+    Only distinct transcripts, that are not in the cache, are normalized.
+    """
+    normalized = cache.lookup(transcripts)
+    missing = sorted(set(transcripts) - set(normalized.keys()))
+
+    if len(missing) > 0:
+        result = normalizer.normalize_list(missing)
+        new_entries = dict(zip(missing, result))
+        cache.store(new_entries)
+        normalized.update(new_entries)
+
+    return [normalized[t] for t in transcripts]
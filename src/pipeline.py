@@ -0,0 +1,351 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from concurrent import futures
+
+import digests
+
+
+STATE_FOLDER = '.pipeline'
+
+
+class Stage(object):
+    """
+    A single step of the pipeline, that is executed as a subprocess.
+
+    A stage is skipped if the digest of its command, its script, the modules
+    of the pipeline's code folders and its inputs didn't change since the last successful run
+    and its outputs are still the same as they were after that run.
+
+    Args:
+        name (str): Unique name of the stage.
+        command (list): The command to execute.
+                        Python scripts are given by their path,
+                        they are run with the current interpreter.
+        inputs (list): Files/Folders the stage reads.
+        outputs (list): Files/Folders the stage writes.
+        after (list): Names of stages, that have to run before,
+                      in addition to the ones found by inputs/outputs.
+        clean (bool): If ``True``, outputs are deleted before
+                      a stale stage is rerun.
+                      Otherwise the script itself has to deal with
+                      already existing outputs.
+    """
+
+    def __init__(self, name, command, inputs=(), outputs=(), after=(),
+                 clean=True):
+        self.name = name
+        self.command = list(command)
+        self.inputs = [os.path.abspath(x) for x in inputs]
+        self.outputs = [os.path.abspath(x) for x in outputs]
+        self.after = list(after)
+        self.clean = clean
+
+    @property
+    def scripts(self):
+        return [x for x in self.command if x.endswith('.py')]
+
+    def argv(self):
+        if self.command[0].endswith('.py'):
+            return [sys.executable] + self.command
+
+        return self.command
+
+
+def contains(parent, child):
+    return child == parent or child.startswith(parent + os.sep)
+
+
+class Pipeline(object):
+    """
+    Runs stages as a DAG.
+    Dependencies are derived from the paths stages read and write.
+    Independent stages are run concurrently.
+
+    The state of the last runs and the digest cache are stored
+    in ``<data_folder>/.pipeline``.
+
+    Args:
+        stages (list): List of :class:`Stage`.
+        data_folder (str): The folder all data is stored in.
+        num_workers (int): Max. number of stages to run at once.
+        env (dict): Environment for the subprocesses.
+        code_folders (list): Folders with modules (``*.py``) imported by the scripts.
+                             A change of a module reruns all stages.
+    """
+
+    def __init__(self, stages, data_folder, num_workers=2, env=None, code_folders=()):
+        self.stages = {s.name: s for s in stages}
+        self.order = [s.name for s in stages]
+        self.num_workers = num_workers
+        self.hash_workers = os.cpu_count() or 1
+        self.env = env
+        self.code_folders = [os.path.abspath(x) for x in code_folders]
+        self._code_digest = None
+
+        self.state_folder = os.path.join(data_folder, STATE_FOLDER)
+        self.state_path = os.path.join(self.state_folder, 'state.json')
+        self.runs_path = os.path.join(self.state_folder, 'runs.jsonl')
+        self.cache = digests.DigestCache(
+            os.path.join(self.state_folder, 'digests.json')
+        )
+
+        self.state = {}
+
+        if os.path.isfile(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+        self.dependencies = self._find_dependencies()
+
+    def _find_dependencies(self):
+        deps = {}
+
+        for name, stage in self.stages.items():
+            stage_deps = set(x for x in stage.after if x in self.stages)
+
+            for other_name, other in self.stages.items():
+                if other_name == name:
+                    continue
+
+                for path in stage.inputs:
+                    for out in other.outputs:
+                        if contains(out, path) or contains(path, out):
+                            stage_deps.add(other_name)
+
+            deps[name] = stage_deps
+
+        return deps
+
+    def required_stages(self, targets):
+        """
+        Return the given stages and all stages they depend on,
+        in definition order.
+        """
+        if targets is None or len(targets) <= 0:
+            return list(self.order)
+
+        required = set()
+        pending = list(targets)
+
+        while len(pending) > 0:
+            name = pending.pop()
+
+            if name not in self.stages:
+                raise ValueError('Unknown stage {}'.format(name))
+
+            if name not in required:
+                required.add(name)
+                pending.extend(self.dependencies[name])
+
+        return [x for x in self.order if x in required]
+
+    def _foreign_outputs(self, stage):
+        """ Outputs of other stages, that are not part of the inputs. """
+        paths = set()
+
+        for other in self.stages.values():
+            if other.name != stage.name:
+                paths.update(other.outputs)
+
+        return paths - set(stage.inputs)
+
+    def code_digest(self):
+        """ Digest of the modules in the code folders (computed once). """
+        if self._code_digest is None:
+            h = hashlib.new('md5')
+
+            for folder in self.code_folders:
+                paths = [
+                    os.path.join(folder, x)
+                    for x in digests.list_files(folder)
+                    if x.endswith('.py')
+                ]
+                file_digests = digests.digest_files(paths, cache=self.cache)
+
+                for path in paths:
+                    h.update('{} {}'.format(path, file_digests[path]).encode('utf-8'))
+
+            self._code_digest = h.hexdigest()
+
+        return self._code_digest
+
+    def stage_key(self, stage):
+        h = hashlib.new('md5')
+        h.update(json.dumps(stage.command).encode('utf-8'))
+        h.update(self.code_digest().encode('utf-8'))
+
+        for script in stage.scripts:
+            if os.path.isfile(script):
+                h.update(digests.file_digest(script, cache=self.cache).encode('utf-8'))
+
+        exclude = self._foreign_outputs(stage)
+
+        for path in stage.inputs:
+            digest = digests.path_digest(
+                path,
+                cache=self.cache,
+                exclude=exclude,
+                num_workers=self.hash_workers
+            )
+            h.update('{} {}'.format(path, digest).encode('utf-8'))
+
+        return h.hexdigest()
+
+    def output_digests(self, stage):
+        return {
+            path: digests.path_digest(path, cache=self.cache, num_workers=self.hash_workers)
+            for path in stage.outputs
+        }
+
+    def is_up_to_date(self, stage, key):
+        last = self.state.get(stage.name)
+
+        if last is None or last['key'] != key:
+            return False
+
+        return last['outputs'] == self.output_digests(stage)
+
+    def run(self, targets=None, force=(), dry_run=False):
+        """
+        Run the pipeline.
+
+        Args:
+            targets (list): Only run these stages (and their dependencies).
+                            If ``None`` all stages are run.
+            force (list): Names of stages, that are rerun in any case.
+            dry_run (bool): Only print which stages would run.
+
+        Returns:
+            bool: ``True`` if all stages succeeded or were up to date.
+        """
+        names = self.required_stages(targets)
+        status = {}
+        timings = {}
+        running = {}
+
+        with futures.ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            while len(status) < len(names):
+                running_names = [x[0] for x in running.values()]
+                pending = [n for n in names if n not in status and n not in running_names]
+                num_decided = len(status) + len(running)
+
+                for name in pending:
+                    deps = [status.get(d) for d in self.dependencies[name]]
+
+                    if any(d in ['failed', 'blocked'] for d in deps):
+                        print('[{}] blocked by failed dependency'.format(name))
+                        status[name] = 'blocked'
+                        continue
+
+                    if not all(d in ['done', 'skipped', 'would run'] for d in deps):
+                        continue
+
+                    stage = self.stages[name]
+
+                    if dry_run:
+                        # Stages after one that would run are considered stale,
+                        # since the new outputs are not known yet
+                        stale = name in force or 'would run' in deps
+
+                        if stale or not self.is_up_to_date(stage, self.stage_key(stage)):
+                            print('[{}] would run'.format(name))
+                            status[name] = 'would run'
+                        else:
+                            print('[{}] up to date'.format(name))
+                            status[name] = 'skipped'
+                        continue
+
+                    key = self.stage_key(stage)
+
+                    if name not in force and self.is_up_to_date(stage, key):
+                        print('[{}] up to date'.format(name))
+                        status[name] = 'skipped'
+                    else:
+                        print('[{}] start'.format(name))
+                        future = executor.submit(self._execute, stage)
+                        running[future] = (name, key)
+
+                if len(running) <= 0:
+                    if len(status) == num_decided and len(status) < len(names):
+                        raise ValueError('Cyclic dependencies between {}'.format(pending))
+
+                    continue
+
+                finished, __ = futures.wait(
+                    list(running.keys()),
+                    return_when=futures.FIRST_COMPLETED
+                )
+
+                for future in finished:
+                    name, key = running.pop(future)
+                    stage = self.stages[name]
+                    returncode, duration = future.result()
+                    timings[name] = duration
+
+                    if returncode == 0:
+                        status[name] = 'done'
+                        self.state[name] = {
+                            'key': key,
+                            'outputs': self.output_digests(stage),
+                            'duration': duration,
+                            'finished': datetime.datetime.now().isoformat(),
+                        }
+                        self._save_state()
+                    else:
+                        status[name] = 'failed'
+
+                    print('[{}] {} after {:.1f}s'.format(name, status[name], duration))
+                    self._log_run(name, status[name], duration)
+
+        self.print_summary(names, status, timings)
+        return all(status[n] in ['done', 'skipped', 'would run'] for n in names)
+
+    def _execute(self, stage):
+        if stage.clean:
+            for path in stage.outputs:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.isfile(path):
+                    os.remove(path)
+
+        start = time.time()
+        returncode = subprocess.call(stage.argv(), env=self.env)
+        return returncode, time.time() - start
+
+    def _save_state(self):
+        os.makedirs(self.state_folder, exist_ok=True)
+        tmp_path = '{}.tmp'.format(self.state_path)
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+
+        os.replace(tmp_path, self.state_path)
+        self.cache.save()
+
+    def _log_run(self, name, status, duration):
+        os.makedirs(self.state_folder, exist_ok=True)
+        record = {
+            'stage': name,
+            'status': status,
+            'duration': duration,
+            'finished': datetime.datetime.now().isoformat(),
+        }
+
+        with open(self.runs_path, 'a', encoding='utf-8') as f:
+            f.write('{}\n'.format(json.dumps(record)))
+
+    def print_summary(self, names, status, timings):
+        print('-' * 40)
+
+        for name in names:
+            if name in timings:
+                print('{:<30} {:<10} {:10.1f}s'.format(name, status[name], timings[name]))
+            else:
+                print('{:<30} {:<10}'.format(name, status[name]))
@@ -0,0 +1,182 @@
+import os
+
+import numpy as np
+
+import arrays
+
+
+class CharacterRatios(object):
+    """
+    Number of transcript characters (without spaces) and duration of every utterance,
+    from which the characters per second are computed for all utterances at once.
+    Utterances whose ratio can't be computed (e.g. unreadable track, missing transcript)
+    have an error message instead.
+
+    Args:
+        utt_ids (list): Utterance-ids.
+        num_chars (np.ndarray): Number of characters of every utterance.
+        durations (np.ndarray): Duration of every utterance in seconds.
+        errors (list): Error message of every utterance (empty if there is none).
+    """
+
+    def __init__(self, utt_ids, num_chars, durations, errors):
+        self.utt_ids = list(utt_ids)
+        self.num_chars = np.asarray(num_chars, dtype=np.int64)
+        self.durations = np.asarray(durations, dtype=np.float64)
+        self.errors = list(errors)
+
+        self.has_error = np.array([x != '' for x in self.errors], dtype=bool)
+        self.rates = np.full(len(self.utt_ids), np.nan, dtype=np.float64)
+        valid = ~self.has_error
+        self.rates[valid] = self.num_chars[valid] / self.durations[valid]
+
+    @classmethod
+    def of_corpus(cls, corpus, track_durations, label_list_idx):
+        """
+        Collect the characters and durations of the utterances of the corpus.
+
+        Args:
+            corpus (Corpus): The corpus.
+            track_durations (dict): Duration (or error message) by track-id,
+                                    used for utterances ending with their track.
+            label_list_idx (str): Label-list with the transcripts.
+        """
+        num_utterances = corpus.num_utterances
+        utt_ids = []
+        num_chars = np.zeros(num_utterances, dtype=np.int64)
+        durations = np.full(num_utterances, np.nan, dtype=np.float64)
+        errors = []
+
+        for i, utterance in enumerate(corpus.utterances.values()):
+            utt_ids.append(utterance.idx)
+            error = ''
+
+            try:
+                if utterance.end == float('inf'):
+                    end = track_durations[utterance.track.idx]
+
+                    if isinstance(end, str):
+                        raise RuntimeError(end)
+                else:
+                    end = utterance.end
+
+                duration = end - utterance.start
+                ll = utterance.label_lists[label_list_idx]
+
+                # We count the characters of all labels
+                num_chars[i] = sum(len(label.value.replace(' ', '')) for label in ll)
+
+                if duration == 0:
+                    raise ZeroDivisionError('float division by zero')
+
+                durations[i] = duration
+            except Exception as e:
+                error = str(e)
+
+            errors.append(error)
+
+        return cls(utt_ids, num_chars, durations, errors)
+
+    def save(self, path):
+        utt_blob, utt_offsets = arrays.encode_strings(self.utt_ids)
+        error_blob, error_offsets = arrays.encode_strings(self.errors)
+        tmp_path = '{}.tmp.npz'.format(path[:-len('.npz')])
+
+        np.savez(
+            tmp_path,
+            utt_blob=utt_blob,
+            utt_offsets=utt_offsets,
+            num_chars=self.num_chars,
+            durations=self.durations,
+            error_blob=error_blob,
+            error_offsets=error_offsets
+        )
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                arrays.decode_strings(data['utt_blob'], data['utt_offsets']),
+                data['num_chars'],
+                data['durations'],
+                arrays.decode_strings(data['error_blob'], data['error_offsets'])
+            )
+
+    def invalid_mask(self, min_rate=None, max_rate=None):
+        """
+        Return a mask of the utterances with less than ``min_rate``
+        or more than ``max_rate`` characters per second or an error.
+        """
+        mask = self.has_error.copy()
+        valid = ~self.has_error
+
+        if min_rate is not None:
+            mask[valid] |= self.rates[valid] < min_rate
+
+        if max_rate is not None:
+            mask[valid] |= self.rates[valid] > max_rate
+
+        return mask
+
+    def invalid_items(self, min_rate=None, max_rate=None):
+        """
+        Return the characters per second (or the error message)
+        of the invalid utterances by utterance-id.
+        """
+        result = {}
+
+        for i in np.nonzero(self.invalid_mask(min_rate, max_rate))[0].tolist():
+            if self.has_error[i]:
+                result[self.utt_ids[i]] = self.errors[i]
+            else:
+                result[self.utt_ids[i]] = float(self.rates[i])
+
+        return result
+
+    def sweep(self, min_rates, max_rates):
+        """
+        Evaluate all combinations of the thresholds.
+        The ratios are sorted once, the number and duration of the rejected utterances
+        of every combination are then found by binary search.
+        Utterances with an error are always rejected, utterances with an unknown ratio
+        (e.g. duration ``nan``) never, as in :meth:`invalid_mask`.
+
+        Args:
+            min_rates (list): Min. characters per second (``None`` for no limit).
+            max_rates (list): Max. characters per second (``None`` for no limit).
+
+        Returns:
+            list: Dict per combination with the thresholds, the number of rejected utterances,
+                  their hours (without the utterances with an error, which have no duration)
+                  and the number of utterances with an error.
+        """
+        valid = ~self.has_error & ~np.isnan(self.rates)
+        order = np.argsort(self.rates[valid], kind='stable')
+        sorted_rates = self.rates[valid][order]
+        cumulative = np.concatenate([[0.0], np.cumsum(self.durations[valid][order])])
+        num_errors = int(np.count_nonzero(self.has_error))
+        rows = []
+
+        for min_rate in min_rates:
+            lower = 0 if min_rate is None else int(np.searchsorted(sorted_rates, min_rate, side='left'))
+
+            for max_rate in max_rates:
+                if max_rate is None:
+                    upper = len(sorted_rates)
+                else:
+                    upper = int(np.searchsorted(sorted_rates, max_rate, side='right'))
+
+                upper = max(lower, upper)
+                kept_seconds = cumulative[upper] - cumulative[lower]
+
+                rows.append({
+                    'min_characters_per_second': min_rate,
+                    'max_characters_per_second': max_rate,
+                    'rejected_utterances': len(sorted_rates) - (upper - lower) + num_errors,
+                    'rejected_hours': float(cumulative[-1] - kept_seconds) / 3600,
+                    'errors': num_errors,
+                })
+
+        return rows
@@ -0,0 +1,185 @@
+import json
+import os
+
+import numpy as np
+
+import arrays
+
+
+INDEX_FILE_NAME = 'index.npz'
+META_FILE_NAME = 'meta.json'
+SHARD_FILE_PATTERN = 'shard_{:05d}.pcm'
+
+
+class ShardWriter(object):
+    """
+    Writes utterances as raw int16 PCM into large shard files.
+    A new shard is started, once the current one exceeds ``max_shard_size`` bytes.
+    The index (utterance-id, shard, offset, length) is written on ``close``.
+
+    Args:
+        path (str): Output folder.
+        sampling_rate (int): Sampling rate of all utterances.
+        max_shard_size (int): Max. size of a shard in bytes.
+    """
+
+    def __init__(self, path, sampling_rate=16000, max_shard_size=2 ** 30):
+        self.path = path
+        self.sampling_rate = sampling_rate
+        self.max_shard_size = max_shard_size
+
+        self.utt_ids = []
+        self.shard_numbers = []
+        self.offsets = []
+        self.lengths = []
+
+        self.shard_names = []
+        self.shard_file = None
+        self.shard_offset = 0
+
+        os.makedirs(path, exist_ok=True)
+
+    def _next_shard(self):
+        if self.shard_file is not None:
+            self.shard_file.close()
+
+        name = SHARD_FILE_PATTERN.format(len(self.shard_names))
+        self.shard_names.append(name)
+        self.shard_file = open(os.path.join(self.path, name), 'wb')
+        self.shard_offset = 0
+
+    def add(self, utt_idx, samples):
+        """
+        Append the samples (int16) of an utterance.
+        """
+        samples = np.asarray(samples, dtype='<i2')
+
+        if self.shard_file is None or self.shard_offset * 2 >= self.max_shard_size:
+            self._next_shard()
+
+        self.shard_file.write(samples.tobytes())
+
+        self.utt_ids.append(utt_idx)
+        self.shard_numbers.append(len(self.shard_names) - 1)
+        self.offsets.append(self.shard_offset)
+        self.lengths.append(samples.size)
+
+        self.shard_offset += samples.size
+
+    def close(self):
+        if self.shard_file is not None:
+            self.shard_file.close()
+            self.shard_file = None
+
+        blob, offsets = arrays.encode_strings(self.utt_ids)
+        tmp_path = os.path.join(self.path, 'index.tmp.npz')
+
+        np.savez(
+            tmp_path,
+            utt_blob=blob,
+            utt_offsets=offsets,
+            shard=np.array(self.shard_numbers, dtype=np.int32),
+            offset=np.array(self.offsets, dtype=np.int64),
+            length=np.array(self.lengths, dtype=np.int64)
+        )
+
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE_NAME))
+
+        with open(os.path.join(self.path, META_FILE_NAME), 'w') as f:
+            json.dump({
+                'sampling_rate': self.sampling_rate,
+                'dtype': 'int16',
+                'shards': self.shard_names,
+                'num_utterances': len(self.utt_ids),
+            }, f, indent=2)
+
+
+class ShardReader(object):
+    """
+    Random access to utterances stored with :class:`ShardWriter`.
+
+    Shards are memory-mapped (read-only) when they are first accessed,
+    so a reader can be created before worker processes are forked
+    and used in every worker.
+    Reading an utterance returns a view on the mapped shard without copying.
+
+    Args:
+        path (str): Folder containing the shards.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, META_FILE_NAME), 'r') as f:
+            self.meta = json.load(f)
+
+        with np.load(os.path.join(path, INDEX_FILE_NAME)) as data:
+            self.utt_ids = arrays.decode_strings(data['utt_blob'], data['utt_offsets'])
+            self.shard = data['shard']
+            self.offset = data['offset']
+            self.length = data['length']
+
+        self.ordinals = {idx: i for i, idx in enumerate(self.utt_ids)}
+        self._maps = {}
+        self._pid = os.getpid()
+
+    def __len__(self):
+        return len(self.utt_ids)
+
+    def __contains__(self, utt_idx):
+        return utt_idx in self.ordinals
+
+    @property
+    def sampling_rate(self):
+        return self.meta['sampling_rate']
+
+    @property
+    def num_shards(self):
+        return len(self.meta['shards'])
+
+    def _shard_map(self, shard_number):
+        # Mappings are not shared with forked processes,
+        # every process maps the shards itself
+        if self._pid != os.getpid():
+            self._maps = {}
+            self._pid = os.getpid()
+
+        if shard_number not in self._maps:
+            shard_path = os.path.join(self.path, self.meta['shards'][shard_number])
+
+            if os.path.getsize(shard_path) > 0:
+                self._maps[shard_number] = np.memmap(shard_path, dtype='<i2', mode='r')
+            else:
+                self._maps[shard_number] = np.zeros(0, dtype='<i2')
+
+        return self._maps[shard_number]
+
+    def _read_ordinal(self, i):
+        shard_map = self._shard_map(int(self.shard[i]))
+        start = int(self.offset[i])
+        return shard_map[start:start + int(self.length[i])]
+
+    def read(self, utt_idx):
+        """
+        Return the samples (int16) of the utterance.
+        """
+        return self._read_ordinal(self.ordinals[utt_idx])
+
+    def read_float(self, utt_idx):
+        """
+        Return the samples of the utterance as float32 in the range [-1, 1].
+        """
+        return self.read(utt_idx).astype(np.float32) / 32768.0
+
+    def duration(self, utt_idx):
+        return int(self.length[self.ordinals[utt_idx]]) / self.sampling_rate
+
+    def iter_shard(self, shard_number):
+        """
+        Iterate over all utterances of a shard in the order they are stored.
+
+        Returns:
+            generator: Tuples (utterance-id, samples).
+        """
+        for i in np.nonzero(self.shard == shard_number)[0]:
+            yield self.utt_ids[i], self._read_ordinal(i)
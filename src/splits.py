@@ -0,0 +1,161 @@
+import random
+
+import numpy as np
+
+from audiomate.corpus.subset import utils as subset_utils
+
+
+def issuer_totals(utt_issuers, values):
+    """
+    Sum the values of the utterances per issuer.
+
+    Args:
+        utt_issuers (list): Issuer-id of every utterance.
+        values (np.ndarray): Value of every utterance.
+
+    Returns:
+        tuple: Sorted issuer-ids, the position of the issuer (in the issuer-ids)
+               of every utterance and the sum of the values per issuer.
+    """
+    issuer_ids, utt_issuer_ordinals = np.unique(
+        np.array(utt_issuers, dtype=object),
+        return_inverse=True
+    )
+    totals = np.bincount(
+        utt_issuer_ordinals,
+        weights=np.asarray(values, dtype=np.float64),
+        minlength=len(issuer_ids)
+    )
+
+    return list(issuer_ids), utt_issuer_ordinals, totals
+
+
+def split_issuers_by_weight(issuer_ids, weights, proportions, seed):
+    """
+    Assign the issuers to the parts so the summed (integer) weights
+    match the proportions. This is the greedy assignment used by
+    ``Splitter.split_by_label_length(separate_issuers=True)``,
+    so with the same weights, proportions (same order) and seed,
+    the result is the same as from ``Splitter(corpus, seed)``.
+
+    Returns:
+        tuple: Part-ids (``sorted`` proportions)
+               and the index (in part-ids) of the part of every issuer.
+    """
+    part_ids = sorted(proportions.keys())
+    identifiers = {
+        issuer_idx: {'length': int(weight)}
+        for issuer_idx, weight in zip(issuer_ids, weights)
+    }
+
+    # The splitter draws the seed for the assignment from its own generator
+    issuer_splits = subset_utils.get_identifiers_splitted_by_weights(
+        identifiers,
+        proportions,
+        seed=random.Random(seed).random()
+    )
+
+    issuer_ordinals = {idx: i for i, idx in enumerate(issuer_ids)}
+    issuer_parts = np.zeros(len(issuer_ids), dtype=np.int64)
+
+    for part_idx, part_id in enumerate(part_ids):
+        for issuer_idx in issuer_splits.get(part_id, []):
+            issuer_parts[issuer_ordinals[issuer_idx]] = part_idx
+
+    return part_ids, issuer_parts
+
+
+def split_issuers_by_duration(durations, targets, rest_part, seed):
+    """
+    Assign whole issuers to parts, so that every part in ``targets``
+    gets as close as possible to (but not more than) its target duration.
+    All other issuers are assigned to ``rest_part``.
+
+    The issuers are shuffled with the seed. Every part takes the longest
+    prefix of the remaining (shuffled) issuers, that fits in the target,
+    and is then filled up with the remaining issuers that fit best.
+
+    Args:
+        durations (np.ndarray): Duration of every issuer.
+        targets (dict): Target duration (seconds) by part-id.
+        rest_part (str): Part-id receiving the rest.
+        seed (int): Seed for shuffling.
+
+    Returns:
+        tuple: Part-ids (``sorted`` parts including ``rest_part``)
+               and the index (in part-ids) of the part of every issuer.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    part_ids = sorted(set(targets.keys()) | {rest_part})
+    issuer_parts = np.full(len(durations), part_ids.index(rest_part), dtype=np.int64)
+    free = np.random.RandomState(seed).permutation(len(durations))
+
+    for part_id in sorted(targets.keys()):
+        target = targets[part_id]
+        cumulative = np.cumsum(durations[free])
+        num_prefix = int(np.searchsorted(cumulative, target, side='right'))
+        selected = [free[:num_prefix]]
+        gap = target - (cumulative[num_prefix - 1] if num_prefix > 0 else 0.0)
+        free = free[num_prefix:]
+
+        while len(free) > 0:
+            fits = np.nonzero(durations[free] <= gap)[0]
+
+            if len(fits) <= 0:
+                break
+
+            # Longest issuer that still fits
+            best = fits[np.argmax(durations[free[fits]])]
+            selected.append(free[best:best + 1])
+            gap -= durations[free[best]]
+            free = np.delete(free, best)
+
+        issuer_parts[np.concatenate(selected)] = part_ids.index(part_id)
+
+    return part_ids, issuer_parts
+
+
+def interleaved_order(utt_issuers, seed):
+    """
+    Return an order of the utterances, that alternates between the issuers:
+    first one utterance of every issuer, then a second one of every issuer
+    with more than one utterance and so on.
+    The issuers and the utterances of every issuer are shuffled with the seed.
+    So every prefix of the order covers as many issuers as possible.
+
+    Args:
+        utt_issuers (np.ndarray): Issuer (integer) of every utterance.
+        seed (int): Seed for shuffling.
+
+    Returns:
+        np.ndarray: Positions of the utterances.
+    """
+    utt_issuers = np.asarray(utt_issuers, dtype=np.int64)
+
+    if len(utt_issuers) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    rng = np.random.RandomState(seed)
+    _, issuers = np.unique(utt_issuers, return_inverse=True)
+    issuer_ranks = rng.permutation(issuers.max() + 1)
+
+    # Shuffled utterances, grouped by issuer
+    shuffled = rng.permutation(len(issuers))
+    grouped = shuffled[np.argsort(issuers[shuffled], kind='stable')]
+
+    # Position of every utterance within its issuer
+    grouped_issuers = issuers[grouped]
+    group_starts = np.searchsorted(grouped_issuers, grouped_issuers, side='left')
+    utt_ranks = np.zeros(len(issuers), dtype=np.int64)
+    utt_ranks[grouped] = np.arange(len(grouped)) - group_starts
+
+    return np.lexsort((issuer_ranks[issuers], utt_ranks))
+
+
+def take_duration(order, durations, target):
+    """
+    Return the longest prefix of the order with a total duration
+    of at most ``target``.
+    """
+    cumulative = np.cumsum(np.asarray(durations, dtype=np.float64)[order])
+    return order[:int(np.searchsorted(cumulative, target, side='right'))]
@@ -0,0 +1,218 @@
+import numpy as np
+
+from audiomate.corpus import subset
+
+
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+# Edges of the duration histogram in seconds
+HISTOGRAM_EDGES = np.arange(0, 26)
+
+
+def sequential_sum(values):
+    """
+    Sum the values one after the other (as a python loop would do).
+    ``np.sum`` uses pairwise summation, which gives slightly
+    different results than the sums computed by audiomate.
+    """
+    if len(values) <= 0:
+        return 0
+
+    return float(np.cumsum(values)[-1])
+
+
+def subview_mask(subview, utt_ordinals, num_utterances):
+    """
+    Return a boolean array with the utterances contained in the subview.
+
+    Filters on utterance-ids are resolved via the ordinals of the ids,
+    all other filters are evaluated with audiomate.
+
+    Args:
+        subview (Subview): The subview.
+        utt_ordinals (dict): Position of every utterance of the corpus.
+        num_utterances (int): Number of utterances in the corpus.
+
+    Returns:
+        np.ndarray: Mask with ``num_utterances`` items.
+    """
+    mask = np.ones(num_utterances, dtype=bool)
+    other_criteria = []
+
+    for criterion in subview.filter_criteria:
+        if isinstance(criterion, subset.MatchingUtteranceIdxFilter):
+            matching = np.zeros(num_utterances, dtype=bool)
+            ordinals = [
+                utt_ordinals[x] for x in criterion.utterance_idxs
+                if x in utt_ordinals
+            ]
+            matching[ordinals] = True
+
+            if criterion.inverse:
+                matching = ~matching
+
+            mask &= matching
+        else:
+            other_criteria.append(criterion)
+
+    if len(other_criteria) > 0:
+        matching = np.zeros(num_utterances, dtype=bool)
+        corpus = subview.corpus
+        ordinals = [
+            utt_ordinals[utt.idx] for utt in corpus.utterances.values()
+            if all(c.match(utt, corpus) for c in other_criteria)
+        ]
+        matching[ordinals] = True
+        mask &= matching
+
+    return mask
+
+
+class CorpusStats(object):
+    """
+    Statistics of a corpus and all its subviews.
+
+    All utterances are visited once to create arrays of the durations
+    and the issuers. Subviews are represented as boolean masks over these arrays,
+    so the statistics of all subviews are computed without
+    iterating over the utterances again.
+    Use :meth:`of_corpus` or :meth:`of_columnar` to create the statistics.
+
+    Args:
+        durations (np.ndarray): Duration of every utterance.
+        utt_issuers (np.ndarray): Position of the issuer (in ``issuer_ids``)
+                                  of every utterance, -1 if there is none.
+        issuer_ids (list): Ids of the issuers.
+        subview_masks (dict): Boolean mask over the utterances for every subview.
+    """
+
+    def __init__(self, durations, utt_issuers, issuer_ids, subview_masks):
+        self.durations = durations
+        self.utt_issuers = utt_issuers
+        self.issuer_ids = issuer_ids
+        self.subview_masks = subview_masks
+
+    @classmethod
+    def of_corpus(cls, corpus, duration_index):
+        """
+        Args:
+            corpus (Corpus): The corpus.
+            duration_index (DurationIndex): Duration index of the corpus.
+        """
+        utt_ids = list(corpus.utterances.keys())
+        utt_ordinals = {idx: i for i, idx in enumerate(utt_ids)}
+
+        issuer_ids = list(corpus.issuers.keys())
+        issuer_ordinals = {idx: i for i, idx in enumerate(issuer_ids)}
+
+        # -1 for utterances without issuer
+        utt_issuers = np.array([
+            issuer_ordinals[utt.issuer.idx] if utt.issuer is not None else -1
+            for utt in corpus.utterances.values()
+        ], dtype=np.int64)
+
+        subview_masks = {
+            name: subview_mask(subview, utt_ordinals, len(utt_ids))
+            for name, subview in corpus.subviews.items()
+        }
+
+        return cls(
+            duration_index.durations_of(utt_ids),
+            utt_issuers,
+            issuer_ids,
+            subview_masks
+        )
+
+    @classmethod
+    def of_columnar(cls, columnar_corpus, duration_index):
+        """
+        Args:
+            columnar_corpus (ColumnarCorpus): The cached corpus.
+            duration_index (DurationIndex): Duration index of the corpus.
+        """
+        subview_masks = {
+            name: columnar_corpus.subview_bitset(name).mask
+            for name in columnar_corpus.subview_names
+        }
+
+        return cls(
+            duration_index.durations_of(columnar_corpus.utt_ids),
+            np.array(columnar_corpus.utt_issuer, dtype=np.int64),
+            columnar_corpus.issuer_ids,
+            subview_masks
+        )
+
+    def summary(self, mask=None):
+        """
+        Return duration, number of utterances/issuers,
+        percentiles and histogram of the durations
+        for the utterances selected by the mask (all if ``None``).
+        """
+        if mask is None:
+            durations = self.durations
+            issuers = self.utt_issuers
+        else:
+            durations = self.durations[mask]
+            issuers = self.utt_issuers[mask]
+
+        num_issuers = len(np.unique(issuers[issuers >= 0]))
+
+        if len(durations) > 0:
+            percentiles = np.percentile(durations, PERCENTILES).tolist()
+        else:
+            percentiles = [0.0] * len(PERCENTILES)
+
+        counts, _ = np.histogram(durations, bins=HISTOGRAM_EDGES)
+
+        return {
+            'duration': sequential_sum(durations),
+            'num_utterances': int(len(durations)),
+            'num_issuers': num_issuers,
+            'duration_percentiles': {
+                str(p): v for p, v in zip(PERCENTILES, percentiles)
+            },
+            'duration_histogram': {
+                'edges': HISTOGRAM_EDGES.tolist(),
+                'counts': counts.tolist(),
+                'num_longer': int(np.sum(durations > HISTOGRAM_EDGES[-1])),
+            },
+        }
+
+    def issuer_totals(self):
+        """
+        Return the number of utterances and the summed duration for every issuer.
+        """
+        has_issuer = self.utt_issuers >= 0
+        issuers = self.utt_issuers[has_issuer]
+        num_issuers = len(self.issuer_ids)
+
+        counts = np.bincount(issuers, minlength=num_issuers)
+        totals = np.bincount(
+            issuers,
+            weights=self.durations[has_issuer],
+            minlength=num_issuers
+        )
+
+        ordered = sorted(enumerate(self.issuer_ids), key=lambda x: x[1])
+
+        return {
+            idx: {
+                'duration': float(totals[i]),
+                'num_utterances': int(counts[i]),
+            }
+            for i, idx in ordered
+        }
+
+    def info(self):
+        """
+        Return the statistics of the corpus, all subviews and all issuers.
+        """
+        cinfo = self.summary()
+        cinfo['num_issuers'] = len(self.issuer_ids)
+        cinfo['subviews'] = {
+            name: self.summary(mask)
+            for name, mask in sorted(self.subview_masks.items())
+        }
+        cinfo['issuers'] = self.issuer_totals()
+
+        return cinfo
@@ -0,0 +1,388 @@
+import io
+import json
+import math
+import os
+import wave
+
+import numpy as np
+from tqdm import tqdm
+
+
+# Share of the utterances per corpus (roughly as in the merged corpus)
+CORPUS_SHARES = {
+    'common_voice': 0.45,
+    'mailabs': 0.2,
+    'swc': 0.15,
+    'tuda': 0.1,
+    'voxforge': 0.1,
+}
+
+# Average number of utterances per speaker
+UTTS_PER_SPEAKER = {
+    'common_voice': 5,
+    'mailabs': 500,
+    'swc': 40,
+    'tuda': 20,
+    'voxforge': 10,
+}
+
+TUDA_MICROPHONES = ['kinect-raw', 'samson']
+
+SWC_UTTS_PER_ARTICLE = 20
+
+# A very low sampling rate (8 bit) keeps the wave files tiny
+WAV_SAMPLING_RATE = 1000
+
+# Silent MPEG-2 layer III frame (16 kHz, 8 kbit/s, mono, 576 samples),
+# all side info is zero, so no encoder is needed
+MP3_FRAME = bytes([0xFF, 0xF3, 0x18, 0xC0]) + bytes(32)
+MP3_FRAMES_PER_SECOND = 16000 / 576
+
+SECONDS_PER_WORD = 0.4
+
+# Share of utterances, that are longer than the max. train utterance duration
+LONG_UTTERANCE_RATE = 0.01
+LONG_UTTERANCE_WORDS = 70
+
+# Number of tracks per audio sub-folder
+TRACKS_PER_FOLDER = 1000
+
+WORDS = [
+    'der', 'die', 'das', 'und', 'ist', 'nicht', 'ein', 'eine', 'mit', 'auf',
+    'für', 'von', 'sich', 'dem', 'den', 'auch', 'es', 'an', 'als', 'wie',
+    'noch', 'nach', 'aber', 'nur', 'bei', 'über', 'wird', 'wurde', 'sind', 'hat',
+    'Haus', 'Stadt', 'Zeit', 'Jahr', 'Mensch', 'Tag', 'Kind', 'Frau', 'Mann', 'Welt',
+    'Land', 'Arbeit', 'Straße', 'Wasser', 'Schule', 'Bahnhof', 'Regierung', 'Woche', 'Musik', 'Sprache',
+    'groß', 'klein', 'schön', 'schnell', 'langsam', 'früh', 'spät', 'heute', 'morgen', 'gestern',
+    'gehen', 'kommen', 'sehen', 'sagen', 'machen', 'geben', 'finden', 'denken', 'sprechen', 'lesen',
+    'Universität', 'Geschichte', 'Gemeinde', 'Bürgermeister', 'Fußball', 'Bücher', 'Mädchen', 'Brücke', 'Grüße', 'Käse',
+    'zwei', 'drei', 'vier', 'fünf', 'zehn', 'hundert', 'tausend', 'erste', 'zweite', 'letzte',
+]
+
+
+class AudioPalette(object):
+    """
+    Renders the audio file (noise for wave, silence for mp3) of a duration
+    in whole seconds once and returns its bytes for every further file.
+    """
+
+    def __init__(self, seed=0):
+        self.rand = np.random.RandomState(seed)
+        self.rendered = {}
+
+    def get(self, seconds, audio_format):
+        key = (seconds, audio_format)
+
+        if key not in self.rendered:
+            if audio_format == 'mp3':
+                num_frames = int(math.ceil(seconds * MP3_FRAMES_PER_SECOND))
+                self.rendered[key] = MP3_FRAME * num_frames
+            else:
+                samples = self.rand.randint(120, 137, size=seconds * WAV_SAMPLING_RATE)
+                buffer = io.BytesIO()
+
+                with wave.open(buffer, 'wb') as f:
+                    f.setnchannels(1)
+                    f.setsampwidth(1)
+                    f.setframerate(WAV_SAMPLING_RATE)
+                    f.writeframes(samples.astype(np.uint8).tobytes())
+
+                self.rendered[key] = buffer.getvalue()
+
+        return self.rendered[key]
+
+
+class SyntheticCorpus(object):
+    """
+    Rows of a synthetic corpus, that is written in audiomate's default format.
+    The tracks are only stored as duration and format,
+    the audio files are created on writing.
+    """
+
+    def __init__(self):
+        self.track_ids = []
+        self.track_seconds = []
+        self.track_formats = []
+
+        self.utt_ids = []
+        self.utt_tracks = []
+        self.utt_starts = []
+        self.utt_ends = []
+        self.utt_issuers = []
+        self.transcripts = []
+
+        self.issuers = {}
+        self.subviews = {}
+
+    @property
+    def num_utterances(self):
+        return len(self.utt_ids)
+
+    def add_track(self, idx, seconds, audio_format='wav'):
+        self.track_ids.append(idx)
+        self.track_seconds.append(seconds)
+        self.track_formats.append(audio_format)
+
+    def add_utterance(self, idx, track_idx, issuer_idx, transcript, start=0, end=-1):
+        self.utt_ids.append(idx)
+        self.utt_tracks.append(track_idx)
+        self.utt_starts.append(start)
+        self.utt_ends.append(end)
+        self.utt_issuers.append(issuer_idx)
+        self.transcripts.append(transcript)
+
+    def add_speaker(self, idx, gender=None):
+        if idx not in self.issuers:
+            data = {'type': 'speaker'}
+
+            if gender is not None:
+                data['gender'] = gender
+
+            self.issuers[idx] = data
+
+    def write(self, path, palette):
+        """
+        Write the corpus with its audio files to ``path``.
+        """
+        os.makedirs(path, exist_ok=True)
+        track_files = []
+
+        for i, (idx, seconds, audio_format) in enumerate(tqdm(
+                list(zip(self.track_ids, self.track_seconds, self.track_formats)),
+                desc=os.path.basename(path))):
+            rel_path = os.path.join(
+                'audio',
+                '{:04d}'.format(i // TRACKS_PER_FOLDER),
+                '{}.{}'.format(idx, audio_format)
+            )
+            abs_path = os.path.join(path, rel_path)
+
+            if i % TRACKS_PER_FOLDER == 0:
+                os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+
+            with open(abs_path, 'wb') as f:
+                f.write(palette.get(seconds, audio_format))
+
+            track_files.append(rel_path)
+
+        write_lines(os.path.join(path, 'files.txt'), (
+            '{} {}'.format(idx, rel_path)
+            for idx, rel_path in zip(self.track_ids, track_files)
+        ))
+        write_lines(os.path.join(path, 'utterances.txt'), (
+            '{} {} {} {}'.format(*row)
+            for row in zip(self.utt_ids, self.utt_tracks, self.utt_starts, self.utt_ends)
+        ))
+        write_lines(os.path.join(path, 'utt_issuers.txt'), (
+            '{} {}'.format(*row)
+            for row in zip(self.utt_ids, self.utt_issuers)
+        ))
+        write_lines(os.path.join(path, 'labels_word-transcript.txt'), (
+            '{} 0 -1 {}'.format(*row)
+            for row in zip(self.utt_ids, self.transcripts)
+        ))
+        write_lines(os.path.join(path, 'audio.txt'), [])
+        write_lines(os.path.join(path, 'features.txt'), [])
+
+        with open(os.path.join(path, 'issuers.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.issuers, f)
+
+        for name, utt_ids in self.subviews.items():
+            sv_path = os.path.join(path, 'subview_{}.txt'.format(name))
+
+            with open(sv_path, 'w', encoding='utf-8') as f:
+                f.write('matching_utterance_ids\ninclude,{}'.format(','.join(sorted(utt_ids))))
+
+
+def write_lines(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+
+
+class TextSource(object):
+    """
+    Creates transcripts. Sentences are drawn from a pool,
+    so sentences are read by multiple speakers (as prompts in tuda or voxforge).
+    """
+
+    def __init__(self, rand, pool_size):
+        self.rand = rand
+        self.pool = [self.random_sentence() for _ in range(pool_size)]
+
+    def random_sentence(self, num_words=None):
+        if num_words is None:
+            num_words = self.rand.randint(3, 16)
+
+        words = [WORDS[i] for i in self.rand.randint(0, len(WORDS), size=num_words)]
+        text = ' '.join(words)
+        return text[0].upper() + text[1:]
+
+    def sentence(self):
+        """ Return a sentence (from the pool) and its duration in seconds. """
+        if self.rand.random_sample() < LONG_UTTERANCE_RATE:
+            text = self.random_sentence(LONG_UTTERANCE_WORDS)
+        else:
+            text = self.pool[self.rand.randint(0, len(self.pool))]
+
+        return text, duration_of(text)
+
+
+def duration_of(text):
+    return int(math.ceil(len(text.split(' ')) * SECONDS_PER_WORD)) + 1
+
+
+def speaker_of(rand, name, i, corpus):
+    """ Return the id of the speaker of the ``i``-th utterance. """
+    idx = '{}-spk{}'.format(name, i // UTTS_PER_SPEAKER[name])
+    corpus.add_speaker(idx, gender=['male', 'female'][rand.randint(0, 2)])
+    return idx
+
+
+def part_of_speaker(speaker_number):
+    """ Return the part (train/dev/test) of a speaker for corpora with predefined splits. """
+    return {0: 'dev', 1: 'test'}.get(speaker_number % 10, 'train')
+
+
+def create_common_voice(num_utterances, rand, texts):
+    corpus = SyntheticCorpus()
+    corpus.subviews = {'train': [], 'dev': [], 'test': []}
+
+    for i in range(num_utterances):
+        idx = 'common_voice_de_{:08d}'.format(i)
+        issuer_idx = speaker_of(rand, 'common_voice', i, corpus)
+        text, seconds = texts.sentence()
+
+        corpus.add_track(idx, seconds, audio_format='mp3')
+        corpus.add_utterance(idx, idx, issuer_idx, text)
+
+        part = part_of_speaker(i // UTTS_PER_SPEAKER['common_voice'])
+        corpus.subviews[part].append(idx)
+
+    return corpus
+
+
+def create_mailabs(num_utterances, rand, texts):
+    corpus = SyntheticCorpus()
+
+    for i in range(num_utterances):
+        issuer_idx = speaker_of(rand, 'mailabs', i, corpus)
+        idx = '{}-book{}_{:06d}'.format(issuer_idx, (i // 100) % 5, i)
+        text, seconds = texts.sentence()
+
+        corpus.add_track(idx, seconds)
+        corpus.add_utterance(idx, idx, issuer_idx, text)
+
+    return corpus
+
+
+def create_swc(num_utterances, rand, texts):
+    corpus = SyntheticCorpus()
+
+    # Articles are long tracks with consecutive utterances
+    for article_start in range(0, num_utterances, SWC_UTTS_PER_ARTICLE):
+        track_idx = 'swc-article{}'.format(article_start // SWC_UTTS_PER_ARTICLE)
+        article_end = min(num_utterances, article_start + SWC_UTTS_PER_ARTICLE)
+        start = 0
+
+        for i in range(article_start, article_end):
+            issuer_idx = speaker_of(rand, 'swc', i, corpus)
+            text, seconds = texts.sentence()
+
+            corpus.add_utterance(
+                '{}_{}'.format(track_idx, i - article_start),
+                track_idx,
+                issuer_idx,
+                text,
+                start=float(start),
+                end=float(start + seconds)
+            )
+            start += seconds
+
+        corpus.add_track(track_idx, start)
+
+    return corpus
+
+
+def create_tuda(num_utterances, rand, texts):
+    corpus = SyntheticCorpus()
+    corpus.subviews = {
+        '{}_{}'.format(part, mic): []
+        for part in ['train', 'dev', 'test']
+        for mic in TUDA_MICROPHONES
+    }
+
+    # Every sentence is recorded with all microphones
+    for i in range(int(math.ceil(num_utterances / len(TUDA_MICROPHONES)))):
+        issuer_idx = speaker_of(rand, 'tuda', i, corpus)
+        part = part_of_speaker(i // UTTS_PER_SPEAKER['tuda'])
+        text, seconds = texts.sentence()
+
+        for mic in TUDA_MICROPHONES:
+            if corpus.num_utterances >= num_utterances:
+                break
+
+            idx = 'tuda-{:08d}_{}'.format(i, mic)
+            corpus.add_track(idx, seconds)
+            corpus.add_utterance(idx, idx, issuer_idx, text)
+            corpus.subviews['{}_{}'.format(part, mic)].append(idx)
+
+    return corpus
+
+
+def create_voxforge(num_utterances, rand, texts):
+    corpus = SyntheticCorpus()
+
+    for i in range(num_utterances):
+        issuer_idx = speaker_of(rand, 'voxforge', i, corpus)
+        idx = '{}-session{}-de{:06d}'.format(issuer_idx, (i // 5) % 2, i)
+        text, seconds = texts.sentence()
+
+        corpus.add_track(idx, seconds)
+        corpus.add_utterance(idx, idx, issuer_idx, text)
+
+    return corpus
+
+
+CREATORS = {
+    'common_voice': create_common_voice,
+    'mailabs': create_mailabs,
+    'swc': create_swc,
+    'tuda': create_tuda,
+    'voxforge': create_voxforge,
+}
+
+
+def create_corpus(name, num_utterances, seed=0):
+    """
+    Create the rows of a synthetic corpus with the structure
+    (issuers, subviews, segmented tracks) of the corpus ``name``.
+
+    Returns:
+        SyntheticCorpus: The corpus.
+    """
+    rand = np.random.RandomState(seed)
+    texts = TextSource(rand, max(100, num_utterances // 4))
+    return CREATORS[name](num_utterances, rand, texts)
+
+
+def generate_corpora(folder, num_utterances, seed=0):
+    """
+    Write synthetic versions of all corpora in audiomate's default format
+    to ``folder`` (the same layout as the download folder).
+    The utterances are distributed to the corpora by ``CORPUS_SHARES``.
+
+    Returns:
+        dict: Number of utterances by corpus name.
+    """
+    palette = AudioPalette(seed=seed)
+    counts = {}
+
+    for i, name in enumerate(sorted(CORPUS_SHARES.keys())):
+        count = max(1, int(round(num_utterances * CORPUS_SHARES[name])))
+        corpus = create_corpus(name, count, seed=seed + i)
+        corpus.write(os.path.join(folder, name), palette)
+        counts[name] = corpus.num_utterances
+
+    return counts
@@ -1,16 +1,53 @@
+import multiprocessing
+import os
+
 import spoteno
 
 import audiomate
+from audiomate import tracks
+from audiomate.corpus import validation
 from audiomate.corpus.validation import base
+from audiomate.utils import audio
+from audiomate.utils import audioread
+from multiprocessing import pool
+from tqdm import tqdm
+
+import audioheaders
+import digests
+import ratios
+
+
+# Normalizer of a worker process, created once per process
+_worker_normalizer = None
+
+
+def _init_worker():
+    global _worker_normalizer
+    _worker_normalizer = spoteno.Normalizer.de(num_workers=1)
+
+
+def _debug_chunk(transcripts):
+    return _worker_normalizer.debug_list(transcripts)
 
 
 class TextNormalizationValidator(base.Validator):
     """
     Checks if the transcript can be normalized with spoteno.
+
+    Identical transcripts are only normalized once.
+    The distinct transcripts are processed in chunks
+    with multiple processes.
+
+    Args:
+        num_workers (int): Number of processes to use.
+        chunk_size (int): Number of transcripts per chunk.
     """
 
-    def __init__(self):
-        self.normalizer = spoteno.Normalizer.de()
+    def __init__(self, num_workers=1, chunk_size=2000):
+        # Parallelism is handled here, so spoteno must not start its own pool
+        self.normalizer = spoteno.Normalizer.de(num_workers=1)
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
 
     def name(self):
         return 'Normalization-Validator'
@@ -25,25 +62,28 @@ class TextNormalizationValidator(base.Validator):
         Returns:
             InvalidItemsResult: Validation result.
         """
-        utt_ids = []
-        transcripts = []
+        utt_transcripts = {}
         ll_idx = audiomate.corpus.LL_WORD_TRANSCRIPT
 
         for utt in corpus.utterances.values():
             transcript = utt.label_lists[ll_idx].join()
-            transcripts.append(transcript)
-            utt_ids.append(utt.idx)
+            utt_transcripts[utt.idx] = transcript
 
-        result = self.normalizer.debug_list(transcripts)
+        unique_transcripts = sorted(set(utt_transcripts.values()))
+        result = self.debug_transcripts(unique_transcripts)
 
-        invalid_utterances = {}
+        invalid_transcripts = {}
 
-        for i, (output, invalid_characters) in enumerate(result):
-            utt_idx = utt_ids[i]
-            transcript = transcripts[i]
+        for transcript, (output, invalid_characters) in zip(unique_transcripts, result):
             if len(invalid_characters) > 0 or len(output) <= 0:
+                invalid_transcripts[transcript] = list(invalid_characters)
+
+        invalid_utterances = {}
+
+        for utt_idx, transcript in utt_transcripts.items():
+            if transcript in invalid_transcripts:
                 invalid_utterances[utt_idx] = (
-                    transcript, list(invalid_characters)
+                    transcript, invalid_transcripts[transcript]
                 )
 
         passed = len(invalid_utterances) <= 0
@@ -52,5 +92,298 @@ class TextNormalizationValidator(base.Validator):
             passed,
             invalid_utterances,
             name=self.name(),
-            info={}
+            info={
+                'Number of transcripts': str(len(utt_transcripts)),
+                'Number of distinct transcripts': str(len(unique_transcripts)),
+            }
+        )
+
+    def debug_transcripts(self, transcripts):
+        """
+        Return the output of ``debug_list`` for all transcripts,
+        in the same order.
+        """
+        if self.num_workers <= 1:
+            return self.normalizer.debug_list(transcripts)
+
+        chunks = [
+            transcripts[i:i + self.chunk_size]
+            for i in range(0, len(transcripts), self.chunk_size)
+        ]
+
+        result = []
+
+        with multiprocessing.Pool(self.num_workers, initializer=_init_worker) as p:
+            for chunk_result in tqdm(p.imap(_debug_chunk, chunks), total=len(chunks),
+                                     desc='Normalize transcripts'):
+                result.extend(chunk_result)
+
+        return result
+
+
+def _check_track_header(item):
+    """
+    Helper for the thread pool, adds the header result
+    and the duration of a file to its entry (if not already there).
+    """
+    path, stat, entry = item
+    entry = dict(entry)
+
+    if 'header' not in entry or entry.get('header_version') != audioheaders.HEADER_VERSION:
+        entry['header'] = list(audioheaders.check_header(path))
+        entry['header_version'] = audioheaders.HEADER_VERSION
+
+    if 'duration' not in entry:
+        # Same as ``FileTrack.duration``, the error is kept as message
+        try:
+            with audioread.audio_open(path) as f:
+                entry['duration'] = f.duration
+        except Exception as ex:
+            entry['duration'] = str(ex)
+
+    return path, stat, entry
+
+
+def _read_track(item):
+    """
+    Helper for the process pool, runs the read and decode tiers for a file.
+    """
+    track_idx, path, stat, do_read, do_decode = item
+    entry = {}
+
+    if do_read:
+        # Use the check of audiomate to get the same messages
+        entry['read'] = validation.TrackReadValidator().validate_track(
+            tracks.FileTrack(track_idx, path)
+        )[1]
+
+    if do_decode and entry.get('read') is None:
+        entry['decode'] = _decode_file(path)
+
+    return path, stat, entry
+
+
+def _decode_file(path):
+    """ Decode the whole file, return an error message or ``None``. """
+    try:
+        num_samples = 0
+
+        for block in audio.read_blocks(path):
+            num_samples += block.size
+
+        if num_samples <= 0:
+            return 'No samples decoded'
+    except Exception as ex:
+        return str(ex) or ex.__class__.__name__
+
+    return None
+
+
+class TrackValidator(base.Validator):
+    """
+    Checks if the audio of the tracks is readable, in two tiers:
+
+    1. Header tier: The container/header of the file is parsed
+       (without decoding). Wav/flac files with a consistent header are valid.
+       Files with an invalid header (e.g. no audio data) are invalid.
+    2. Read tier: Files the header tier can't decide on (e.g. all mp3/ogg files)
+       (or with an invalid header, to get the error message) are read
+       with the same check as ``TrackReadValidator`` (the first samples).
+       With ``full_decode`` all files are decoded completely.
+
+    The duration of every file is read in the same pass.
+    After the validation it is available in ``track_durations``
+    (duration or error message by track-id).
+
+    The results are stored per file, together with its size,
+    modification time and inode. Unchanged files are not checked again.
+
+    Args:
+        cache_path (str): Path of the json file to store the results.
+                          If ``None`` the results are not persisted.
+        num_workers (int): Number of processes for the read tier.
+        full_decode (bool): If ``True`` decode every file completely.
+    """
+
+    def __init__(self, cache_path=None, num_workers=1, full_decode=False):
+        self.cache = digests.DigestCache(cache_path)
+        self.num_workers = num_workers
+        self.full_decode = full_decode
+        self.track_durations = {}
+
+    def name(self):
+        return 'Track-Read'
+
+    def validate(self, corpus):
+        """
+        Perform the validation on the given corpus.
+
+        Args:
+            corpus (Corpus): The corpus to test/validate.
+
+        Returns:
+            InvalidItemsResult: Validation result.
+        """
+        file_tracks = {}
+        invalid_tracks = {}
+        self.track_durations = {}
+
+        for track in corpus.tracks.values():
+            if isinstance(track, tracks.FileTrack):
+                file_tracks[track.idx] = os.path.abspath(track.path)
+            else:
+                result = validation.TrackReadValidator().validate_track(track)[1]
+
+                if result is not None:
+                    invalid_tracks[track.idx] = result
+
+                try:
+                    self.track_durations[track.idx] = track.duration
+                except Exception as ex:
+                    self.track_durations[track.idx] = str(ex)
+
+        entries = {}
+        stats = {}
+
+        for path in set(file_tracks.values()):
+            stats[path] = os.stat(path)
+            entry = self.cache.lookup(path, stats[path])
+
+            if entry is not None:
+                entries[path] = entry
+
+        num_cached = sum(
+            1 for x in entries.values()
+            if 'duration' in x and x.get('header_version') == audioheaders.HEADER_VERSION
+        )
+
+        # Header tier (and durations)
+        to_check = [
+            (path, stat, entries.get(path, {}))
+            for path, stat in stats.items()
+            if path not in entries or 'duration' not in entries[path]
+            or entries[path].get('header_version') != audioheaders.HEADER_VERSION
+        ]
+
+        with pool.ThreadPool(max(self.num_workers, 1)) as p:
+            for path, stat, entry in tqdm(p.imap_unordered(_check_track_header, to_check,
+                                                           chunksize=64),
+                                          total=len(to_check), desc='Check headers'):
+                entries[path] = entry
+                self.cache.store(path, stat, entry)
+
+        # Read tier
+        to_read = []
+
+        for track_idx, path in sorted(file_tracks.items()):
+            entry = entries[path]
+            do_read = self._needs_read(entry) and 'read' not in entry
+            do_decode = self.full_decode and 'decode' not in entry
+
+            if do_read or do_decode:
+                to_read.append((track_idx, path, stats[path], do_read, do_decode))
+
+        with multiprocessing.Pool(max(self.num_workers, 1)) as p:
+            for path, stat, entry in tqdm(p.imap_unordered(_read_track, to_read, chunksize=16),
+                                          total=len(to_read), desc='Read tracks'):
+                entries[path].update(entry)
+                self.cache.store(path, stat, entries[path])
+
+        self.cache.save()
+
+        for track_idx, path in file_tracks.items():
+            self.track_durations[track_idx] = entries[path]['duration']
+            result = self._result(entries[path])
+
+            if result is not None:
+                invalid_tracks[track_idx] = result
+
+        passed = len(invalid_tracks) <= 0
+
+        return base.InvalidItemsResult(
+            passed,
+            invalid_tracks,
+            item_name='Tracks',
+            name=self.name(),
+            info={
+                'Number of files': str(len(stats)),
+                'Number of cached results': str(num_cached),
+                'Number of read files': str(len(to_read)),
+            }
         )
+
+    def _needs_read(self, entry):
+        return entry['header'][0] != audioheaders.HEADER_OK or self.full_decode
+
+    def _result(self, entry):
+        """ Return the error of a file (``None`` if valid). """
+        status, message = entry['header']
+
+        if not self._needs_read(entry):
+            return None
+
+        result = entry.get('read')
+
+        if result is None and status == audioheaders.HEADER_INVALID:
+            result = message
+
+        if result is None and self.full_decode:
+            result = entry.get('decode')
+
+        return result
+
+
+class CharacterRatioValidator(base.Validator):
+    """
+    Checks the characters per second of the utterances
+    like ``UtteranceTranscriptionRatioValidator``, but with the durations of the tracks
+    from a previous pass (see ``TrackValidator.track_durations``)
+    and optionally a lower limit.
+
+    The characters and durations are collected once into
+    :class:`ratios.CharacterRatios` (available in ``ratios`` after the validation),
+    so other thresholds can be evaluated without visiting the utterances again.
+
+    Args:
+        track_durations (dict): Duration (or error message) by track-id.
+        min_characters_per_second (float): Utterances with less characters per second
+                                           are invalid (``None`` for no limit).
+        max_characters_per_second (float): Utterances with more characters per second
+                                           are invalid (``None`` for no limit).
+        label_list_idx (str): The label-list with the transcripts.
+        ratios (CharacterRatios): Already collected ratios of the corpus.
+    """
+
+    def __init__(self, track_durations, min_characters_per_second=None,
+                 max_characters_per_second=25, label_list_idx=audiomate.corpus.LL_WORD_TRANSCRIPT,
+                 ratios=None):
+        self.track_durations = track_durations
+        self.min_characters_per_second = min_characters_per_second
+        self.max_characters_per_second = max_characters_per_second
+        self.label_list_idx = label_list_idx
+        self.ratios = ratios
+
+    def name(self):
+        return 'Utterance-Transcription-Ratio ({})'.format(self.label_list_idx)
+
+    def validate(self, corpus):
+        if self.ratios is None:
+            self.ratios = ratios.CharacterRatios.of_corpus(
+                corpus,
+                self.track_durations,
+                self.label_list_idx
+            )
+
+        invalid_utterances = self.ratios.invalid_items(
+            self.min_characters_per_second,
+            self.max_characters_per_second
+        )
+
+        passed = len(invalid_utterances) <= 0
+        info = {
+            'Threshold min. characters per second': str(self.min_characters_per_second),
+            'Threshold max. characters per second': str(self.max_characters_per_second),
+            'Label-List ID': self.label_list_idx
+        }
+
+        return base.InvalidItemsResult(passed, invalid_utterances, name=self.name(), info=info)
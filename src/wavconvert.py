@@ -0,0 +1,297 @@
+import json
+import multiprocessing
+import os
+import wave
+
+import sox
+from tqdm import tqdm
+
+from audiomate.corpus import conversion
+
+
+def _convert_item(item):
+    """
+    Convert a single file/segment (helper for the process pool).
+    The output is written to a temporary file first and renamed afterwards,
+    so an interrupted conversion never leaves a partial file at the target.
+    """
+    src, start, end, target, target_sr = item[:5]
+    tmp_target = '{}.tmp.wav'.format(target[:-len('.wav')])
+
+    tfm = sox.Transformer()
+
+    if start > 0 and end == float('inf'):
+        tfm.trim(start)
+    elif end != float('inf'):
+        tfm.trim(start, end)
+
+    tfm.convert(target_sr, 1, 16)
+    tfm.build(src, tmp_target)
+
+    os.replace(tmp_target, target)
+    return [item[5]]
+
+
+def _convert_track(item):
+    """
+    Convert all segments of a track (helper for the process pool).
+    The track is decoded and resampled once into a temporary wave file,
+    from which the segments are read by position and written to their targets.
+    """
+    src, segments, target_sr = item
+    first_target = segments[0][2]
+    tmp_track = os.path.join(
+        os.path.dirname(first_target),
+        '{}.track.tmp.wav'.format(os.path.basename(first_target)[:-len('.wav')])
+    )
+
+    tfm = sox.Transformer()
+    tfm.convert(target_sr, 1, 16)
+    tfm.build(src, tmp_track)
+
+    try:
+        with wave.open(tmp_track, 'rb') as f:
+            params = f.getparams()
+            sampling_rate = f.getframerate()
+            num_frames = f.getnframes()
+
+            # Ordered by position, so the file is read mostly forward
+            for start, end, target, _ in sorted(segments, key=lambda x: x[0]):
+                start_frame = min(int(round(start * sampling_rate)), num_frames)
+
+                if end == float('inf'):
+                    end_frame = num_frames
+                else:
+                    end_frame = min(int(round(end * sampling_rate)), num_frames)
+
+                f.setpos(start_frame)
+                data = f.readframes(max(0, end_frame - start_frame))
+                tmp_target = '{}.tmp.wav'.format(target[:-len('.wav')])
+
+                with wave.open(tmp_target, 'wb') as out:
+                    out.setparams(params)
+                    out.writeframes(data)
+
+                os.replace(tmp_target, target)
+    finally:
+        os.remove(tmp_track)
+
+    return [x[3] for x in segments]
+
+
+def _convert_unit(unit):
+    """ Convert a single file/segment or all segments of a track (helper for the process pool). """
+    kind, item = unit
+
+    if kind == 'track':
+        return _convert_track(item)
+
+    return _convert_item(item)
+
+
+def schedule(to_convert, src_sizes, group_by_track=True):
+    """
+    Create the units of work for the conversion.
+    With ``group_by_track``, multiple segments of the same source
+    are converted together (the source is decoded once).
+    The units are ordered by the size of their source (largest first),
+    so a huge track is started early and doesn't stall the pool at the end.
+
+    Args:
+        to_convert (list): Tuples (source, start, end, target, sampling-rate, record).
+        src_sizes (dict): Size of every source file in bytes.
+        group_by_track (bool): Group the segments of a track.
+
+    Returns:
+        list: Units ``('file', item)`` or ``('track', (source, segments, sampling-rate))``.
+    """
+    by_src = {}
+
+    for item in to_convert:
+        by_src.setdefault(item[0], []).append(item)
+
+    units = []
+
+    for src, items in by_src.items():
+        if group_by_track and len(items) > 1:
+            segments = [(x[1], x[2], x[3], x[5]) for x in items]
+            units.append((src_sizes[src], 'track', (src, segments, items[0][4])))
+        else:
+            units.extend((src_sizes[src], 'file', x) for x in items)
+
+    units.sort(key=lambda x: -x[0])
+
+    return [(kind, item) for _, kind, item in units]
+
+
+class ConversionManifest(object):
+    """
+    Record of converted files, stored as JSON-lines.
+    Every line describes the source (path, size, mtime, segment) and the target
+    sampling-rate of a converted target file.
+    New records are appended and flushed immediately,
+    so the manifest is valid whenever the process is killed.
+
+    Args:
+        path (str): Path of the manifest file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+
+                    if line == '':
+                        continue
+
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Last line of an interrupted run
+                        continue
+
+                    self.records[record['target']] = record
+
+        self.file = None
+
+    @staticmethod
+    def create_record(src, start, end, target, target_sr, src_stat):
+        return {
+            'target': os.path.basename(target),
+            'src': os.path.abspath(src),
+            'src_size': src_stat.st_size,
+            'src_mtime': src_stat.st_mtime_ns,
+            'start': start,
+            'end': end if end != float('inf') else -1,
+            'sampling_rate': target_sr,
+        }
+
+    def is_done(self, record, target):
+        """
+        Return ``True`` if the target was converted from the same source
+        and still exists.
+        """
+        return self.records.get(record['target']) == record and os.path.isfile(target)
+
+    def add(self, record):
+        if self.file is None:
+            self.file = open(self.path, 'a')
+
+        self.file.write('{}\n'.format(json.dumps(record, sort_keys=True)))
+        self.file.flush()
+        self.records[record['target']] = record
+
+    def compact(self, targets):
+        """
+        Rewrite the manifest with only the records of the given targets.
+        """
+        self.close()
+        tmp_path = '{}.tmp'.format(self.path)
+
+        with open(tmp_path, 'w') as f:
+            for target in sorted(targets):
+                if target in self.records:
+                    f.write('{}\n'.format(json.dumps(self.records[target], sort_keys=True)))
+
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ResumableWavAudioFileConverter(conversion.WavAudioFileConverter):
+    """
+    ``WavAudioFileConverter`` that keeps a manifest of the converted files.
+    Files that were already converted from an unchanged source
+    (same path, size, mtime and segment) with the same sampling-rate are skipped,
+    so an interrupted conversion can be resumed
+    and after an update only new or changed utterances are converted.
+    Converted files, that are not part of the corpus anymore, are deleted.
+
+    Segments of the same track are converted together,
+    so the track is decoded and resampled only once (see :func:`schedule`).
+
+    Args:
+        manifest_path (str): Path of the manifest.
+        num_workers (int): Number of processes (default: number of cores).
+        group_by_track (bool): If ``False``, every segment is decoded separately.
+
+    Other arguments are passed to ``WavAudioFileConverter``.
+    """
+
+    def __init__(self, manifest_path, num_workers=None, group_by_track=True, **kwargs):
+        if num_workers is None:
+            num_workers = os.cpu_count()
+
+        super(ResumableWavAudioFileConverter, self).__init__(num_workers=num_workers, **kwargs)
+        self.manifest_path = manifest_path
+        self.group_by_track = group_by_track
+
+    def _convert_files(self, files):
+        self.convert_files(files)
+
+    def convert_files(self, files):
+        """
+        Convert the given files, skipping the ones that are already converted.
+
+        Args:
+            files (list): Tuples (source path, start, end, target path).
+                          All targets have to be in the same folder.
+        """
+        manifest = ConversionManifest(self.manifest_path)
+        src_stats = {}
+        to_convert = []
+        targets = set()
+
+        for src, start, end, target in files:
+            if src not in src_stats:
+                src_stats[src] = os.stat(src)
+
+            record = manifest.create_record(
+                src, start, end, target, self.sampling_rate, src_stats[src]
+            )
+            targets.add(record['target'])
+
+            if not manifest.is_done(record, target):
+                to_convert.append((src, start, end, target, self.sampling_rate, record))
+
+        print('{} of {} files already converted'.format(
+            len(files) - len(to_convert), len(files)
+        ))
+
+        if len(files) > 0:
+            target_folder = os.path.dirname(files[0][3])
+            stale = set(manifest.records.keys()) - targets
+
+            # Partial files of an interrupted run
+            stale.update(x for x in os.listdir(target_folder) if x.endswith('.tmp.wav'))
+
+            for target in stale:
+                stale_path = os.path.join(target_folder, target)
+
+                if os.path.isfile(stale_path):
+                    os.remove(stale_path)
+
+        units = schedule(
+            to_convert,
+            {src: stat.st_size for src, stat in src_stats.items()},
+            group_by_track=self.group_by_track
+        )
+
+        try:
+            with multiprocessing.Pool(self.num_workers) as p, tqdm(total=len(to_convert)) as progress:
+                for records in p.imap_unordered(_convert_unit, units):
+                    for record in records:
+                        manifest.add(record)
+
+                    progress.update(len(records))
+        finally:
+            manifest.close()
+
+        manifest.compact(targets)